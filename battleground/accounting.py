@@ -0,0 +1,126 @@
+"""
+Measure the resources agents use and enforce budgets.
+
+Every move of an agent is timed (wall time and CPU time of the calling
+thread). With track_memory, the peak of memory allocated by python during
+the move is measured with tracemalloc, which slows down the whole process.
+
+CPU time and memory are measured in the runner's process: for agents in
+worker processes or on remote servers, only the wall time is meaningful.
+"""
+import time
+import tracemalloc
+
+# what happens when an agent exceeds its budget
+ACTION_DEFAULT = "default"  # play the engine's default move instead
+ACTION_FORFEIT = "forfeit"  # the agent loses the game, its remaining moves are default moves
+BUDGET_ACTIONS = (ACTION_DEFAULT, ACTION_FORFEIT)
+
+
+class AgentBudget(object):
+    def __init__(self, max_move_time=None, max_move_cpu_time=None, max_move_memory=None,
+                 max_game_time=None, max_game_cpu_time=None, action=ACTION_DEFAULT):
+        """
+        all limits are optional.
+        :param max_move_time: (float) seconds of wall time per move
+        :param max_move_cpu_time: (float) seconds of CPU time per move
+        :param max_move_memory: (int) bytes allocated at the peak of a move
+        :param max_game_time: (float) seconds of wall time of all moves of a game
+        :param max_game_cpu_time: (float) seconds of CPU time of all moves of a game
+        :param action: one of BUDGET_ACTIONS, applied to a move that exceeds a limit.
+                       an agent that exceeds a game limit is not asked for moves anymore.
+        """
+        if action not in BUDGET_ACTIONS:
+            raise ValueError("unknown budget action: {}".format(action))
+        self.max_move_time = max_move_time
+        self.max_move_cpu_time = max_move_cpu_time
+        self.max_move_memory = max_move_memory
+        self.max_game_time = max_game_time
+        self.max_game_cpu_time = max_game_cpu_time
+        self.action = action
+
+    @property
+    def track_memory(self):
+        return self.max_move_memory is not None
+
+    def exceeds_move(self, wall_time, cpu_time, memory):
+        """
+        :return: (bool) True if a move exceeded a per move limit
+        """
+        return ((self.max_move_time is not None and wall_time > self.max_move_time) or
+                (self.max_move_cpu_time is not None and cpu_time > self.max_move_cpu_time) or
+                (self.max_move_memory is not None and memory is not None and
+                 memory > self.max_move_memory))
+
+    def exceeds_game(self, usage):
+        """
+        :param usage: AgentUsage of the current game
+        :return: (bool) True if the agent exceeded a per game limit
+        """
+        return ((self.max_game_time is not None and usage.wall_time > self.max_game_time) or
+                (self.max_game_cpu_time is not None and usage.cpu_time > self.max_game_cpu_time))
+
+
+class AgentUsage(object):
+    """
+    the resources one agent used in one game.
+    """
+
+    def __init__(self):
+        self.num_moves = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.max_move_time = 0.0
+        self.max_move_cpu_time = 0.0
+        # None if memory is not tracked
+        self.max_move_memory = None
+        self.num_over_budget = 0
+        self.out_of_budget = False
+        self.forfeited = False
+
+    def add_move(self, wall_time, cpu_time, memory=None):
+        self.num_moves += 1
+        self.wall_time += wall_time
+        self.cpu_time += cpu_time
+        self.max_move_time = max(self.max_move_time, wall_time)
+        self.max_move_cpu_time = max(self.max_move_cpu_time, cpu_time)
+        if memory is not None:
+            self.max_move_memory = max(self.max_move_memory or 0, memory)
+
+    def to_dict(self):
+        return {"num_moves": self.num_moves,
+                "wall_time": self.wall_time,
+                "cpu_time": self.cpu_time,
+                "max_move_time": self.max_move_time,
+                "max_move_cpu_time": self.max_move_cpu_time,
+                "max_move_memory": self.max_move_memory,
+                "num_over_budget": self.num_over_budget,
+                "forfeited": self.forfeited}
+
+
+def measure(function, *args, track_memory=False):
+    """
+    call function(*args) and measure it.
+    :param track_memory: (bool) measure the peak of allocated memory, starts tracemalloc
+    :return: (result, wall time, CPU time, peak memory in bytes or None)
+    """
+    if track_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        else:
+            # before python 3.9, the peak is only reset together with the traces
+            tracemalloc.clear_traces()
+        start_memory = tracemalloc.get_traced_memory()[0]
+
+    start_time = time.perf_counter()
+    start_cpu_time = time.thread_time()
+    result = function(*args)
+    cpu_time = time.thread_time() - start_cpu_time
+    wall_time = time.perf_counter() - start_time
+
+    memory = None
+    if track_memory:
+        memory = max(tracemalloc.get_traced_memory()[1] - start_memory, 0)
+    return result, wall_time, cpu_time, memory
@@ -23,3 +23,13 @@ class Agent(object):
         the value set here is read from the database on init
         """
         self._data = data
+
+    def merge_memories(self, memories):
+        """
+        combine the memories of several copies of this agent
+        (e.g. copies that played games in parallel) into one memory.
+        by default the memory of the last copy is kept and what the other
+        copies learned is lost, agents that learn should override this.
+        :param memories: list of memories, as returned by get_memory
+        """
+        return memories[-1]
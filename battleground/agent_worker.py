@@ -0,0 +1,265 @@
+"""
+Run agents in a pool of worker processes.
+
+An agent created with DynamicAgent(queue_prefix=...) lives in one of the
+workers of the pool named queue_prefix, the runner talks to it through a
+pipe. Slow agents then do not hold the runner's GIL and a crashing agent
+does not take the session down with it.
+
+Messages are tuples (opcode, agent key, payload), replies are
+(status, value). observe is not answered, so notifications do not wait
+for the worker; an error in observe is reported with the next reply.
+"""
+import atexit
+import itertools
+import multiprocessing
+import os
+import threading
+import traceback
+
+OP_CREATE = 0
+OP_MOVE = 1
+OP_OBSERVE = 2
+OP_GET_MEMORY = 3
+OP_SET_MEMORY = 4
+OP_MERGE_MEMORIES = 5
+OP_REMOVE = 6
+OP_CLOSE = 7
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+DEFAULT_NUM_WORKERS = os.cpu_count() or 1
+
+# queue_prefix: AgentWorkerPool, of the current process
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+class AgentWorkerError(Exception):
+    pass
+
+
+def _worker_main(connection):
+    """
+    main loop of a worker process.
+    """
+    # imported here, a worker builds its agents like the runner would
+    from .dynamic_agent import DynamicAgent
+
+    agents = {}
+    # agent key: error message of a failed observe
+    errors = {}
+    while True:
+        try:
+            opcode, agent_key, payload = connection.recv()
+        except EOFError:
+            break
+        if opcode == OP_CLOSE:
+            break
+
+        try:
+            if opcode == OP_CREATE:
+                agents[agent_key] = DynamicAgent(**payload)
+                value = None
+            elif opcode == OP_REMOVE:
+                agents.pop(agent_key, None)
+                errors.pop(agent_key, None)
+                value = None
+            elif agent_key in errors:
+                raise AgentWorkerError(errors.pop(agent_key))
+            elif opcode == OP_MOVE:
+                value = agents[agent_key].move(payload)
+            elif opcode == OP_OBSERVE:
+                agents[agent_key].observe(payload)
+                continue
+            elif opcode == OP_GET_MEMORY:
+                value = agents[agent_key].get_memory()
+            elif opcode == OP_SET_MEMORY:
+                value = agents[agent_key].set_memory(payload)
+            elif opcode == OP_MERGE_MEMORIES:
+                value = agents[agent_key].merge_memories(payload)
+            else:
+                raise AgentWorkerError("unknown opcode: {}".format(opcode))
+        except Exception:
+            message = traceback.format_exc()
+            if opcode == OP_OBSERVE:
+                errors[agent_key] = message
+                continue
+            connection.send((STATUS_ERROR, message))
+        else:
+            connection.send((STATUS_OK, value))
+    connection.close()
+
+
+class AgentWorker(object):
+    """
+    one worker process and the runner's end of its pipe.
+    """
+
+    def __init__(self, context):
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main,
+                                       args=(worker_connection,),
+                                       daemon=True)
+        self.process.start()
+        worker_connection.close()
+        # several threads of the runner may use the same worker
+        self.lock = threading.Lock()
+        # changed under the lock of the pool
+        self.num_agents = 0
+
+    def request(self, opcode, agent_key, payload=None):
+        """
+        send a message and wait for the reply.
+        :return: the value of the reply
+        """
+        with self.lock:
+            try:
+                self.connection.send((opcode, agent_key, payload))
+                status, value = self.connection.recv()
+            except (EOFError, OSError):
+                raise AgentWorkerError("agent worker {} stopped".format(self.process.pid))
+        if status == STATUS_ERROR:
+            raise AgentWorkerError(value)
+        return value
+
+    def notify(self, opcode, agent_key, payload=None):
+        """
+        send a message without waiting for a reply.
+        """
+        with self.lock:
+            try:
+                self.connection.send((opcode, agent_key, payload))
+            except OSError:
+                raise AgentWorkerError("agent worker {} stopped".format(self.process.pid))
+
+    def close(self):
+        with self.lock:
+            try:
+                self.connection.send((OP_CLOSE, None, None))
+            except OSError:
+                pass
+            self.connection.close()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class AgentProxy(object):
+    """
+    the runner's side of an agent that lives in a worker process.
+    """
+
+    def __init__(self, pool, worker, agent_key):
+        self.pool = pool
+        self.worker = worker
+        self.agent_key = agent_key
+        self.removed = False
+
+    def move(self, state):
+        return self.worker.request(OP_MOVE, self.agent_key, state)
+
+    def observe(self, state):
+        self.worker.notify(OP_OBSERVE, self.agent_key, state)
+
+    def get_memory(self):
+        return self.worker.request(OP_GET_MEMORY, self.agent_key)
+
+    def set_memory(self, data):
+        return self.worker.request(OP_SET_MEMORY, self.agent_key, data)
+
+    def merge_memories(self, memories):
+        return self.worker.request(OP_MERGE_MEMORIES, self.agent_key, memories)
+
+    def remove(self):
+        """
+        remove the agent from its worker, can be called more than once.
+        """
+        if self.removed:
+            return
+        self.removed = True
+        with self.pool.lock:
+            self.worker.num_agents -= 1
+        try:
+            self.worker.request(OP_REMOVE, self.agent_key)
+        except AgentWorkerError:
+            # the agents of a stopped worker are gone already
+            pass
+
+
+class AgentWorkerPool(object):
+    def __init__(self, num_workers=DEFAULT_NUM_WORKERS, context=None):
+        """
+        :param num_workers: (int) number of worker processes, started when needed
+        :param context: multiprocessing context, defaults to the default context
+        """
+        self.num_workers = num_workers
+        self.context = context or multiprocessing.get_context()
+        self.workers = []
+        self.agent_keys = itertools.count()
+        self.lock = threading.Lock()
+
+    def create_agent(self, config):
+        """
+        :param config: keyword arguments of DynamicAgent (without queue_prefix)
+        :return: AgentProxy of the agent, in the worker with the fewest agents
+        """
+        with self.lock:
+            # crashed workers are replaced, their agents are lost
+            for worker in [w for w in self.workers if not w.process.is_alive()]:
+                self.workers.remove(worker)
+                worker.close()
+            if len(self.workers) < self.num_workers:
+                self.workers.append(AgentWorker(self.context))
+            worker = min(self.workers, key=lambda w: w.num_agents)
+            worker.num_agents += 1
+            agent_key = next(self.agent_keys)
+        try:
+            worker.request(OP_CREATE, agent_key, config)
+        except AgentWorkerError:
+            with self.lock:
+                worker.num_agents -= 1
+            raise
+        return AgentProxy(self, worker, agent_key)
+
+    def close(self):
+        with self.lock:
+            for worker in self.workers:
+                worker.close()
+            self.workers = []
+
+
+def get_pool(queue_prefix, num_workers=None):
+    """
+    :param queue_prefix: name of the pool
+    :param num_workers: (int) number of workers of a new pool, defaults to
+                        the environment variable AGENT_WORKERS or the number of cores
+    :return: the AgentWorkerPool of this process with that name
+    """
+    global _pools, _pools_pid
+    if multiprocessing.current_process().daemon:
+        raise AgentWorkerError("agent worker pool {} can not be started in a daemonic process, "
+                               "e.g. a multiprocessing.Pool worker".format(queue_prefix))
+    with _pools_lock:
+        # pools (and their pipes) of a parent process are not used after a fork
+        if _pools_pid != os.getpid():
+            _pools = {}
+            _pools_pid = os.getpid()
+        if queue_prefix not in _pools:
+            if num_workers is None:
+                num_workers = int(os.environ.get("AGENT_WORKERS", DEFAULT_NUM_WORKERS))
+            _pools[queue_prefix] = AgentWorkerPool(num_workers)
+        return _pools[queue_prefix]
+
+
+def close_pools():
+    with _pools_lock:
+        if _pools_pid == os.getpid():
+            for pool in _pools.values():
+                pool.close()
+            _pools.clear()
+
+
+atexit.register(close_pools)
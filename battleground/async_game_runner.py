@@ -0,0 +1,156 @@
+"""
+An asyncio based game runner.
+Many games can run concurrently in one process, agents may implement
+move (and observe) as coroutines, and every move has a deadline.
+"""
+import asyncio
+import copy
+import functools
+import inspect
+import time
+
+from . import accounting as agent_accounting
+from .game_runner import AGENT_ERRORS, GameRunner
+
+
+class AsyncGameRunner(GameRunner):
+    def __init__(self, game_engine, agent_objects, move_timeout=None, max_turns=None,
+                 move_delay=None, default_move=None, **kwargs):
+        """
+        :param move_timeout: (float) seconds a player has to make a move.
+                             If the deadline passes, the default move is played instead.
+        :param max_turns: (int) end the game after this many moves.
+        :param move_delay: (float) seconds to wait after each move.
+        :param default_move: move played on behalf of a player that missed the deadline
+                             (or whose agent failed or exceeded its budget),
+                             if None, the engine's get_default_move() is used.
+        :param kwargs: passed to GameRunner, including accounting and budget
+        """
+        super().__init__(game_engine, agent_objects, **kwargs)
+        self.move_timeout = move_timeout
+        self.max_turns = max_turns
+        self.move_delay = move_delay
+        self.default_move = default_move
+        self.num_timeouts = [0] * len(self.players)
+
+    async def run_game(self):
+        num_moves = 0
+        self.record_initial_state(ended=self.max_turns == 0)
+
+        player_index = self.game_engine.get_current_player()
+
+        while not self.game_engine.game_over():
+            if self.max_turns is not None and num_moves >= self.max_turns:
+                break
+
+            engine_state = self.agent_view(self.game_engine.get_state(player_index))
+
+            move = await self.get_move(player_index, engine_state)
+            self.game_engine.move(move)
+            num_moves += 1
+
+            # a game cut off at max_turns ends with this move
+            ended = self.max_turns is not None and num_moves >= self.max_turns
+            data_to_save = self.record_move(move, num_moves, ended=ended)
+            await self.broadcast(data_to_save)
+
+            if self.move_delay:
+                await asyncio.sleep(self.move_delay)
+
+            player_index = self.game_engine.get_current_player()
+
+        # the final scores
+        scores = self.game_engine.get_state()["scores"]
+        if self.save:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.save_game, scores)
+
+        return scores
+
+    async def get_move(self, player_index, state):
+        """
+        ask a player for a move, waiting at most move_timeout seconds.
+        Moves are measured and the budget is enforced like in GameRunner.request_move,
+        the wall time of a move includes the time other games run while the agent awaits.
+        """
+        if self.usage is not None and self.usage[player_index].out_of_budget:
+            return self.get_default_move()
+
+        player = self.players[player_index]
+        if self.move_timeout is not None and not self.isolate_agents:
+            # a thread that misses the deadline keeps running,
+            # it must not see the engine's state changing under it
+            state = copy.deepcopy(state)
+        start_time = time.perf_counter()
+        cpu_time, memory = 0.0, None
+        failed = False
+        try:
+            move, cpu_time, memory = await asyncio.wait_for(self._call(player.move, state),
+                                                            self.move_timeout)
+        except asyncio.TimeoutError:
+            self.num_timeouts[player_index] += 1
+            failed = True
+        except AGENT_ERRORS as e:
+            print("agent {} failed, playing the default move: {}".format(
+                self.agent_ids[player_index], e))
+            failed = True
+
+        if self.usage is not None:
+            wall_time = time.perf_counter() - start_time
+            if not self.charge_move(player_index, wall_time, cpu_time, memory):
+                failed = True
+        if failed:
+            return self.get_default_move()
+        return move
+
+    def get_default_move(self):
+        if self.default_move is not None:
+            return dict(self.default_move)
+        return self.game_engine.get_default_move()
+
+    async def _call(self, function, *args):
+        """
+        call a function that is either a coroutine function or a regular function.
+        With a deadline, regular functions run in the default executor so that
+        they do not block the event loop; note that a thread that missed the
+        deadline can not be stopped and keeps running until the function returns.
+        :return: (result, CPU time, peak memory in bytes or None), see accounting.measure.
+                 The CPU time of a coroutine is not measured and counts as 0.
+        """
+        track_memory = self.budget is not None and self.budget.track_memory
+        cpu_time, memory = 0.0, None
+        if inspect.iscoroutinefunction(function):
+            result = function(*args)
+        elif self.move_timeout is None:
+            result, _, cpu_time, memory = agent_accounting.measure(function, *args,
+                                                                   track_memory=track_memory)
+        else:
+            # measured in the executor's thread
+            loop = asyncio.get_running_loop()
+            result, _, cpu_time, memory = await loop.run_in_executor(
+                None, functools.partial(agent_accounting.measure, function, *args,
+                                        track_memory=track_memory))
+
+        # e.g. a DynamicAgent wrapping an agent with a coroutine move method
+        if inspect.isawaitable(result):
+            result = await result
+        return result, cpu_time, memory
+
+    async def broadcast(self, data):
+        state = self.agent_view(data["game_state"])
+        for agent_id, player in zip(self.agent_ids, self.players):
+            try:
+                result = player.observe(state)
+                if inspect.isawaitable(result):
+                    await result
+            except AGENT_ERRORS as e:
+                print("agent {} failed to observe: {}".format(agent_id, e))
+
+
+async def run_games(runners):
+    """
+    run all games concurrently.
+    :param runners: list of AsyncGameRunner
+    :return: list of scores, in the same order as runners
+    """
+    return await asyncio.gather(*[runner.run_game() for runner in runners])
@@ -1,11 +1,10 @@
 from . import agent
+from . import agent_worker
+from . import module_cache
+from . import remote_agent
 import importlib
 import inspect
-from .persistence import agent_data
-import random
-import os
-
-TEMP_MODULE_PATH = "tmp/"
+from .persistence import storage
 
 
 class DynamicAgent(agent.Agent):
@@ -17,6 +16,8 @@ class DynamicAgent(agent.Agent):
                  from_db=False,
                  local_path=None,
                  queue_prefix=None,
+                 remote_path=None,
+                 remote_timeout=None,
                  settings=None,
                  **kwargs):
         self.owner = owner
@@ -24,32 +25,43 @@ class DynamicAgent(agent.Agent):
         self.game_type = game_type
         self.class_name = class_name
         self.local_path = local_path
+        self.remote_path = remote_path
         self.settings = settings
         if "agent_id" in kwargs:
             self.agent_id = kwargs["agent_id"]
         else:
-            self.agent_id = agent_data.get_agent_id(owner=self.owner,
-                                                    name=self.name,
-                                                    game_type=self.game_type)
-
-        if not os.path.exists(TEMP_MODULE_PATH):
-            os.mkdir(TEMP_MODULE_PATH)
-
-        if from_db:
+            self.agent_id = storage.get_backend().get_agent_id(owner=self.owner,
+                                                               name=self.name,
+                                                               game_type=self.game_type)
+
+        if queue_prefix is not None:
+            # the worker loads the code from the database or the file
+            self.agent_instance = agent_worker.get_pool(queue_prefix).create_agent({
+                "owner": owner,
+                "name": name,
+                "game_type": game_type,
+                "class_name": class_name,
+                "from_db": from_db,
+                "local_path": local_path,
+                "remote_path": remote_path,
+                "remote_timeout": remote_timeout,
+                "settings": settings,
+                "agent_id": self.agent_id})
+        elif from_db:
             self.agent_instance = self._load_from_database()
         elif local_path is not None:
             self.agent_instance = self._load_from_file()
-        elif queue_prefix is not None:
-            raise NotImplementedError()
+        elif remote_agent.is_remote_path(remote_path):
+            self.agent_instance = remote_agent.RemoteAgent(remote_path, timeout=remote_timeout)
 
         super().__init__()
 
     def _load_from_database(self):
         """
-        Load agent code from the database, then save as a file.
+        Load agent code from the database and import it from memory.
         """
 
-        code_string = agent_data.load_agent_data(self.agent_id, "code")
+        code_string = storage.get_backend().load_agent_data(self.agent_id, "code")
 
         if code_string is None:
             error_message = "No code found in database for owner: {}, name: {}, type: {}"
@@ -58,25 +70,17 @@ class DynamicAgent(agent.Agent):
                                                  self.game_type)
             raise Exception(error_message)
 
-        # generate random temporary file name
-        file_name = "m_{}.py".format(random.randint(1e8, 2e8))
-        module_path = os.path.join(TEMP_MODULE_PATH, file_name)
-
-        # write to temp file
-        with open(module_path, 'w') as file:
-            file.write(code_string)
-
-        importlib.invalidate_caches()
-        # change path to module specifier
-        self.local_path = module_path[:-3].replace("/", ".")
-
-        # load the module
-        return self._load_from_file()
+        # identical code is compiled only once
+        agent_module = module_cache.load_module(code_string)
+        return self._create_instance(agent_module)
 
     def _load_from_file(self):
         """loads agent code from a file specified at runtime"""
 
         agent_module = importlib.import_module(self.local_path)
+        return self._create_instance(agent_module)
+
+    def _create_instance(self, agent_module):
         for name, obj in inspect.getmembers(agent_module):
             if name == self.class_name and inspect.isclass(obj):
                 agent_class = obj
@@ -97,3 +101,13 @@ class DynamicAgent(agent.Agent):
 
     def set_memory(self, data):
         return self.agent_instance.set_memory(data)
+
+    def merge_memories(self, memories):
+        return self.agent_instance.merge_memories(memories)
+
+    def close(self):
+        """
+        release the agent, an agent in a worker process is removed from its worker.
+        """
+        if isinstance(self.agent_instance, agent_worker.AgentProxy):
+            self.agent_instance.remove()
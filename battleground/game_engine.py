@@ -3,6 +3,7 @@ This is an interface for the game engine class.
 An the engine for a specific game
 should implement these functions.
 """
+import copy
 
 
 class GameEngine(object):
@@ -23,6 +24,28 @@ class GameEngine(object):
     def get_save_state(self):
         raise NotImplementedError()
 
+    def snapshot(self):
+        """
+        return a copy of the mutable game data (the current position),
+        which can be passed to restore()
+        """
+        raise NotImplementedError()
+
+    def restore(self, snapshot):
+        """
+        set the game to the position stored in snapshot.
+        The snapshot is not modified and can be restored again.
+        """
+        raise NotImplementedError()
+
+    def clone(self):
+        """
+        return an independent copy of this engine at the current position
+        """
+        engine = copy.copy(self)
+        engine.restore(self.snapshot())
+        return engine
+
     def get_current_player(self):
         """
         This will be used by the game runner to determine which player should
@@ -43,6 +66,13 @@ class GameEngine(object):
         """
         raise NotImplementedError()
 
+    def get_default_move(self):
+        """
+        A valid move that is played on behalf of the current player
+        if the player fails to move (e.g. does not move in time)
+        """
+        raise NotImplementedError()
+
     def game_over(self):
         """
         Check if the game is over
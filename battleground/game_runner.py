@@ -1,39 +1,84 @@
-from .persistence import game_data, agent_data
+from . import accounting as agent_accounting
+from .agent_worker import AgentWorkerError
+from .persistence import game_data, storage
+from .remote_agent import RemoteAgentError
+from .state_recorder import DeltaRecorder
 import copy
 
+# recording levels
+RECORD_NONE = "none"        # record no states at all
+RECORD_FINAL = "final"      # record only the final state
+RECORD_SAMPLED = "sampled"  # record the initial state, every n-th move and the final state
+RECORD_FULL = "full"        # record every state
+
+RECORDING_LEVELS = (RECORD_NONE, RECORD_FINAL, RECORD_SAMPLED, RECORD_FULL)
+
+# failures of agents in another process, the default move is played instead
+AGENT_ERRORS = (RemoteAgentError, AgentWorkerError)
+
 
 class GameRunner(object):
-    def __init__(self, game_engine, agent_objects, save=True):
+    def __init__(self, game_engine, agent_objects, save=True,
+                 delta=False, keyframe_interval=50,
+                 recording=RECORD_FULL, sample_interval=1,
+                 storage=game_data.STORAGE_DOCUMENTS, writer=None,
+                 accounting=False, budget=None, isolate_agents=False):
+        """
+        :param delta: (bool) if True, record game states as differences between
+                      consecutive states instead of copying every state.
+        :param keyframe_interval: (int) with delta recording, store a full state
+                                  every keyframe_interval moves.
+        :param recording: (str) one of RECORDING_LEVELS, which states to record.
+        :param sample_interval: (int) with RECORD_SAMPLED, record every
+                                sample_interval-th move.
+        :param storage: (str) one of game_data.STORAGE_FORMATS, how saved states are stored.
+        :param writer: (BackgroundWriter) if given, the game is saved in the background.
+        :param accounting: (bool) measure the resources of every move and save them
+                           with the game results, see accounting.py
+        :param budget: (AgentBudget) limits of every agent, implies accounting
+        :param isolate_agents: (bool) give agents deep copies of the states they move on
+                               and observe. Off by default: states are shared and
+                               agents must not modify them.
+        """
+        if recording not in RECORDING_LEVELS:
+            raise ValueError("unknown recording level: {}".format(recording))
+        if not isinstance(sample_interval, int) or sample_interval < 1:
+            raise ValueError("sample_interval must be a positive integer: {}".format(
+                sample_interval))
+
         self.game_engine = game_engine
         self.agent_ids, self.players = zip(*agent_objects)
-        self.game_states = []
+        self.delta = delta
+        if delta:
+            self.game_states = DeltaRecorder(keyframe_interval=keyframe_interval)
+        else:
+            self.game_states = []
         self.save = save
+        self.recording = recording
+        self.sample_interval = sample_interval
+        self.storage = storage
+        self.writer = writer
+        self.budget = budget
+        self.isolate_agents = isolate_agents
+        self.usage = None
+        if accounting or budget is not None:
+            self.usage = [agent_accounting.AgentUsage() for _ in self.players]
 
     def run_game(self):
         # self.game_engine.reset()
-        state = self.game_engine.get_state()
-        self.game_states.append({"game_state": state,
-                                 "last_move": None,
-                                 "player_ids": self.agent_ids
-                                 })
+        num_moves = 0
+        self.record_initial_state()
 
         player_index = self.game_engine.get_current_player()
 
         while not self.game_engine.game_over():
-            engine_state = self.game_engine.get_state(player_index)
+            engine_state = self.agent_view(self.game_engine.get_state(player_index))
 
-            move = self.players[player_index].move(engine_state)
+            move = self.request_move(player_index, engine_state)
             self.game_engine.move(move)
+            num_moves += 1
 
-            state = self.game_engine.get_state()
-
-            data_to_save = {}
-            data_to_save["game_state"] = copy.deepcopy(state)
-            data_to_save["last_move"] = copy.deepcopy(move)
-            data_to_save["player_ids"] = copy.deepcopy(self.agent_ids)
-            data_to_save["game_over"] = str(self.game_engine.game_over())
-
-            self.game_states.append(data_to_save)
+            data_to_save = self.record_move(move, num_moves)
             self.broadcast(data_to_save)
 
             player_index = self.game_engine.get_current_player()
@@ -41,19 +86,179 @@ class GameRunner(object):
         # the final scores
         scores = self.game_engine.get_state()["scores"]
         if self.save:
-            # save game states and player stats to the DB.
-            game_id = game_data.save_game_history(self.game_engine.get_game_name(),
-                                                  self.game_states)
-            for index, agent_id in enumerate(self.agent_ids):
-                score = scores[index]
-                agent_data.save_game_result(agent_id, game_id,
-                                            self.game_engine.type,
-                                            score,
-                                            max(scores) == score)
+            self.save_game(scores)
 
         return scores
 
+    def request_move(self, player_index, state):
+        """
+        ask a player for a move, measuring it and enforcing the budget if there is one.
+        """
+        if self.usage is None:
+            return self.ask_move(player_index, state)
+        if self.usage[player_index].out_of_budget:
+            return self.get_default_move()
+
+        track_memory = self.budget is not None and self.budget.track_memory
+        move, wall_time, cpu_time, memory = agent_accounting.measure(self.ask_move,
+                                                                     player_index, state,
+                                                                     track_memory=track_memory)
+        if self.charge_move(player_index, wall_time, cpu_time, memory):
+            return move
+        return self.get_default_move()
+
+    def charge_move(self, player_index, wall_time, cpu_time, memory):
+        """
+        add a measured move to the player's usage and apply the budget.
+        :return: (bool) False if the move exceeded the budget and must not be played
+        """
+        usage = self.usage[player_index]
+        usage.add_move(wall_time, cpu_time, memory)
+        if self.budget is None:
+            return True
+
+        if self.budget.exceeds_game(usage):
+            usage.out_of_budget = True
+        if not usage.out_of_budget and not self.budget.exceeds_move(wall_time, cpu_time, memory):
+            return True
+
+        usage.num_over_budget += 1
+        print("agent {} exceeded its budget".format(self.agent_ids[player_index]))
+        if self.budget.action == agent_accounting.ACTION_FORFEIT:
+            usage.out_of_budget = True
+            usage.forfeited = True
+        return False
+
+    def ask_move(self, player_index, state):
+        """
+        :return: the player's move, or the default move if its agent server or worker failed
+        """
+        try:
+            return self.players[player_index].move(state)
+        except AGENT_ERRORS as e:
+            print("agent {} failed, playing the default move: {}".format(
+                self.agent_ids[player_index], e))
+            return self.get_default_move()
+
+    def get_default_move(self):
+        """
+        :return: the move played for an agent that failed or exceeded its budget
+        """
+        return self.game_engine.get_default_move()
+
+    def record_initial_state(self, ended=False):
+        """
+        :param ended: (bool) the game ends before the first move, e.g. at a turn limit
+        """
+        state = self.game_engine.get_state()
+        if self.is_recorded(0, ended or self.game_engine.game_over()):
+            self.record({"game_state": state,
+                         "last_move": None,
+                         "player_ids": self.agent_ids
+                         })
+
+    def record_move(self, move, num_moves, ended=False):
+        """
+        record the state after a move (depending on the recording level).
+        :param move: the move that was played last
+        :param num_moves: (int) number of moves played so far
+        :param ended: (bool) the game ends after this move, e.g. at a turn limit
+        :return: data describing the state after the move
+        """
+        state = self.game_engine.get_state()
+        game_over = ended or self.game_engine.game_over()
+
+        data_to_save = {}
+        data_to_save["game_state"] = state
+        data_to_save["last_move"] = move
+        data_to_save["player_ids"] = self.agent_ids
+        data_to_save["game_over"] = str(game_over)
+
+        if self.is_recorded(num_moves, game_over):
+            data_to_save = self.record(data_to_save)
+        return data_to_save
+
+    def save_game(self, scores):
+        """
+        save game states and player stats to the DB.
+        :return: the game id, None if the game is saved by a background writer
+        """
+        results = []
+        usage = []
+        # agents that forfeited lose, the best of the others win
+        forfeited = [self.usage is not None and self.usage[index].forfeited
+                     for index in range(len(self.agent_ids))]
+        remaining_scores = [scores[index] for index in range(len(self.agent_ids))
+                            if not forfeited[index]]
+        best_score = max(remaining_scores) if remaining_scores else None
+        for index, agent_id in enumerate(self.agent_ids):
+            score = scores[index]
+            win = not forfeited[index] and score == best_score
+            if self.usage is not None:
+                usage.append((agent_id, self.game_engine.type, self.usage[index].to_dict()))
+            results.append((agent_id,
+                            self.game_engine.type,
+                            score,
+                            win))
+
+        if self.writer is not None:
+            self.writer.save_game(self.game_engine.get_game_name(),
+                                  self.game_states,
+                                  results,
+                                  self.storage,
+                                  usage)
+            return None
+
+        backend = storage.get_backend()
+        game_id = backend.save_game_history(self.game_engine.get_game_name(),
+                                            self.game_states,
+                                            storage=self.storage)
+        backend.save_game_results([(agent_id, game_id, game_type, score, win)
+                                   for agent_id, game_type, score, win in results])
+        if usage:
+            backend.save_agent_usage([(agent_id, game_id, game_type, agent_usage)
+                                      for agent_id, game_type, agent_usage in usage])
+        return game_id
+
+    def is_recorded(self, num_moves, game_over=False):
+        """
+        :param num_moves: (int) number of moves played so far
+        :param game_over: (bool)
+        :return: (bool) True if the state after num_moves moves should be recorded
+        """
+        if self.recording == RECORD_FULL:
+            return True
+        if self.recording == RECORD_SAMPLED:
+            return game_over or num_moves % self.sample_interval == 0
+        if self.recording == RECORD_FINAL:
+            return game_over
+        return False
+
+    def record(self, data):
+        """
+        add data to the recorded game states.
+        :return: the recorded data
+        """
+        if self.delta:
+            # the delta recorder copies only what changed, observers share its copy
+            self.game_states.append(data)
+            return dict(data, game_state=self.game_states.last_state)
+        data = copy.deepcopy(data)
+        self.game_states.append(data)
+        return data
+
+    def agent_view(self, state):
+        """
+        :return: the state as it is given to agents, a copy if agents are isolated
+        """
+        if self.isolate_agents:
+            return copy.deepcopy(state)
+        return state
+
     def broadcast(self, data):
-        state = data["game_state"]
-        for player in self.players:
-            player.observe(state)
+        state = self.agent_view(data["game_state"])
+        for agent_id, player in zip(self.agent_ids, self.players):
+            try:
+                player.observe(state)
+            except AGENT_ERRORS as e:
+                print("agent {} failed to observe: {}".format(agent_id, e))
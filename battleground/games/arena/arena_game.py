@@ -1,16 +1,20 @@
 
 from battleground.game_engine import GameEngine
-from . import calc
 from .dungeon import Dungeon
 from .event import Event
 from .gladiator import Gladiator
 
+import copy
+import heapq
 import random
 
 
 class ArenaGameEngine(GameEngine):
     """
     An arena game engine based on an event queue.
+
+    The event queue is a heap of (time, sequence number, event). Events with
+    the same time are handled in the order they were queued.
     """
 
     dungeon_class = Dungeon
@@ -55,18 +59,23 @@ class ArenaGameEngine(GameEngine):
         self.dungeon = self.dungeon_class(**dungeon_stats)
 
         # init event_queue
+        self.event_queue = []
+        self.event_counter = 0
+        # events in handling order, built by get_queue when the queue changed
+        self.sorted_queue = None
         if state is not None \
                 and "queue" in state:
-            self.event_queue = [(t, self._init_event(e)) for t, e in state["queue"]]
+            for t, e in state["queue"]:
+                self.push_event(t, self._init_event(e))
         else:
-            self.event_queue = [(g.get_initiative(),  # + calc.noise(),
-                                 self._init_event(g))
-                                for g in self.gladiators]
+            events = [(g.get_initiative(),  # + calc.noise(),
+                       self._init_event(g))
+                      for g in self.gladiators]
             # shuffle list to guarantee no advantage of one player over another
             # by always being first (at equal initiative)
-            random.shuffle(self.event_queue)
-            # sort by initiative
-            self.event_queue = sorted(self.event_queue, key=lambda event: event[0])
+            random.shuffle(events)
+            for t, e in events:
+                self.push_event(t, e)
 
         # init scores
         if state is not None \
@@ -118,12 +127,47 @@ class ArenaGameEngine(GameEngine):
         """
         return {"gladiators": [g.get_init() for g in self.gladiators],
                 "dungeon": self.dungeon.get_init(),
-                "queue": [(t, e.get_init()) for t, e in self.event_queue],
+                "queue": [(t, e.get_init()) for t, e in self.get_queue()],
                 "scores": self.scores,
                 "message": self.message,
                 "move_options": self.get_move_options(self.get_current_player())
                 }
 
+    def push_event(self, time, event):
+        """
+        :param time: time the event happens
+        :param event: Event
+        :return: None
+        """
+        heapq.heappush(self.event_queue, (time, self.event_counter, event))
+        self.event_counter += 1
+        self.sorted_queue = None
+        return None
+
+    def pop_event(self):
+        """
+        :return: (time, event) of the next event, removed from event_queue
+        """
+        time, _, event = heapq.heappop(self.event_queue)
+        self.sorted_queue = None
+        return time, event
+
+    def peek_event(self):
+        """
+        :return: (time, event) of the next event
+        """
+        time, _, event = self.event_queue[0]
+        return time, event
+
+    def get_queue(self):
+        """
+        :return: list of (time, event) in the order they will be handled,
+                 shared until the queue changes, do not modify it
+        """
+        if self.sorted_queue is None:
+            self.sorted_queue = [(t, e) for t, _, e in sorted(self.event_queue)]
+        return self.sorted_queue
+
     def get_current_player(self):
         """
         This will be used by the game runner to determine which player should
@@ -133,7 +177,7 @@ class ArenaGameEngine(GameEngine):
         start of the event_queue.
         :returns index of first gladiator in event_queue in gladiators list
         """
-        return self.event_queue[0][1].owner
+        return self.peek_event()[1].owner
 
     def reset(self):
         """
@@ -143,10 +187,11 @@ class ArenaGameEngine(GameEngine):
         for glad in self.gladiators:
             glad.reset()
         self.dungeon.reset()
-        self.event_queue = sorted([(g.get_initiative(),  # + calc.noise(),
-                                    self._init_event(g))
-                                   for g in self.gladiators],
-                                  key=lambda event: event[0])
+        self.event_queue = []
+        self.event_counter = 0
+        for g in self.gladiators:
+            self.push_event(g.get_initiative(),  # + calc.noise(),
+                            self._init_event(g))
         self.scores = {i: 0 for i in range(len(self.gladiators))}
         self.state = {"gladiators": self.gladiators,
                       "dungeon": self.dungeon,
@@ -156,6 +201,52 @@ class ArenaGameEngine(GameEngine):
                       }
         return None
 
+    def snapshot(self):
+        """
+        :return: (dict) copy of the mutable game data.
+                 Events are never changed once queued, so they are shared.
+        """
+        return {"gladiators": [g.snapshot() for g in self.gladiators],
+                "dungeon": self.dungeon.snapshot(),
+                "queue": list(self.event_queue),
+                "event_counter": self.event_counter,
+                "scores": dict(self.scores),
+                "message": list(self.message),
+                "current_player": self.current_player
+                }
+
+    def restore(self, snapshot):
+        """
+        :param snapshot: (dict) as returned by snapshot()
+        :return: None
+        """
+        for glad, glad_snapshot in zip(self.gladiators, snapshot["gladiators"]):
+            glad.restore(glad_snapshot)
+        self.dungeon.restore(snapshot["dungeon"])
+        self.event_queue = list(snapshot["queue"])
+        self.event_counter = snapshot["event_counter"]
+        self.sorted_queue = None
+        self.scores = dict(snapshot["scores"])
+        self.message = list(snapshot["message"])
+        self.current_player = snapshot["current_player"]
+        self.state = {"gladiators": self.gladiators,
+                      "dungeon": self.dungeon,
+                      "queue": self.event_queue,
+                      "scores": self.scores,
+                      "message": self.message
+                      }
+        return None
+
+    def clone(self):
+        """
+        :return: independent copy of this engine, gladiators and dungeon
+        """
+        engine = copy.copy(self)
+        engine.gladiators = [copy.copy(g) for g in self.gladiators]
+        engine.dungeon = copy.copy(self.dungeon)
+        engine.restore(self.snapshot())
+        return engine
+
     def get_move_options(self, gladiator_index):
         """
         Used by agent to get available moves
@@ -194,6 +285,12 @@ class ArenaGameEngine(GameEngine):
 
         return options
 
+    def get_default_move(self):
+        """
+        :return: (dict) stay for one turn
+        """
+        return {"type": "stay", "value": 1}
+
     def move(self, move):
         """
         Execute a move on behalf of the current player.
@@ -206,11 +303,10 @@ class ArenaGameEngine(GameEngine):
         self.queue_move(move)
         self.message = []
 
-        while self.event_queue[0][1].type is not "gladiator":
-            (_, event) = self.event_queue.pop(0)
+        while self.peek_event()[1].type != "gladiator":
+            (_, event) = self.pop_event()
             self.handle_event(event)
-            if event.type is not "gladiator":
-                self.message.append(("event", event.get_init()))
+            self.message.append(("event", event.get_init()))
 
         self.current_player = self.get_current_player()
         return None
@@ -221,11 +317,10 @@ class ArenaGameEngine(GameEngine):
         :param move:
         :return: None
         """
-        (time, glad_event) = self.event_queue.pop(0)
+        (time, glad_event) = self.pop_event()
         time = int(time)
         glad_index = glad_event.owner
         glad = self.gladiators[glad_index]
-        event_queue_keys = [ev[0] for ev in self.event_queue]
 
         event_time = time + glad.get_cost(**move)  # + calc.noise()
         event_stats = self.init_queued_event_stats(time=time,
@@ -233,17 +328,12 @@ class ArenaGameEngine(GameEngine):
                                                    move=move)
         event = self.event_class(**event_stats)
 
-        calc.insort_right(self.event_queue,
-                          event_queue_keys,
-                          (event_time, event),
-                          keyfunc=lambda e: e[0])
+        self.push_event(event_time, event)
         next_glad_event = self.event_class(owner=glad_index,
                                            type="gladiator",
                                            time_stamp=time)
-        calc.insort_right(self.event_queue,
-                          event_queue_keys,
-                          (event_time, next_glad_event),
-                          keyfunc=lambda e: e[0])
+        # after the event, like all events queued later at the same time
+        self.push_event(event_time, next_glad_event)
         return None
 
     def init_queued_event_stats(self, time, glad_event, move):
@@ -290,18 +380,23 @@ class ArenaGameEngine(GameEngine):
         :return: number of corpses
         """
         corpse_count = 0
-        # go through event_queue in reversed order to keep items
-        # from changing index by deleting items with lower index
-        index = len(self.event_queue) - 1
-        for _, event in reversed(self.event_queue):
+        remaining = []
+        for item in self.event_queue:
+            event = item[2]
             # if gladiator is dead, delete it and all of its queued events.
             if self.gladiators[event.owner].is_dead():
                 # Dying sets score to zero.
-                if event.type is "gladiator":
+                if event.type == "gladiator":
                     self.state["scores"][event.owner] = 0
                     corpse_count += 1
-                del self.event_queue[index]
-            index -= 1
+            else:
+                remaining.append(item)
+        if len(remaining) < len(self.event_queue):
+            # keys are unchanged, the order of the remaining events is kept
+            heapq.heapify(remaining)
+            # modify in place, self.state refers to the same list
+            self.event_queue[:] = remaining
+            self.sorted_queue = None
         return corpse_count
 
     def game_over(self):
@@ -309,5 +404,5 @@ class ArenaGameEngine(GameEngine):
         Check if the game is over
         :return: (bool)
         """
-        num_glads = sum([1 for (t, g) in self.event_queue if g.type is "gladiator"])
+        num_glads = sum([1 for (_, _, g) in self.event_queue if g.type == "gladiator"])
         return bool(num_glads <= 1)
@@ -2,7 +2,6 @@
 calculation module for arena_game
 """
 
-from bisect import bisect_right
 import random
 
 
@@ -34,13 +33,13 @@ def noise():
     return random.randint(1, 999) / 1000
 
 
-def insort_right(seq, keys, item, keyfunc):
-    """ https://stackoverflow.com/questions/27672494/how-to-use-bisect-insort-left-with-a-key
-        Insert an item into the sorted list using separate corresponding
-        keys list and a keyfunc to extract key from each item.
+def copy_attributes(attributes):
     """
-    key = keyfunc(item)              # get key
-    index = bisect_right(keys, key)  # determine where to insert item
-    keys.insert(index, key)          # insert key of item in keys list
-    seq.insert(index, item)          # insert the item itself in the corresponding spot
-    return None
+    Copy a dict of object attributes, e.g. for snapshots of game objects.
+    Attributes are scalars, tuples or flat dicts (like stats or boosts),
+    so dicts are copied and everything else is shared.
+    :param attributes: dict
+    :return: dict
+    """
+    return {key: (value.copy() if isinstance(value, dict) else value)
+            for key, value in attributes.items()}
@@ -1,3 +1,6 @@
+from . import calc
+
+
 class Dungeon(object):
 
     def __init__(self, *args, **kwargs):
@@ -9,3 +12,10 @@ class Dungeon(object):
 
     def reset(self):
         pass
+
+    def snapshot(self):
+        return calc.copy_attributes(self.__dict__)
+
+    def restore(self, snapshot):
+        self.__dict__.update(calc.copy_attributes(snapshot))
+        return None
@@ -2,6 +2,8 @@ import copy
 import random
 import math
 
+from . import calc
+
 
 class Gladiator(object):
 
@@ -57,6 +59,20 @@ class Gladiator(object):
         self.cur_hp = self.max_hp
         return None
 
+    def snapshot(self):
+        """
+        :return: copy of all attributes, including the ones added by mods
+        """
+        return calc.copy_attributes(self.__dict__)
+
+    def restore(self, snapshot):
+        """
+        :param snapshot: as returned by snapshot()
+        :return: None
+        """
+        self.__dict__.update(calc.copy_attributes(snapshot))
+        return None
+
     def get_stats(self):
         """
         :return: stats
@@ -17,7 +17,7 @@ class ArenaGameEngine(arena_game.ArenaGameEngine):
             observer = None
         state = {"gladiators": [g.get_init(observer) for g in self.gladiators],
                  "dungeon": self.dungeon.get_init(observer),
-                 "queue": [(t, e.get_init(observer)) for t, e in self.event_queue],
+                 "queue": [(t, e.get_init(observer)) for t, e in self.get_queue()],
                  "scores": self.scores,
                  "move_options": self.get_move_options(self.get_current_player())
                  }
@@ -20,6 +20,23 @@ class BasicGameEngine(GameEngine):
         self.turn = 0
         self.roll = None
 
+    def snapshot(self):
+        return (tuple(self.scores),
+                self.current_player,
+                self.turn,
+                self.roll,
+                self.last_round,
+                self.last_player)
+
+    def restore(self, snapshot):
+        (scores,
+         self.current_player,
+         self.turn,
+         self.roll,
+         self.last_round,
+         self.last_player) = snapshot
+        self.scores = list(scores)
+
     def get_state(self, observer_id=None):
         return {"scores": self.scores,
                 "turn": self.turn,
@@ -30,6 +47,12 @@ class BasicGameEngine(GameEngine):
         options = {"values": list(range(self.max + 1))}
         return options
 
+    def get_default_move(self):
+        """
+        a value that can not score, i.e. pass on to the next player
+        """
+        return {"value": self.max}
+
     def move(self, move):
         """
         Do you move on behalf of the current player
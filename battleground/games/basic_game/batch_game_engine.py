@@ -0,0 +1,112 @@
+"""
+A vectorized version of the basic game engine.
+Plays many independent basic games in lockstep, which is useful
+for tuning strategies with fixed thresholds.
+Requires numpy.
+"""
+import numpy as np
+
+# a player who reaches this score ends the game (see BasicGameEngine.move)
+END_SCORE = 100
+
+
+class BatchBasicGameEngine(object):
+
+    def __init__(self, num_games, num_players, max_range=25, seed=None, dtype=np.int64):
+        """
+        :param num_games: (int) number of games played at once
+        :param num_players: (int) number of players in each game
+        :param max_range: (int) rolls are drawn from [1, max_range]
+        :param seed: seed for the random number generator
+        :param dtype: numpy type of the scores
+        """
+        self.num_games = num_games
+        self.num_players = num_players
+        self.max = max_range
+        self.dtype = dtype
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        """
+        Initialize all games to the starting point
+        """
+        self.last_round = np.zeros(self.num_games, dtype=bool)
+        self.last_player = np.full(self.num_games, -1, dtype=np.int64)
+        self.scores = np.zeros((self.num_games, self.num_players), dtype=self.dtype)
+        self.current_player = np.zeros(self.num_games, dtype=np.int64)
+        self.turn = np.zeros(self.num_games, dtype=np.int64)
+        self.roll = np.zeros(self.num_games, dtype=np.int64)
+
+    def get_state(self):
+        return {"scores": self.scores,
+                "turn": self.turn,
+                "last_roll": self.roll,
+                "current_player": self.current_player}
+
+    def move(self, values, rolls=None):
+        """
+        Do one move in every game that is not over yet,
+        on behalf of the current player of that game.
+        :param values: array (num_games,) of chosen values
+        :param rolls: optional array (num_games,) of rolls, drawn at random if None
+        """
+        if rolls is None:
+            rolls = self.rng.integers(1, self.max + 1, size=self.num_games)
+        values = np.asarray(values)
+
+        games = np.nonzero(~self.game_over())[0]
+        players = self.current_player[games]
+        values = values[games]
+        rolls = rolls[games]
+        self.roll[games] = rolls
+
+        # a value below the roll is added to the score ...
+        hit = values < rolls
+        hit_games = games[hit]
+        hit_players = players[hit]
+        self.scores[hit_games, hit_players] += values[hit]
+        new_last_round = (~self.last_round[hit_games]
+                          & (self.scores[hit_games, hit_players] >= END_SCORE))
+        self.last_round[hit_games[new_last_round]] = True
+        self.last_player[hit_games[new_last_round]] = hit_players[new_last_round]
+
+        # ... otherwise it is the next player's turn
+        miss_games = games[~hit]
+        self.current_player[miss_games] = (self.current_player[miss_games] + 1) % self.num_players
+
+        self.turn[games] += 1
+
+    def game_over(self):
+        """
+        :return: boolean array (num_games,), True for each game that is over
+        """
+        return self.last_round & (self.last_player == self.current_player)
+
+    def play(self, thresholds, max_turns=None):
+        """
+        Play all games to the end with players that always choose a fixed value.
+        :param thresholds: array (num_players,) of values, one per player,
+                           or array (num_games, num_players) of values per game and player.
+        :param max_turns: (int) stop after this many turns even if not all games are over
+        :return: array (num_games, num_players) of scores
+        """
+        thresholds = np.asarray(thresholds)
+        if thresholds.ndim == 1:
+            thresholds = np.broadcast_to(thresholds, (self.num_games, self.num_players))
+        game_index = np.arange(self.num_games)
+
+        turn = 0
+        while not self.game_over().all():
+            if max_turns is not None and turn >= max_turns:
+                break
+            self.move(thresholds[game_index, self.current_player])
+            turn += 1
+        return self.scores
+
+    def get_winners(self):
+        """
+        :return: boolean array (num_games, num_players), True for each player
+                 with the highest score of a game
+        """
+        return self.scores == self.scores.max(axis=1, keepdims=True)
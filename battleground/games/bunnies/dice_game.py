@@ -62,6 +62,24 @@ class DiceGame(GameEngine):
         self.state["lastRound"] = False
         return self.state
 
+    def snapshot(self):
+        """
+        :returns copy of self.state
+        """
+        return self._copy_state(self.state)
+
+    def restore(self, snapshot):
+        self.state = self._copy_state(snapshot)
+
+    @staticmethod
+    def _copy_state(state):
+        """
+        all values of the state are scalars or flat lists and dicts,
+        so copying one level deep is enough.
+        """
+        return {key: (value.copy() if isinstance(value, (list, dict)) else value)
+                for key, value in state.items()}
+
     def get_game_name(self):
         """
         :returns (char) the name of this game (i.e. game type)
@@ -105,6 +123,16 @@ class DiceGame(GameEngine):
 
         return options
 
+    def get_default_move(self):
+        """
+        :returns (dict) the first allowed move
+        """
+        options = self.get_move_options()
+        if options:
+            return {"type": options[0]["type"],
+                    "value": options[0]["values"][0]}
+        return {"type": "stay", "value": None}
+
     def get_current_player(self):
         """
         :returns (int) current player ID
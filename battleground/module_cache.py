@@ -0,0 +1,86 @@
+"""
+Import agent code from strings, without temporary files.
+
+Modules are keyed by the hash of their code, so identical code is compiled
+and executed only once. The least recently used modules are evicted when
+there are more than MODULE_CACHE_SIZE.
+"""
+import hashlib
+import importlib.abc
+import importlib.util
+import linecache
+import sys
+import threading
+from collections import OrderedDict
+
+MODULE_CACHE_SIZE = 64
+
+_modules = OrderedDict()
+_lock = threading.Lock()
+
+
+class CodeLoader(importlib.abc.Loader):
+    """
+    loads a module from a compiled code object.
+    """
+
+    def __init__(self, code_object):
+        self.code_object = code_object
+
+    def create_module(self, spec):
+        # use the default module creation
+        return None
+
+    def exec_module(self, module):
+        exec(self.code_object, module.__dict__)
+
+
+def get_code_hash(code_string):
+    return hashlib.sha256(code_string.encode("utf-8")).hexdigest()
+
+
+def load_module(code_string):
+    """
+    :param code_string: python source code
+    :return: the module, from the cache if the same code was loaded before
+    """
+    code_hash = get_code_hash(code_string)
+    with _lock:
+        if code_hash in _modules:
+            _modules.move_to_end(code_hash)
+            return _modules[code_hash]
+
+        module_name = "battleground_agent_{}".format(code_hash[:16])
+        file_name = "<agent code {}>".format(code_hash[:16])
+        # make the source available to tracebacks
+        lines = code_string.splitlines(True)
+        linecache.cache[file_name] = (len(code_string), None, lines, file_name)
+
+        loader = CodeLoader(compile(code_string, file_name, "exec"))
+        spec = importlib.util.spec_from_loader(module_name, loader, origin=file_name)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            loader.exec_module(module)
+        except BaseException:
+            del sys.modules[module_name]
+            raise
+
+        _modules[code_hash] = module
+        while len(_modules) > MODULE_CACHE_SIZE:
+            _, evicted = _modules.popitem(last=False)
+            _remove(evicted)
+        return module
+
+
+def _remove(module):
+    # agents created from the module keep working, they hold a reference to their class
+    sys.modules.pop(module.__name__, None)
+    linecache.cache.pop(module.__spec__.origin, None)
+
+
+def clear():
+    with _lock:
+        for module in _modules.values():
+            _remove(module)
+        _modules.clear()
@@ -1,53 +1,195 @@
 from .game_data import get_db_handle
+from . import indexes
 import bson
+import pymongo
+import pymongo.errors
+from pymongo import ReturnDocument, UpdateOne
+from collections import OrderedDict
+import threading
+
+# number of (owner, name, game_type) -> agent id entries kept in memory
+AGENT_ID_CACHE_SIZE = 1024
+
+_agent_id_cache = OrderedDict()
+# (database, agent id) -> (owner, name), for leaderboard entries
+_agent_name_cache = OrderedDict()
+_agent_id_cache_lock = threading.Lock()
+_indexed_databases = set()
+
+LEADERBOARD_SORT_KEYS = ("win_rate", "avg_score")
 
 
 def get_agents(owner, db_handle=None):
     if db_handle is None:
         db_handle = get_db_handle("agents")
     collection = db_handle.agents
-    result = collection.find({"owner": owner})
-    return list(result)
+    agents = list(collection.find({"owner": owner}))
+    for agent in agents:
+        if "results" in agent:
+            add_average_score(agent["results"])
+    return agents
 
 
-def insert_new_agent(owner, name, game_type, db_handle):
-    collection = db_handle.agents
-    doc = {"owner": owner, "name": name, "game_type": game_type}
-    agent_id = collection.insert_one(doc).inserted_id
-    return agent_id
+def add_average_score(results):
+    """
+    :param results: results of an agent, avg_score is set to the current average
+    """
+    results["avg_score"] = get_average_score(results)
+    return results
+
+
+def get_average_score(results):
+    """
+    :param results: results of an agent
+    :return: average score of all games of the agent.
+             total_score counts the scores of the last num_scored games, older games
+             were saved before it existed and are only included in the stored avg_score.
+    """
+    num_games = results["num_games"]
+    num_scored = results.get("num_scored", 0)
+    total_score = results.get("total_score", 0)
+    if num_scored >= num_games:
+        return total_score / num_games
+    num_averaged = num_games - num_scored
+    return (results.get("avg_score", 0) * num_averaged + total_score) / num_games
+
+
+def add_owner(owner, db_handle):
+    """
+    add owner to the owners collection, a materialized list of distinct owners.
+    """
+    db_handle.owners.update_one({"_id": owner}, {"$setOnInsert": {}}, upsert=True)
 
 
 def get_owners(db_handle=None):
     if db_handle is None:
         db_handle = get_db_handle("agents")
 
-    owners = set()
+    return set(document["_id"] for document in db_handle.owners.find())
+
+
+def clear_agent_id_cache():
+    with _agent_id_cache_lock:
+        _agent_id_cache.clear()
+        _agent_name_cache.clear()
+        _indexed_databases.clear()
 
-    collection = db_handle.agents
-    for document in collection.find():
-        owners.add(document["owner"])
 
-    return owners
+def delete_agent(agent_id, db_handle=None):
+    """
+    delete an agent with its leaderboard entries and usage, and drop it from the caches.
+    """
+    if db_handle is None:
+        db_handle = get_db_handle("agents")
+
+    if not isinstance(agent_id, bson.ObjectId):
+        agent_id = bson.ObjectId(str(agent_id))
+
+    db_handle.agents.delete_one({"_id": agent_id})
+    db_handle.leaderboard.delete_many({"agent_id": agent_id})
+    db_handle.agent_usage.delete_many({"agent_id": agent_id})
+
+    with _agent_id_cache_lock:
+        for key, cached_id in list(_agent_id_cache.items()):
+            if key[0] == db_handle.name and cached_id == agent_id:
+                del _agent_id_cache[key]
+        _agent_name_cache.pop((db_handle.name, agent_id), None)
+
+
+def ensure_agent_index(db_handle):
+    """
+    create the indexes of the agents database (see indexes.AGENT_INDEXES), once per database.
+    the unique index on (owner, name, game_type) prevents duplicate agents.
+    """
+    if db_handle.name in _indexed_databases:
+        return
+    indexes.ensure_collection_indexes(db_handle, indexes.AGENT_INDEXES)
+    _indexed_databases.add(db_handle.name)
+
+
+def _agent_id_cache_key(db_handle, owner, name, game_type):
+    if isinstance(game_type, list):
+        game_type = tuple(game_type)
+    return db_handle.name, owner, name, game_type
 
 
 def get_agent_id(owner, name, game_type, db_handle=None):
+    """
+    get the id of an agent, a new agent is created if it does not exist.
+    ids are cached, so only the first call for an agent queries the database.
+    """
     if db_handle is None:
         db_handle = get_db_handle("agents")
 
-    if "agents" not in db_handle.collection_names():
-        agent_id = insert_new_agent(owner, name, game_type, db_handle)
-    else:
-        collection = db_handle.agents
-        result = list(collection.find({"owner": owner,
-                                       "name": name,
-                                       "game_type": game_type}))
-        if result:
-            agent_id = result[0]["_id"]
-        else:
-            agent_id = insert_new_agent(owner, name, game_type, db_handle)
+    key = _agent_id_cache_key(db_handle, owner, name, game_type)
+    with _agent_id_cache_lock:
+        if key in _agent_id_cache:
+            _agent_id_cache.move_to_end(key)
+            return _agent_id_cache[key]
+
+    ensure_agent_index(db_handle)
+    doc = {"owner": owner, "name": name, "game_type": game_type}
+    try:
+        agent_id, inserted = _find_or_insert_agent(doc, db_handle)
+    except pymongo.errors.DuplicateKeyError:
+        # a concurrent upsert inserted the same agent first
+        agent_id, inserted = _find_or_insert_agent(doc, db_handle)
+    if inserted:
+        add_owner(owner, db_handle)
+
+    with _agent_id_cache_lock:
+        _agent_id_cache[key] = agent_id
+        while len(_agent_id_cache) > AGENT_ID_CACHE_SIZE:
+            _agent_id_cache.popitem(last=False)
+        _cache_agent_name(db_handle, agent_id, owner, name)
     return agent_id
 
 
+def _cache_agent_name(db_handle, agent_id, owner, name):
+    _agent_name_cache[(db_handle.name, agent_id)] = (owner, name)
+    while len(_agent_name_cache) > AGENT_ID_CACHE_SIZE:
+        _agent_name_cache.popitem(last=False)
+
+
+def get_agent_names(agent_ids, db_handle):
+    """
+    :param agent_ids: list of bson.ObjectId
+    :return: dict agent_id: (owner, name), agents are only queried if they are not cached
+    """
+    names = {}
+    with _agent_id_cache_lock:
+        for agent_id in agent_ids:
+            key = (db_handle.name, agent_id)
+            if key in _agent_name_cache:
+                names[agent_id] = _agent_name_cache[key]
+
+    missing = [agent_id for agent_id in agent_ids if agent_id not in names]
+    if missing:
+        agents = db_handle.agents.find({"_id": {"$in": missing}},
+                                       projection={"owner": True, "name": True})
+        with _agent_id_cache_lock:
+            for agent in agents:
+                names[agent["_id"]] = (agent["owner"], agent["name"])
+                _cache_agent_name(db_handle, agent["_id"], agent["owner"], agent["name"])
+    return names
+
+
+def _find_or_insert_agent(doc, db_handle):
+    """
+    :return: (agent id, True if the agent was inserted)
+    """
+    new_id = bson.ObjectId()
+    # the document before the update is None if the upsert inserted the agent
+    agent = db_handle.agents.find_one_and_update(doc,
+                                                 {"$setOnInsert": dict(doc, _id=new_id)},
+                                                 projection={"_id": True},
+                                                 upsert=True,
+                                                 return_document=ReturnDocument.BEFORE)
+    if agent is None:
+        return new_id, True
+    return agent["_id"], False
+
+
 def save_agent_code(owner, name, game_type, code, db_handle=None):
     agent_id = get_agent_id(owner, name, game_type, db_handle=db_handle)
     save_agent_data(agent_id, data=code, key="code", db_handle=db_handle)
@@ -73,6 +215,32 @@ def save_agent_data(agent_id, data, key, db_handle=None):
     return data_id
 
 
+def patch_agent_data(agent_id, key, changed, removed, db_handle=None):
+    """
+    update some keys of dict data saved under key.
+    :param changed: dict of keys and their new values
+    :param removed: list of keys to remove
+    """
+    if db_handle is None:
+        db_handle = get_db_handle("agents")
+
+    if not isinstance(agent_id, bson.ObjectId):
+        agent_id = bson.ObjectId(str(agent_id))
+
+    update_spec = {}
+    if changed:
+        update_spec["$set"] = {"{}.{}".format(key, name): value for name, value in changed.items()}
+    if removed:
+        update_spec["$unset"] = {"{}.{}".format(key, name): "" for name in removed}
+    if not update_spec:
+        return None
+    result = db_handle.agents.update_one({"_id": agent_id, key: {"$type": "object"}}, update_spec)
+    if result.matched_count == 0:
+        # nothing to patch, the changed keys are all there is
+        result = db_handle.agents.update_one({"_id": agent_id}, {"$set": {key: changed}})
+    return result
+
+
 def load_agent_data(agent_id, key, db_handle=None):
     if db_handle is None:
         db_handle = get_db_handle("agents")
@@ -88,48 +256,222 @@ def load_agent_data(agent_id, key, db_handle=None):
     return None
 
 
-def save_game_result(agent_id, game_id, game_type, score, win, db_handle=None):
+def get_result_update(score, win):
+    """
+    :return: update that adds one game result to the counters of an agent.
+             the stored avg_score is refreshed afterwards, see refresh_results.
+    """
+    return {"$inc": {"results.num_games": 1,
+                     "results.num_wins": 1 if win else 0,
+                     "results.total_score": score,
+                     "results.num_scored": 1}}
+
+
+def refresh_results(agent_ids=None, db_handle=None):
+    """
+    store the average score of agents, computed from their counters (see get_average_score).
+    Scores of games saved before total_score existed are folded into total_score.
+    Like in refresh_leaderboard, results are only written if no game was counted since
+    they were read.
+    :param agent_ids: list of bson.ObjectId, None for all agents with results
+    """
+    if db_handle is None:
+        db_handle = get_db_handle("agents")
+
+    query = {"results": {"$exists": True}}
+    if agent_ids is not None:
+        query["_id"] = {"$in": list(agent_ids)}
+    requests = []
+    for agent in db_handle.agents.find(query, projection={"results": True}):
+        results = agent["results"]
+        num_games = results["num_games"]
+        avg_score = get_average_score(results)
+        update = {"results.avg_score": avg_score}
+        if results.get("num_scored", 0) < num_games:
+            update.update({"results.total_score": avg_score * num_games,
+                           "results.num_scored": num_games})
+        requests.append(UpdateOne({"_id": agent["_id"], "results.num_games": num_games},
+                                  {"$set": update}))
+    if requests:
+        db_handle.agents.bulk_write(requests, ordered=False)
+
+
+def get_leaderboard_update(owner, name, score, win):
+    """
+    :return: update that adds one game result to the counters of a leaderboard entry.
+             the sort keys are refreshed afterwards, see refresh_leaderboard.
+    """
+    return {"$set": {"owner": owner, "name": name},
+            "$inc": {"num_games": 1,
+                     "num_wins": 1 if win else 0,
+                     "total_score": score}}
+
+
+def refresh_leaderboard(keys, db_handle):
+    """
+    recompute the sort keys (win_rate, avg_score) of leaderboard entries from their counters.
+    An entry is only written if no other result was counted since it was read,
+    the writer of that result refreshes it again.
+    :param keys: list of tuples (agent_id, game_type)
+    """
+    query = {"$or": [{"agent_id": agent_id, "game_type": game_type}
+                     for agent_id, game_type in keys]}
+    requests = []
+    for entry in db_handle.leaderboard.find(query, projection={"num_games": True,
+                                                                "num_wins": True,
+                                                                "total_score": True}):
+        requests.append(UpdateOne({"_id": entry["_id"], "num_games": entry["num_games"]},
+                                  {"$set": {
+                                      "win_rate": entry["num_wins"] / entry["num_games"],
+                                      "avg_score": entry["total_score"] / entry["num_games"]}}))
+    if requests:
+        db_handle.leaderboard.bulk_write(requests, ordered=False)
+
+
+def save_game_results(results, db_handle=None):
+    """
+    save the results of all players of one or more games with a single bulk write,
+    and update the leaderboard of each game type with a second one (see refresh_leaderboard).
+    results: list of tuples (agent_id, game_id, game_type, score, win)
+    """
     if db_handle is None:
         db_handle = get_db_handle("agents")
     collection = db_handle.agents
 
-    if not isinstance(agent_id, bson.ObjectId):
-        agent_id = bson.ObjectId(str(agent_id))
+    requests = []
+    agent_ids = []
+    for agent_id, game_id, game_type, score, win in results:
+        if not isinstance(agent_id, bson.ObjectId):
+            agent_id = bson.ObjectId(str(agent_id))
+        agent_ids.append(agent_id)
+        requests.append(UpdateOne({"_id": agent_id}, get_result_update(score, win)))
+    if not requests:
+        return None
+
+    result = collection.bulk_write(requests, ordered=False)
+    if result.matched_count < len(requests):
+        raise Exception("agents not found: {} of {}".format(len(requests) - result.matched_count,
+                                                            len(requests)))
+
+    refresh_results(set(agent_ids), db_handle)
+
+    ensure_agent_index(db_handle)
+    names = get_agent_names(list(set(agent_ids)), db_handle)
+    leaderboard_requests = []
+    for agent_id, (_, _, game_type, score, win) in zip(agent_ids, results):
+        owner, name = names[agent_id]
+        leaderboard_requests.append(UpdateOne({"agent_id": agent_id, "game_type": game_type},
+                                              get_leaderboard_update(owner, name, score, win),
+                                              upsert=True))
+    db_handle.leaderboard.bulk_write(leaderboard_requests, ordered=False)
+    refresh_leaderboard(set((agent_id, game_type)
+                            for agent_id, (_, _, game_type, _, _) in zip(agent_ids, results)),
+                        db_handle)
+    return result
+
 
-    result = list(collection.find({"_id": agent_id}))
-    if result:
-        agent = result[0]
-    else:
-        raise Exception("agent not found: {}".format(agent_id))
-
-    if "results" in agent:
-        num_games = agent["results"]["num_games"]
-        avg_score = agent["results"]["avg_score"]
-        agent["results"]["num_games"] += 1
-        agent["results"]["avg_score"] = (
-            avg_score * num_games + score) / (num_games + 1)
-        if win:
-            agent["results"]["num_wins"] += 1
-    else:
-        agent["results"] = {}
-        agent["results"]["num_games"] = 1
-        agent["results"]["avg_score"] = score
-        agent["results"]["num_wins"] = 1 if win else 0
-
-    collection.save(agent)
+def save_game_result(agent_id, game_id, game_type, score, win, db_handle=None):
+    return save_game_results([(agent_id, game_id, game_type, score, win)],
+                             db_handle=db_handle)
 
 
 def load_game_results(game_type, db_handle=None):
+    """
+    :return: list of tuples (owner, name, win rate) of all agents that played game_type,
+             best win rate first
+    """
+    leaderboard = get_leaderboard(game_type, limit=None, db_handle=db_handle)
+    return [(entry["owner"], entry["name"], entry["win_rate"]) for entry in leaderboard]
+
+
+def get_leaderboard(game_type, sort_by="win_rate", limit=10, db_handle=None):
+    """
+    read the top agents of a game type from the leaderboard collection.
+    :param sort_by: one of LEADERBOARD_SORT_KEYS
+    :param limit: (int) number of entries, None for all entries
+    :return: list of dict with keys agent_id, owner, name, game_type,
+             num_games, num_wins, win_rate, avg_score
+    """
+    if sort_by not in LEADERBOARD_SORT_KEYS:
+        raise ValueError("unknown sort key: {}".format(sort_by))
     if db_handle is None:
         db_handle = get_db_handle("agents")
-    collection = db_handle.agents
-    result = list(collection.find({"game_type": game_type}))
 
-    stats = []
+    cursor = db_handle.leaderboard.find({"game_type": game_type},
+                                        projection={"_id": False, "total_score": False},
+                                        sort=[(sort_by, pymongo.DESCENDING)])
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    return list(cursor)
 
-    for agent in result:
-        if "results" in agent:
-            win_rate = agent["results"]["num_wins"] / agent["results"]["num_games"]
-            stats.append((agent["owner"], agent["name"], win_rate))
 
-    return stats
+def save_agent_usage(usage, db_handle=None):
+    """
+    save the resources agents used in games, one document per agent and game.
+    usage: list of tuples (agent_id, game_id, game_type, dict of usage numbers)
+    """
+    if db_handle is None:
+        db_handle = get_db_handle("agents")
+
+    documents = []
+    for agent_id, game_id, game_type, agent_usage in usage:
+        document = dict(agent_usage)
+        document.update({"agent_id": bson.ObjectId(str(agent_id)),
+                         "game_id": game_id,
+                         "game_type": game_type})
+        documents.append(document)
+    if documents:
+        db_handle.agent_usage.insert_many(documents)
+
+
+def load_agent_usage(agent_id, game_type=None, limit=100, db_handle=None):
+    """
+    :param limit: (int) number of games, None for all games
+    :return: list of dict with keys game_id, game_type and the usage numbers, newest first
+    """
+    if db_handle is None:
+        db_handle = get_db_handle("agents")
+
+    query = {"agent_id": bson.ObjectId(str(agent_id))}
+    if game_type is not None:
+        query["game_type"] = game_type
+    cursor = db_handle.agent_usage.find(query,
+                                        projection={"_id": False, "agent_id": False},
+                                        sort=[("_id", pymongo.DESCENDING)])
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    return list(cursor)
+
+
+def rebuild_leaderboard(db_handle=None):
+    """
+    rebuild the leaderboard and owners collections from the agents collection,
+    for databases with results that were saved before these existed.
+    The results of an agent are not split by game type, so each agent
+    gets one entry for its own game type.
+    """
+    if db_handle is None:
+        db_handle = get_db_handle("agents")
+
+    db_handle.leaderboard.delete_many({})
+    entries = []
+    for agent in db_handle.agents.find({"results": {"$exists": True}}):
+        results = agent["results"]
+        game_types = agent["game_type"]
+        if not isinstance(game_types, list):
+            game_types = [game_types]
+        for game_type in game_types:
+            entries.append({"agent_id": agent["_id"],
+                             "game_type": game_type,
+                             "owner": agent["owner"],
+                             "name": agent["name"],
+                             "num_games": results["num_games"],
+                             "num_wins": results["num_wins"],
+                             "total_score": get_average_score(results) * results["num_games"],
+                             "win_rate": results["num_wins"] / results["num_games"],
+                             "avg_score": get_average_score(results)})
+    if entries:
+        db_handle.leaderboard.insert_many(entries)
+
+    for owner in db_handle.agents.distinct("owner"):
+        add_owner(owner, db_handle)
@@ -0,0 +1,110 @@
+"""
+Periodic checkpoints of agent memories during a session.
+
+A memory is only written if it changed since the last checkpoint. If the old
+and the new memory are both dicts, only the changed keys are written.
+"""
+import hashlib
+import json
+
+from . import storage
+
+MEMORY_KEY = "memory"
+
+
+def get_memory_patch(old, new):
+    """
+    :param old: memory at the last checkpoint (dict)
+    :param new: current memory (dict)
+    :return: (dict of changed or added keys, list of removed keys),
+             None if the change can not be written as a patch
+    """
+    changed = {}
+    for key, value in new.items():
+        # mongo field names can not contain dots or start with $
+        if not isinstance(key, str) or "." in key or key.startswith("$"):
+            return None
+        if key not in old or old[key] != value:
+            changed[key] = value
+    removed = [key for key in old if key not in new]
+    return changed, removed
+
+
+class MemoryCheckpointer(object):
+    def __init__(self, agent_objects, interval=None, max_size=None, patch=True, writer=None):
+        """
+        :param agent_objects: list of tuples (agent id, agent), with loaded memories
+        :param interval: (int) write a checkpoint every interval games, None only at the end
+        :param max_size: (int) memories larger than max_size bytes (as json) are not written
+        :param patch: (bool) write only the changed keys of dict memories
+        :param writer: BackgroundWriter or storage backend, defaults to storage.get_backend()
+        """
+        self.agent_objects = agent_objects
+        self.interval = interval
+        self.max_size = max_size
+        self.patch = patch
+        self.writer = writer
+        self.num_games = 0
+        self.num_writes = 0
+        # agent index: (digest, memory, size) at the last checkpoint
+        self.saved = {}
+        for index, (_, player) in enumerate(agent_objects):
+            self.saved[index] = self._encode(player.get_memory())
+
+    def game_finished(self):
+        """
+        call after each game, writes a checkpoint every interval games.
+        """
+        self.num_games += 1
+        if self.interval is not None and self.num_games % self.interval == 0:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        write the memories that changed since the last checkpoint.
+        :return: number of written memories
+        """
+        writer = self.writer
+        if writer is None:
+            writer = storage.get_backend()
+
+        num_written = 0
+        for index, (agent_id, player) in enumerate(self.agent_objects):
+            digest, memory, size = self._encode(player.get_memory())
+            old_digest, old_memory, _ = self.saved[index]
+            if digest is not None and digest == old_digest:
+                continue
+            if self.max_size is not None and size > self.max_size:
+                print("memory of agent {} not saved, {} bytes exceed the limit of {} bytes".format(
+                    agent_id, size, self.max_size))
+                continue
+
+            memory_patch = None
+            if self.patch and isinstance(old_memory, dict) and isinstance(memory, dict):
+                memory_patch = get_memory_patch(old_memory, memory)
+
+            if memory_patch is not None:
+                changed, removed = memory_patch
+                writer.patch_agent_data(agent_id, MEMORY_KEY, changed, removed)
+            else:
+                writer.save_agent_data(agent_id=agent_id, data=memory, key=MEMORY_KEY)
+            self.saved[index] = (digest, memory, size)
+            num_written += 1
+
+        self.num_writes += num_written
+        return num_written
+
+    @staticmethod
+    def _encode(memory):
+        """
+        :return: (digest, copy of memory, size in bytes).
+                 digest is None for memories that can not be encoded as json,
+                 these are always written.
+        """
+        try:
+            encoded = json.dumps(memory, sort_keys=True)
+        except (TypeError, ValueError):
+            return None, memory, 0
+        digest = hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+        # decoding gives a copy, the agent may change its memory in place
+        return digest, json.loads(encoded), len(encoded)
@@ -2,25 +2,124 @@
 import pymongo
 from pymongo import MongoClient
 import bson
+import base64
+import bisect
 import json
+import os
+import threading
+import zlib
 from os import environ
 
 import datetime
 
+# one client (and connection pool) per process, see get_client
 global_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# keyword arguments of MongoClient, set with configure_client
+client_options = {}
+
+# environment variable: (MongoClient option, type)
+CLIENT_OPTION_VARIABLES = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    # a number of nodes or "majority"
+    "MONGO_WRITE_CONCERN": ("w", lambda value: int(value) if value.isdigit() else value),
+}
+
+# storage formats of the states of a game
+# one document per state in the game_states collection
+STORAGE_DOCUMENTS = "documents"
+# compressed chunks of CHUNK_SIZE states in the game_state_chunks collection
+STORAGE_CHUNKS = "chunks"
+STORAGE_FORMATS = (STORAGE_DOCUMENTS, STORAGE_CHUNKS)
+# games moved to the archive collection by retention.archive_games
+STORAGE_ARCHIVE = "archive"
+ARCHIVE_COLLECTION = "game_archive"
+
+CHUNK_SIZE = 256
+
+# keys of a state document that are not part of the saved state
+_STATE_DOC_KEYS = ("_id", "sequence", "game_id", "game_type")
+
+# fields returned by list_games
+GAME_LIST_FIELDS = ["game_type", "created_at", "utc_time", "num_states"]
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def get_client_options():
+    """
+    :return: keyword arguments of MongoClient, from environment variables
+             (see CLIENT_OPTION_VARIABLES) and configure_client
+    """
+    options = {}
+    for variable, (option, option_type) in CLIENT_OPTION_VARIABLES.items():
+        if variable in environ:
+            options[option] = option_type(environ[variable])
+    options.update(client_options)
+    return options
+
+
+def configure_client(**options):
+    """
+    set MongoClient options (e.g. maxPoolSize=10, w="majority"),
+    they take precedence over environment variables.
+    The client of this process is re-created with the new options.
+    """
+    global client_options
+    client_options = dict(options)
+    reset_client()
 
 
 def get_client():
-    global global_client
-    if global_client is None:
-        if "MONGO_HOST" in environ:
-            host = environ["MONGO_HOST"]
-            global_client = MongoClient(host)
-        else:
-            global_client = MongoClient()
+    """
+    :return: the MongoClient of this process.
+    The client is created lazily, and again in a forked child process,
+    because a client must not be used across a fork.
+    All threads of a process share the client and its connection pool.
+    """
+    global global_client, _client_pid
+    pid = os.getpid()
+    if global_client is None or _client_pid != pid:
+        with _client_lock:
+            if global_client is None or _client_pid != pid:
+                host = environ.get("MONGO_HOST")
+                # connect=False: connect on first use, not while forking
+                global_client = MongoClient(host, connect=False, **get_client_options())
+                _client_pid = pid
     return global_client
 
 
+def reset_client():
+    """
+    drop the client of this process, the next get_client creates a new one.
+    """
+    global global_client, _client_pid
+    with _client_lock:
+        # a client inherited from the parent process is not closed,
+        # its sockets still belong to the parent
+        if global_client is not None and _client_pid == os.getpid():
+            global_client.close()
+        global_client = None
+        _client_pid = None
+
+
+def _after_fork_in_child():
+    global _client_lock
+    # the lock may have been held by another thread of the parent while forking
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
 def get_db_handle(name=None, client=None):
     if name is None:
         name = "game_states"
@@ -30,6 +129,24 @@ def get_db_handle(name=None, client=None):
     return db_handle
 
 
+def get_state_docs(game_id, game_type, game_states):
+    """
+    :return: one document per state, each key, value is stored as key: json(value)
+    """
+    all_docs = []
+    for i, game_state in enumerate(game_states):
+        doc = {
+            "sequence": i,
+            "game_id": game_id,
+            "game_type": game_type
+        }
+        for key, value in game_state.items():
+            assert key not in doc
+            doc[key] = json.dumps(value)
+        all_docs.append(doc)
+    return all_docs
+
+
 def save_game_states(game_id,
                      game_type,
                      game_states,
@@ -44,84 +161,265 @@ def save_game_states(game_id,
         db_handle = get_db_handle()
     collection = db_handle.game_states
 
+    result = collection.insert_many(get_state_docs(game_id, game_type, game_states))
+    return result
+
+
+def encode_states(game_states):
+    """
+    :param game_states: list of dict
+    :return: compressed json of all states (bytes)
+    """
+    data = json.dumps(list(game_states), separators=(",", ":"))
+    return zlib.compress(data.encode("utf-8"))
+
+
+def decode_states(data):
+    """
+    inverse of encode_states
+    """
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def get_chunk_offsets(num_states, chunk_size=CHUNK_SIZE):
+    """
+    :return: list of the sequence numbers of the first state in each chunk
+    """
+    return list(range(0, num_states, chunk_size))
+
+
+def get_chunk_docs(game_id, game_type, game_states, chunk_size=CHUNK_SIZE):
+    """
+    :return: one document per chunk_size states
+    """
+    game_states = list(game_states)
     all_docs = []
-    for i, game_state in enumerate(game_states):
-        doc = {
-            "sequence": i,
+    for index, start in enumerate(get_chunk_offsets(len(game_states), chunk_size)):
+        states = game_states[start:start + chunk_size]
+        all_docs.append({
             "game_id": game_id,
-            "game_type": game_type
-        }
-        for key, value in game_state.items():
-            assert key not in doc
-            doc[key] = json.dumps(value)
-        all_docs.append(doc)
-
-    result = collection.insert_many(all_docs)
-    return result
+            "game_type": game_type,
+            "chunk": index,
+            "start": start,
+            "num_states": len(states),
+            "data": bson.Binary(encode_states(states))
+        })
+    return all_docs
 
 
-def save_game_meta_data(game_type, num_states, utc_time=None, db_handle=None):
+def save_game_chunks(game_id,
+                     game_type,
+                     game_states,
+                     chunk_size=CHUNK_SIZE,
+                     db_handle=None):
+    """
+    save game states as compressed chunks, one document per chunk_size states.
+    """
     if db_handle is None:
         db_handle = get_db_handle()
+    collection = db_handle.game_state_chunks
+
+    result = collection.insert_many(get_chunk_docs(game_id, game_type, game_states, chunk_size))
+    return result
+
+
+def get_meta_doc(game_type, num_states, utc_time=None,
+                 storage=STORAGE_DOCUMENTS, chunk_offsets=None):
+    # mongo stores datetimes with millisecond precision
+    created_at = datetime.datetime.utcnow()
+    created_at = created_at.replace(microsecond=created_at.microsecond // 1000 * 1000)
     if utc_time is None:
-        utc_time = str(datetime.datetime.utcnow())
+        utc_time = str(created_at)
     doc = {
         "game_type": game_type,
+        "created_at": created_at,
         "utc_time": utc_time,
         "num_states": num_states}
+    if storage != STORAGE_DOCUMENTS:
+        doc["storage"] = storage
+        doc["chunk_offsets"] = chunk_offsets
+    return doc
+
+
+def save_game_meta_data(game_type, num_states, utc_time=None, db_handle=None,
+                        storage=STORAGE_DOCUMENTS, chunk_offsets=None):
+    if db_handle is None:
+        db_handle = get_db_handle()
+    doc = get_meta_doc(game_type, num_states, utc_time, storage, chunk_offsets)
     game_id = db_handle.games.insert_one(doc).inserted_id
     return game_id
 
 
-def save_game_history(game_type, game_states, db_handle=None):
+def save_game_history(game_type, game_states, db_handle=None,
+                      storage=STORAGE_DOCUMENTS, chunk_size=CHUNK_SIZE):
     """
     save a sequence of documents to the data-store.
     game_states: array of dict
-        each array element will be stored as one document in the doc-store.
-        each key, value in each dict will be stored as key: json(value) in the document.
+        with STORAGE_DOCUMENTS, each array element will be stored as one document
+        in the doc-store and each key, value in each dict will be stored as
+        key: json(value) in the document.
+        with STORAGE_CHUNKS, every chunk_size elements are stored as one
+        compressed document.
         expected keys are "game_state", "last_move" and "player_ids"
     """
+    game_ids = save_game_histories([(game_type, game_states, storage)],
+                                   db_handle=db_handle,
+                                   chunk_size=chunk_size)
+    return game_ids[0]
+
+
+def save_game_histories(games, db_handle=None, chunk_size=CHUNK_SIZE):
+    """
+    save several games with one insert_many per collection.
+    games: list of tuples (game_type, game_states, storage), see save_game_history
+    :return: list of game ids, in the same order as games
+    """
+    for _, _, storage in games:
+        if storage not in STORAGE_FORMATS:
+            raise ValueError("unknown storage format: {}".format(storage))
+    if not games:
+        return []
 
     if db_handle is None:
         db_handle = get_db_handle()
 
-    game_id = save_game_meta_data(game_type=game_type,
-                                  num_states=len(game_states),
-                                  db_handle=db_handle)
+    meta_docs = []
+    for game_type, game_states, storage in games:
+        chunk_offsets = None
+        if storage == STORAGE_CHUNKS:
+            chunk_offsets = get_chunk_offsets(len(game_states), chunk_size)
+        meta_docs.append(get_meta_doc(game_type=game_type,
+                                      num_states=len(game_states),
+                                      storage=storage,
+                                      chunk_offsets=chunk_offsets))
+    game_ids = db_handle.games.insert_many(meta_docs).inserted_ids
 
-    save_game_states(game_id=game_id,
-                     game_type=game_type,
-                     game_states=game_states,
-                     db_handle=db_handle)
-    return game_id
+    state_docs = []
+    chunk_docs = []
+    for game_id, (game_type, game_states, storage) in zip(game_ids, games):
+        if storage == STORAGE_CHUNKS:
+            chunk_docs.extend(get_chunk_docs(game_id, game_type, game_states, chunk_size))
+        else:
+            state_docs.extend(get_state_docs(game_id, game_type, game_states))
+
+    if state_docs:
+        db_handle.game_states.insert_many(state_docs)
+    if chunk_docs:
+        db_handle.game_state_chunks.insert_many(chunk_docs)
+    return game_ids
 
 
 def load_game_history(game_id, db_handle=None):
     """load all states with the same game ID and return an ordered sequence"""
+    return list(iter_game_history(game_id, db_handle=db_handle))
+
 
+def iter_game_history(game_id, start=0, stop=None, fields=None,
+                      batch_size=100, db_handle=None):
+    """
+    iterate over the states of a game in sequence order.
+    States are fetched from the database in batches and decoded one at a time,
+    so replays can start before the whole game is loaded.
+    :param start: (int) sequence number of the first state
+    :param stop: (int) stop before this sequence number, None reads to the end
+    :param fields: list of keys to load (e.g. ["game_state"]), None loads all keys
+    :param batch_size: (int) number of documents per round trip
+    :return: generator of states (dict)
+    """
     if db_handle is None:
         db_handle = get_db_handle()
 
     if not isinstance(game_id, bson.ObjectId):
         game_id = bson.ObjectId(str(game_id))
 
-    collection = db_handle.game_states
+    meta_data = db_handle.games.find_one({"_id": game_id},
+                                         {"storage": True, "chunk_offsets": True})
+    storage = None
+    if meta_data is not None:
+        storage = meta_data.get("storage")
+    if storage == STORAGE_CHUNKS:
+        return _iter_game_chunks(game_id, meta_data["chunk_offsets"],
+                                 start, stop, fields, batch_size, db_handle)
+    elif storage == STORAGE_ARCHIVE:
+        return _iter_archived_states(game_id, start, stop, fields, batch_size, db_handle)
+    return _iter_game_states(game_id, start, stop, fields, batch_size, db_handle)
 
-    result = collection.find({"game_id": game_id})
-    data = result[:]
-    states_in_sequence = [None] * result.count()
 
-    # now decode some of the values that are json strings
-    for loaded_doc in data:
-        output_doc = {}
-        for data_key in loaded_doc:
-            if data_key in ["game_state", "last_move"]:
-                # decode these two keys, because they are special
-                output_doc[data_key] = json.loads(loaded_doc[data_key])
-            else:
-                output_doc[data_key] = loaded_doc[data_key]
-        states_in_sequence[output_doc["sequence"]] = output_doc
-    return states_in_sequence
+def get_history_doc(sequence, game_id, game_type, state, fields=None):
+    """
+    :param state: (dict) decoded state, as it was saved
+    :param fields: list of keys to keep, None keeps all keys
+    :return: a state as returned by iter_game_history, the same for every storage format
+    """
+    output_doc = {"sequence": sequence,
+                  "game_id": game_id,
+                  "game_type": game_type}
+    for key, value in state.items():
+        if fields is None or key in fields:
+            output_doc[key] = value
+    return output_doc
+
+
+def _iter_game_states(game_id, start, stop, fields, batch_size, db_handle):
+    sequence_filter = {"$gte": start}
+    if stop is not None:
+        sequence_filter["$lt"] = stop
+
+    projection = None
+    if fields is not None:
+        projection = ["sequence", "game_id", "game_type"] + list(fields)
+
+    # sorted by the (game_id, sequence) index
+    cursor = db_handle.game_states.find({"game_id": game_id, "sequence": sequence_filter},
+                                        projection=projection,
+                                        sort=[("sequence", pymongo.ASCENDING)],
+                                        batch_size=batch_size)
+
+    # every other key of a state document is a json string
+    for loaded_doc in cursor:
+        state = {key: json.loads(value) for key, value in loaded_doc.items()
+                 if key not in _STATE_DOC_KEYS}
+        yield get_history_doc(loaded_doc["sequence"], game_id, loaded_doc["game_type"],
+                              state, fields)
+
+
+def _iter_game_chunks(game_id, chunk_offsets, start, stop, fields, batch_size, db_handle):
+    # the last chunk that starts at or before the first state
+    first_chunk = max(bisect.bisect_right(chunk_offsets, start) - 1, 0)
+    chunk_filter = {"game_id": game_id, "chunk": {"$gte": first_chunk}}
+    if stop is not None:
+        chunk_filter["start"] = {"$lt": stop}
+
+    cursor = db_handle.game_state_chunks.find(chunk_filter,
+                                              sort=[("chunk", pymongo.ASCENDING)],
+                                              batch_size=batch_size)
+    for chunk in cursor:
+        for offset, state in enumerate(decode_states(chunk["data"])):
+            sequence = chunk["start"] + offset
+            if sequence < start:
+                continue
+            if stop is not None and sequence >= stop:
+                return
+            yield get_history_doc(sequence, game_id, chunk["game_type"], state, fields)
+
+
+def _iter_archived_states(game_id, start, stop, fields, batch_size, db_handle):
+    # archived states carry their sequence number, the archive may skip states
+    chunk_filter = {"game_id": game_id, "stop": {"$gt": start}}
+    if stop is not None:
+        chunk_filter["start"] = {"$lt": stop}
+
+    cursor = db_handle[ARCHIVE_COLLECTION].find(chunk_filter,
+                                                sort=[("chunk", pymongo.ASCENDING)],
+                                                batch_size=batch_size)
+    for chunk in cursor:
+        for state in decode_states(chunk["data"]):
+            sequence = state.pop("sequence")
+            if sequence < start:
+                continue
+            if stop is not None and sequence >= stop:
+                return
+            yield get_history_doc(sequence, game_id, chunk["game_type"], state, fields)
 
 
 def get_games_list(game_type=None, db_handle=None):
@@ -141,3 +439,72 @@ def get_games_list(game_type=None, db_handle=None):
                                  filter={"game_type": game_type})
 
     return result
+
+
+def encode_page_cursor(values):
+    """
+    :param values: json serializable sort key of the last listed item
+    :return: an opaque string
+    """
+    data = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def decode_page_cursor(cursor):
+    """
+    inverse of encode_page_cursor
+    """
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except ValueError:
+        raise ValueError("invalid page cursor: {}".format(cursor))
+
+
+def list_games(game_type=None, since=None, until=None, after=None, limit=20, db_handle=None):
+    """
+    list games, newest first, one page at a time.
+    Pages are selected by the position of the last game of the previous page
+    (keyset pagination), so each page costs the same regardless of its position.
+    :param game_type: only list games of this type
+    :param since: (datetime, utc) only list games created at or after since
+    :param until: (datetime, utc) only list games created before until
+    :param after: cursor returned with the previous page, None for the first page
+    :param limit: (int) page size
+    :return: (list of dict with "_id" and the keys in GAME_LIST_FIELDS,
+              cursor of the next page or None if this is the last page)
+    """
+    if db_handle is None:
+        db_handle = get_db_handle()
+
+    query_filter = {}
+    if game_type is not None:
+        query_filter["game_type"] = game_type
+    if since is not None or until is not None:
+        query_filter["created_at"] = {}
+        if since is not None:
+            query_filter["created_at"]["$gte"] = since
+        if until is not None:
+            query_filter["created_at"]["$lt"] = until
+    if after is not None:
+        milliseconds, game_id = decode_page_cursor(after)
+        created_at = EPOCH + datetime.timedelta(milliseconds=milliseconds)
+        game_id = bson.ObjectId(game_id)
+        query_filter = {"$and": [query_filter,
+                                 {"$or": [{"created_at": {"$lt": created_at}},
+                                          {"created_at": created_at,
+                                           "_id": {"$lt": game_id}}]}]}
+
+    cursor = db_handle.games.find(query_filter,
+                                  projection=GAME_LIST_FIELDS,
+                                  sort=[("created_at", pymongo.DESCENDING),
+                                        ("_id", pymongo.DESCENDING)],
+                                  limit=limit + 1)
+    games = list(cursor)
+
+    next_cursor = None
+    if len(games) > limit:
+        games = games[:limit]
+        last = games[-1]
+        milliseconds = (last["created_at"] - EPOCH) // datetime.timedelta(milliseconds=1)
+        next_cursor = encode_page_cursor([milliseconds, str(last["_id"])])
+    return games, next_cursor
@@ -0,0 +1,80 @@
+"""
+The indexes of all collections, declared in one place.
+
+Creating the indexes is idempotent, existing indexes with the same
+keys and options are left alone.
+"""
+import pymongo.errors
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+# collections in the games database (default "game_states")
+GAME_INDEXES = {
+    "games": [
+        # get_games_list
+        IndexModel([("utc_time", ASCENDING)]),
+        IndexModel([("game_type", ASCENDING), ("utc_time", DESCENDING)]),
+        # list_games
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("game_type", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "game_states": [
+        # iter_game_history
+        IndexModel([("game_id", ASCENDING), ("sequence", ASCENDING)], unique=True),
+    ],
+    "game_state_chunks": [
+        IndexModel([("game_id", ASCENDING), ("chunk", ASCENDING)], unique=True),
+    ],
+    "game_archive": [
+        IndexModel([("game_id", ASCENDING), ("chunk", ASCENDING)], unique=True),
+    ],
+}
+
+# collections in the agents database (default "agents")
+AGENT_INDEXES = {
+    "agents": [
+        # get_agent_id
+        IndexModel([("owner", ASCENDING), ("name", ASCENDING), ("game_type", ASCENDING)],
+                   unique=True,
+                   name="owner_name_game_type"),
+    ],
+    "leaderboard": [
+        IndexModel([("agent_id", ASCENDING), ("game_type", ASCENDING)], unique=True),
+        # get_leaderboard, one index per sort key
+        IndexModel([("game_type", ASCENDING), ("win_rate", DESCENDING)]),
+        IndexModel([("game_type", ASCENDING), ("avg_score", DESCENDING)]),
+    ],
+    "agent_usage": [
+        # load_agent_usage
+        IndexModel([("agent_id", ASCENDING), ("_id", DESCENDING)]),
+    ],
+}
+
+
+def ensure_collection_indexes(db_handle, indexes):
+    """
+    create the declared indexes of all collections in one database.
+    :param indexes: dict collection name: list of IndexModel
+    :return: list of error messages, for indexes that could not be created
+    """
+    errors = []
+    for collection_name, models in indexes.items():
+        try:
+            db_handle[collection_name].create_indexes(models)
+        except pymongo.errors.OperationFailure as error:
+            # e.g. duplicates prevent a unique index, queries still work without it
+            message = "could not create indexes of {}.{}: {}".format(db_handle.name,
+                                                                     collection_name,
+                                                                     error)
+            print(message)
+            errors.append(message)
+    return errors
+
+
+def ensure_indexes(game_db_handle, agent_db_handle):
+    """
+    create all declared indexes.
+    :return: list of error messages
+    """
+    errors = ensure_collection_indexes(game_db_handle, GAME_INDEXES)
+    errors.extend(ensure_collection_indexes(agent_db_handle, AGENT_INDEXES))
+    return errors
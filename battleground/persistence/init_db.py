@@ -1,12 +1,164 @@
-from . import game_data
-
-db_handle = game_data.get_db_handle()
-_game_states = db_handle["game_states"]
-_game_states.create_index("game_id")
-for index in _game_states.list_indexes():
-    print(index)
-
-_games = db_handle["games"]
-_games.create_index("utc_time")
-for index in _games.list_indexes():
-    print(index)
+"""
+Set up or upgrade the mongo databases: create all indexes (see indexes.py),
+apply pending migrations and check that the main queries are backed by an index.
+
+Every step is idempotent, run it after installing or upgrading with
+
+    battleground_init_db
+"""
+import argparse
+import datetime
+
+import bson
+from pymongo import UpdateOne
+
+from . import agent_data, game_data, indexes
+
+
+def _drop_game_id_index(game_db_handle, agent_db_handle):
+    # superseded by the (game_id, sequence) index
+    if "game_id_1" in game_db_handle.game_states.index_information():
+        game_db_handle.game_states.drop_index("game_id_1")
+
+
+def _count_total_score(game_db_handle, agent_db_handle):
+    # results used to store only the average score, they now count the total as well
+    agent_data.refresh_results(db_handle=agent_db_handle)
+
+
+def _rebuild_leaderboard(game_db_handle, agent_db_handle):
+    agent_data.rebuild_leaderboard(agent_db_handle)
+
+
+def _backfill_created_at(game_db_handle, agent_db_handle, batch_size=1000):
+    # the creation time of older games is the time stamp of their id
+    requests = []
+    for game in game_db_handle.games.find({"created_at": {"$exists": False}},
+                                          projection={"_id": True}):
+        created_at = game["_id"].generation_time.replace(tzinfo=None)
+        requests.append(UpdateOne({"_id": game["_id"]}, {"$set": {"created_at": created_at}}))
+        if len(requests) == batch_size:
+            game_db_handle.games.bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        game_db_handle.games.bulk_write(requests, ordered=False)
+
+
+# (name, function(game_db_handle, agent_db_handle)), applied once each, in order
+MIGRATIONS = [
+    ("drop_game_id_index", _drop_game_id_index),
+    ("count_total_score", _count_total_score),
+    ("rebuild_leaderboard", _rebuild_leaderboard),
+    ("backfill_created_at", _backfill_created_at),
+]
+
+# (database, collection, filter, sort) of the queries that must use an index
+QUERIES = [
+    ("agents", "agents", {"owner": "", "name": "", "game_type": ""}, None),
+    ("agents", "leaderboard", {"game_type": ""}, [("win_rate", -1)]),
+    ("agents", "leaderboard", {"game_type": ""}, [("avg_score", -1)]),
+    ("agents", "agent_usage", {"agent_id": bson.ObjectId()}, [("_id", -1)]),
+    ("game_states", "game_states", {"game_id": bson.ObjectId()}, [("sequence", 1)]),
+    ("game_states", "game_state_chunks", {"game_id": bson.ObjectId()}, [("chunk", 1)]),
+    ("game_states", "games", {}, [("utc_time", -1)]),
+    ("game_states", "games", {"game_type": ""}, [("utc_time", -1)]),
+    ("game_states", "games", {}, [("created_at", -1), ("_id", -1)]),
+    ("game_states", "games", {"game_type": ""}, [("created_at", -1), ("_id", -1)]),
+]
+
+# plan stages that read a whole collection or sort in memory
+SLOW_STAGES = ("COLLSCAN", "SORT")
+
+
+def run_migrations(game_db_handle, agent_db_handle):
+    """
+    apply all migrations that are not recorded in the migrations collection yet.
+    :return: list of names of the applied migrations
+    """
+    collection = game_db_handle.migrations
+    applied = set(doc["_id"] for doc in collection.find())
+
+    new_migrations = []
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        print("applying migration {}".format(name))
+        migration(game_db_handle, agent_db_handle)
+        collection.insert_one({"_id": name, "utc_time": datetime.datetime.utcnow()})
+        new_migrations.append(name)
+    return new_migrations
+
+
+def get_plan_stages(plan):
+    """
+    :param plan: a (winning) query plan of explain()
+    :return: list of all stage names in the plan
+    """
+    # plans of the slot based engine (MongoDB 5.0+) are nested in queryPlan
+    if "queryPlan" in plan:
+        plan = plan["queryPlan"]
+    stages = []
+    if "stage" in plan:
+        stages.append(plan["stage"])
+    if "inputStage" in plan:
+        stages.extend(get_plan_stages(plan["inputStage"]))
+    for input_stage in plan.get("inputStages", []):
+        stages.extend(get_plan_stages(input_stage))
+    return stages
+
+
+def check_query_plans(game_db_handle, agent_db_handle):
+    """
+    explain the queries in QUERIES.
+    :return: list of warnings for queries that scan a collection or sort in memory
+    """
+    db_handles = {"game_states": game_db_handle, "agents": agent_db_handle}
+
+    warnings = []
+    for database, collection_name, query_filter, sort in QUERIES:
+        collection = db_handles[database][collection_name]
+        plan = collection.find(query_filter, sort=sort).explain()
+        stages = get_plan_stages(plan["queryPlanner"]["winningPlan"])
+        slow_stages = [stage for stage in stages if stage in SLOW_STAGES]
+        if slow_stages:
+            warnings.append("{}.{} filter: {}, sort: {} uses {}".format(
+                db_handles[database].name, collection_name, query_filter, sort,
+                ", ".join(slow_stages)))
+    return warnings
+
+
+def init_db(game_db_handle=None, agent_db_handle=None):
+    """
+    create indexes, apply migrations and check the query plans.
+    :return: list of problems (str)
+    """
+    if game_db_handle is None:
+        game_db_handle = game_data.get_db_handle()
+    if agent_db_handle is None:
+        agent_db_handle = game_data.get_db_handle("agents")
+
+    problems = indexes.ensure_indexes(game_db_handle, agent_db_handle)
+    run_migrations(game_db_handle, agent_db_handle)
+    problems.extend(check_query_plans(game_db_handle, agent_db_handle))
+    return problems
+
+
+def go():
+    parser = argparse.ArgumentParser(description='create indexes and migrate the databases')
+    parser.add_argument('--check', action='store_true',
+                        help='only check the query plans')
+    args = parser.parse_args()
+
+    if args.check:
+        problems = check_query_plans(game_data.get_db_handle(),
+                                     game_data.get_db_handle("agents"))
+    else:
+        problems = init_db()
+
+    for problem in problems:
+        print("WARNING: {}".format(problem))
+    print("{} problems found.".format(len(problems)))
+
+
+if __name__ == "__main__":
+    go()
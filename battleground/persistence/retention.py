@@ -0,0 +1,128 @@
+"""
+Move the states of old games out of the hot collections.
+
+Games older than a given age are compacted into compressed chunks in the
+game_archive collection, optionally keeping only every n-th state.
+game_data.load_game_history reads archived games like any other game.
+
+    battleground_archive --days 30 --keyframes 50
+"""
+import argparse
+import datetime
+
+import bson
+from pymongo import ReplaceOne
+
+from . import game_data
+
+DEFAULT_MAX_AGE_DAYS = 30
+
+# keys of loaded states that are stored in the game meta data instead
+_META_KEYS = ("game_id", "game_type")
+
+
+def downsample(states, keyframe_interval):
+    """
+    :param states: list of states with a "sequence" key, in sequence order
+    :return: every keyframe_interval-th state and the last state
+    """
+    if not states:
+        return states
+    kept = [state for state in states[:-1] if state["sequence"] % keyframe_interval == 0]
+    kept.append(states[-1])
+    return kept
+
+
+def get_archive_docs(game_id, game_type, states, chunk_size=game_data.CHUNK_SIZE):
+    """
+    :param states: list of states with a "sequence" key, in sequence order
+    :return: one archive document per chunk_size states
+    """
+    all_docs = []
+    for index, first in enumerate(range(0, len(states), chunk_size)):
+        chunk = states[first:first + chunk_size]
+        all_docs.append({
+            "game_id": game_id,
+            "game_type": game_type,
+            "chunk": index,
+            "start": chunk[0]["sequence"],
+            "stop": chunk[-1]["sequence"] + 1,
+            "num_states": len(chunk),
+            "data": bson.Binary(game_data.encode_states(chunk))
+        })
+    return all_docs
+
+
+def archive_game(game, keyframe_interval=None, db_handle=None):
+    """
+    move the states of one game to the archive.
+    :param game: meta data document of the game
+    :param keyframe_interval: (int) if given, only every keyframe_interval-th state
+                              (and the last state) is kept
+    :return: number of archived states
+    """
+    if db_handle is None:
+        db_handle = game_data.get_db_handle()
+    game_id = game["_id"]
+
+    states = []
+    for state in game_data.iter_game_history(game_id, db_handle=db_handle):
+        for key in _META_KEYS:
+            state.pop(key, None)
+        states.append(state)
+    if keyframe_interval is not None:
+        states = downsample(states, keyframe_interval)
+
+    # the hot copy is deleted only once the game reads from the archive.
+    # chunks left by an interrupted run are replaced, never deleted first,
+    # so a crash at any point leaves a complete copy of the game.
+    archive = db_handle[game_data.ARCHIVE_COLLECTION]
+    docs = get_archive_docs(game_id, game["game_type"], states)
+    if docs:
+        archive.bulk_write([ReplaceOne({"game_id": game_id, "chunk": doc["chunk"]}, doc,
+                                       upsert=True)
+                            for doc in docs])
+    archive.delete_many({"game_id": game_id, "chunk": {"$gte": len(docs)}})
+    db_handle.games.update_one({"_id": game_id},
+                               {"$set": {"storage": game_data.STORAGE_ARCHIVE,
+                                         "num_archived_states": len(states),
+                                         "archived_at": datetime.datetime.utcnow()},
+                                "$unset": {"chunk_offsets": ""}})
+    db_handle.game_states.delete_many({"game_id": game_id})
+    db_handle.game_state_chunks.delete_many({"game_id": game_id})
+    return len(states)
+
+
+def archive_games(max_age_days=DEFAULT_MAX_AGE_DAYS, keyframe_interval=None, db_handle=None):
+    """
+    archive all games created more than max_age_days ago.
+    :return: number of archived games
+    """
+    if db_handle is None:
+        db_handle = game_data.get_db_handle()
+
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=max_age_days)
+    games = list(db_handle.games.find({"created_at": {"$lt": cutoff},
+                                       "storage": {"$ne": game_data.STORAGE_ARCHIVE}},
+                                      projection=["game_type"]))
+    num_games = 0
+    for game in games:
+        archive_game(game, keyframe_interval, db_handle)
+        num_games += 1
+    return num_games
+
+
+def go():
+    parser = argparse.ArgumentParser(description='archive the states of old games')
+    parser.add_argument('--days', type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help='archive games older than this many days')
+    parser.add_argument('--keyframes', type=int, default=None,
+                        help='only keep every n-th state of archived games')
+    args = parser.parse_args()
+
+    num_games = archive_games(args.days, args.keyframes)
+    print("{} games archived.".format(num_games))
+
+
+if __name__ == "__main__":
+    go()
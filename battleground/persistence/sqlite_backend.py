@@ -0,0 +1,364 @@
+"""
+An embedded storage backend in a single SQLite file.
+Useful for single machine batch runs and tests, no database server needed.
+"""
+import bson
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+from . import agent_data, game_data
+from .storage import StorageBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id TEXT PRIMARY KEY,
+    game_type TEXT,
+    utc_time TEXT,
+    num_states INTEGER
+);
+CREATE INDEX IF NOT EXISTS games_utc_time ON games (utc_time, id);
+CREATE INDEX IF NOT EXISTS games_game_type ON games (game_type, utc_time, id);
+CREATE TABLE IF NOT EXISTS game_states (
+    game_id TEXT,
+    sequence INTEGER,
+    game_type TEXT,
+    data TEXT,
+    PRIMARY KEY (game_id, sequence)
+);
+CREATE TABLE IF NOT EXISTS agents (
+    id TEXT PRIMARY KEY,
+    owner TEXT,
+    name TEXT,
+    game_type TEXT,
+    num_games INTEGER DEFAULT 0,
+    avg_score REAL DEFAULT 0,
+    num_wins INTEGER DEFAULT 0,
+    UNIQUE (owner, name, game_type)
+);
+CREATE INDEX IF NOT EXISTS agents_owner ON agents (owner);
+CREATE TABLE IF NOT EXISTS leaderboard (
+    agent_id TEXT,
+    game_type TEXT,
+    owner TEXT,
+    name TEXT,
+    num_games INTEGER,
+    num_wins INTEGER,
+    total_score REAL,
+    win_rate REAL,
+    avg_score REAL,
+    PRIMARY KEY (agent_id, game_type)
+);
+CREATE INDEX IF NOT EXISTS leaderboard_win_rate ON leaderboard (game_type, win_rate DESC);
+CREATE INDEX IF NOT EXISTS leaderboard_avg_score ON leaderboard (game_type, avg_score DESC);
+CREATE TABLE IF NOT EXISTS agent_usage (
+    agent_id TEXT,
+    game_id TEXT,
+    game_type TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS agent_usage_agent_id ON agent_usage (agent_id);
+CREATE TABLE IF NOT EXISTS agent_data (
+    agent_id TEXT,
+    key TEXT,
+    value TEXT,
+    PRIMARY KEY (agent_id, key)
+);
+"""
+
+
+class SQLiteBackend(StorageBackend):
+    def __init__(self, path, timeout=30):
+        """
+        :param path: file name of the database, created if it does not exist
+        :param timeout: (float) seconds to wait for a lock held by another connection
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        # every open connection and the process that opened it, see close
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.get_connection()
+
+    def get_connection(self):
+        """
+        :return: the connection of the current thread.
+        Connections are not shared between threads or forked processes.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid() \
+                or (os.getpid(), connection) not in self._connections:
+            # the connection is only used by this thread, but close may be called from another
+            connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                         check_same_thread=False)
+            # write ahead logging, readers do not block the writer
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            with self._connections_lock:
+                self._connections.append((os.getpid(), connection))
+        return connection
+
+    def close(self):
+        """
+        close the connections of all threads, e.g. of a BackgroundWriter.
+        Connections inherited from a parent process are left to the parent.
+        """
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for pid, connection in connections:
+            if pid == os.getpid():
+                connection.close()
+        self._local.connection = None
+
+    def save_game_history(self, game_type, game_states,
+                          storage=game_data.STORAGE_DOCUMENTS,
+                          chunk_size=game_data.CHUNK_SIZE):
+        return self.save_game_histories([(game_type, game_states, storage)])[0]
+
+    def save_game_histories(self, games):
+        # rows are compact already, all storage formats are saved the same way
+        game_ids = []
+        game_rows = []
+        state_rows = []
+        for game_type, game_states, _ in games:
+            game_id = bson.ObjectId()
+            game_ids.append(game_id)
+            num_states = 0
+            for i, state in enumerate(game_states):
+                state_rows.append((str(game_id), i, game_type,
+                                   json.dumps(state, separators=(",", ":"))))
+                num_states += 1
+            game_rows.append((str(game_id), game_type,
+                              str(datetime.datetime.utcnow()), num_states))
+
+        connection = self.get_connection()
+        with connection:
+            connection.executemany("INSERT INTO games VALUES (?, ?, ?, ?)", game_rows)
+            connection.executemany("INSERT INTO game_states VALUES (?, ?, ?, ?)", state_rows)
+        return game_ids
+
+    def iter_game_history(self, game_id, start=0, stop=None, fields=None, batch_size=100):
+        if not isinstance(game_id, bson.ObjectId):
+            game_id = bson.ObjectId(str(game_id))
+
+        query = "SELECT sequence, game_type, data FROM game_states " \
+                "WHERE game_id = ? AND sequence >= ?"
+        parameters = [str(game_id), start]
+        if stop is not None:
+            query += " AND sequence < ?"
+            parameters.append(stop)
+        query += " ORDER BY sequence"
+
+        cursor = self.get_connection().execute(query, parameters)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for sequence, game_type, data in rows:
+                yield game_data.get_history_doc(sequence, game_id, game_type,
+                                                json.loads(data), fields)
+
+    def get_games_list(self, game_type=None):
+        query = "SELECT id, game_type, utc_time, num_states FROM games"
+        parameters = []
+        if game_type is not None:
+            query += " WHERE game_type = ?"
+            parameters.append(game_type)
+        query += " ORDER BY utc_time DESC"
+
+        rows = self.get_connection().execute(query, parameters)
+        return [{"_id": bson.ObjectId(game_id),
+                 "game_type": game_type,
+                 "utc_time": utc_time,
+                 "num_states": num_states}
+                for game_id, game_type, utc_time, num_states in rows]
+
+    def list_games(self, game_type=None, since=None, until=None, after=None, limit=20):
+        # utc_time strings sort like the times they represent
+        conditions = []
+        parameters = []
+        if game_type is not None:
+            conditions.append("game_type = ?")
+            parameters.append(game_type)
+        if since is not None:
+            conditions.append("utc_time >= ?")
+            parameters.append(str(since))
+        if until is not None:
+            conditions.append("utc_time < ?")
+            parameters.append(str(until))
+        if after is not None:
+            utc_time, game_id = game_data.decode_page_cursor(after)
+            conditions.append("(utc_time < ? OR (utc_time = ? AND id < ?))")
+            parameters.extend([utc_time, utc_time, game_id])
+
+        query = "SELECT id, game_type, utc_time, num_states FROM games"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY utc_time DESC, id DESC LIMIT ?"
+        parameters.append(limit + 1)
+
+        rows = self.get_connection().execute(query, parameters).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = game_data.encode_page_cursor([rows[-1][2], rows[-1][0]])
+
+        games = []
+        for game_id, game_type, utc_time, num_states in rows:
+            games.append({"_id": bson.ObjectId(game_id),
+                          "game_type": game_type,
+                          "created_at": datetime.datetime.fromisoformat(utc_time),
+                          "utc_time": utc_time,
+                          "num_states": num_states})
+        return games, next_cursor
+
+    def get_agent_id(self, owner, name, game_type):
+        connection = self.get_connection()
+        with connection:
+            connection.execute("INSERT OR IGNORE INTO agents (id, owner, name, game_type) "
+                               "VALUES (?, ?, ?, ?)",
+                               (str(bson.ObjectId()), owner, name, json.dumps(game_type)))
+            row = connection.execute("SELECT id FROM agents "
+                                     "WHERE owner = ? AND name = ? AND game_type = ?",
+                                     (owner, name, json.dumps(game_type))).fetchone()
+        return bson.ObjectId(row[0])
+
+    def get_agents(self, owner):
+        connection = self.get_connection()
+        rows = connection.execute("SELECT id, owner, name, game_type, "
+                                  "num_games, avg_score, num_wins "
+                                  "FROM agents WHERE owner = ?", (owner,)).fetchall()
+        agents = []
+        for agent_id, owner, name, game_type, num_games, avg_score, num_wins in rows:
+            agent = {"_id": bson.ObjectId(agent_id),
+                     "owner": owner,
+                     "name": name,
+                     "game_type": json.loads(game_type)}
+            if num_games > 0:
+                agent["results"] = {"num_games": num_games,
+                                    "avg_score": avg_score,
+                                    "num_wins": num_wins}
+            for key, value in connection.execute("SELECT key, value FROM agent_data "
+                                                  "WHERE agent_id = ?", (agent_id,)):
+                agent[key] = json.loads(value)
+            agents.append(agent)
+        return agents
+
+    def delete_agent(self, agent_id):
+        connection = self.get_connection()
+        with connection:
+            for table, column in (("agents", "id"), ("leaderboard", "agent_id"),
+                                  ("agent_usage", "agent_id"), ("agent_data", "agent_id")):
+                connection.execute("DELETE FROM {} WHERE {} = ?".format(table, column),
+                                   (str(agent_id),))
+
+    def get_owners(self):
+        rows = self.get_connection().execute("SELECT DISTINCT owner FROM agents")
+        return set(row[0] for row in rows)
+
+    def save_agent_data(self, agent_id, data, key):
+        connection = self.get_connection()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO agent_data VALUES (?, ?, ?)",
+                               (str(agent_id), key, json.dumps(data)))
+
+    def load_agent_data(self, agent_id, key):
+        row = self.get_connection().execute("SELECT value FROM agent_data "
+                                            "WHERE agent_id = ? AND key = ?",
+                                            (str(agent_id), key)).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+        return None
+
+    def save_game_results(self, results):
+        rows = [(score, 1 if win else 0, str(agent_id))
+                for agent_id, game_id, game_type, score, win in results]
+        if not rows:
+            return None
+
+        connection = self.get_connection()
+        with connection:
+            # the right hand sides all use the values before the update
+            cursor = connection.executemany(
+                "UPDATE agents SET "
+                "avg_score = (avg_score * num_games + ?) / (num_games + 1), "
+                "num_wins = num_wins + ?, "
+                "num_games = num_games + 1 "
+                "WHERE id = ?", rows)
+            num_updated = cursor.rowcount
+            if num_updated < len(rows):
+                raise Exception("agents not found: {} of {}".format(len(rows) - num_updated,
+                                                                    len(rows)))
+
+            connection.executemany(
+                "INSERT INTO leaderboard "
+                "SELECT id, ?, owner, name, 1, ?, ?, ?, ? FROM agents WHERE id = ? "
+                "ON CONFLICT (agent_id, game_type) DO UPDATE SET "
+                "num_games = num_games + 1, "
+                "num_wins = num_wins + excluded.num_wins, "
+                "total_score = total_score + excluded.total_score, "
+                "win_rate = (num_wins + excluded.num_wins) * 1.0 / (num_games + 1), "
+                "avg_score = (total_score + excluded.total_score) / (num_games + 1)",
+                [(game_type, 1 if win else 0, score, 1.0 if win else 0.0, score, str(agent_id))
+                 for agent_id, game_id, game_type, score, win in results])
+        return num_updated
+
+    def save_agent_usage(self, usage):
+        connection = self.get_connection()
+        with connection:
+            connection.executemany(
+                "INSERT INTO agent_usage (agent_id, game_id, game_type, data) VALUES (?, ?, ?, ?)",
+                [(str(agent_id), str(game_id), game_type, json.dumps(agent_usage))
+                 for agent_id, game_id, game_type, agent_usage in usage])
+
+    def load_agent_usage(self, agent_id, game_type=None, limit=100):
+        query = "SELECT game_id, game_type, data FROM agent_usage WHERE agent_id = ?"
+        parameters = [str(agent_id)]
+        if game_type is not None:
+            query += " AND game_type = ?"
+            parameters.append(game_type)
+        query += " ORDER BY rowid DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+
+        all_usage = []
+        for game_id, row_game_type, data in self.get_connection().execute(query, parameters):
+            agent_usage = json.loads(data)
+            agent_usage.update({"game_id": bson.ObjectId(game_id), "game_type": row_game_type})
+            all_usage.append(agent_usage)
+        return all_usage
+
+    def load_game_results(self, game_type):
+        return [(entry["owner"], entry["name"], entry["win_rate"])
+                for entry in self.get_leaderboard(game_type, limit=None)]
+
+    def get_leaderboard(self, game_type, sort_by="win_rate", limit=10):
+        if sort_by not in agent_data.LEADERBOARD_SORT_KEYS:
+            raise ValueError("unknown sort key: {}".format(sort_by))
+
+        query = "SELECT agent_id, owner, name, game_type, num_games, num_wins, " \
+                "win_rate, avg_score FROM leaderboard WHERE game_type = ? " \
+                "ORDER BY {} DESC".format(sort_by)
+        parameters = [game_type]
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+
+        rows = self.get_connection().execute(query, parameters)
+        return [{"agent_id": bson.ObjectId(agent_id),
+                 "owner": owner,
+                 "name": name,
+                 "game_type": game_type,
+                 "num_games": num_games,
+                 "num_wins": num_wins,
+                 "win_rate": win_rate,
+                 "avg_score": avg_score}
+                for agent_id, owner, name, game_type, num_games, num_wins, win_rate, avg_score
+                in rows]
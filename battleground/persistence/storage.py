@@ -0,0 +1,284 @@
+"""
+Storage backends for games, game states and agents.
+
+The backend is selected with the environment variable BATTLEGROUND_STORAGE:
+"mongo" (default) uses the functions in game_data and agent_data,
+"sqlite" stores everything in the file BATTLEGROUND_SQLITE_PATH.
+"""
+from os import environ
+
+from . import agent_data, game_data, indexes, init_db
+
+BACKEND_MONGO = "mongo"
+BACKEND_SQLITE = "sqlite"
+
+DEFAULT_SQLITE_PATH = "battleground.db"
+
+global_backend = None
+
+
+class StorageBackend(object):
+    """
+    the interface of all storage backends.
+    Agent and game ids returned by a backend are bson.ObjectId.
+    """
+
+    def ensure_indexes(self):
+        """
+        create the indexes the queries of this backend rely on, called on startup.
+        """
+        pass
+
+    def migrate(self):
+        """
+        bring data written by older versions up to date, called on startup.
+        :return: list of names of the applied migrations
+        """
+        return []
+
+    def save_game_history(self, game_type, game_states,
+                          storage=game_data.STORAGE_DOCUMENTS,
+                          chunk_size=game_data.CHUNK_SIZE):
+        """
+        :param game_states: list of dict, see game_data.save_game_history
+        :return: game id
+        """
+        raise NotImplementedError()
+
+    def save_game_histories(self, games):
+        """
+        :param games: list of tuples (game_type, game_states, storage)
+        :return: list of game ids
+        """
+        return [self.save_game_history(game_type, game_states, storage)
+                for game_type, game_states, storage in games]
+
+    def iter_game_history(self, game_id, start=0, stop=None, fields=None, batch_size=100):
+        """
+        :return: generator of states in sequence order, see game_data.iter_game_history
+        """
+        raise NotImplementedError()
+
+    def load_game_history(self, game_id):
+        return list(self.iter_game_history(game_id))
+
+    def get_games_list(self, game_type=None):
+        """
+        :return: iterable of game meta data (dict), newest first
+        """
+        raise NotImplementedError()
+
+    def list_games(self, game_type=None, since=None, until=None, after=None, limit=20):
+        """
+        :return: (one page of game meta data, cursor of the next page),
+                 see game_data.list_games
+        """
+        raise NotImplementedError()
+
+    def get_agent_id(self, owner, name, game_type):
+        """
+        :return: id of the agent, a new agent is created if it does not exist
+        """
+        raise NotImplementedError()
+
+    def get_agents(self, owner):
+        raise NotImplementedError()
+
+    def delete_agent(self, agent_id):
+        """
+        delete an agent with its data, results and usage
+        """
+        raise NotImplementedError()
+
+    def get_owners(self):
+        raise NotImplementedError()
+
+    def save_agent_data(self, agent_id, data, key):
+        raise NotImplementedError()
+
+    def load_agent_data(self, agent_id, key):
+        """
+        :return: the data saved under key, None if there is none
+        """
+        raise NotImplementedError()
+
+    def patch_agent_data(self, agent_id, key, changed, removed):
+        """
+        update some keys of dict data saved under key, see agent_data.patch_agent_data
+        """
+        data = self.load_agent_data(agent_id, key)
+        if not isinstance(data, dict):
+            # nothing to patch, the changed keys are all there is
+            data = {}
+        data.update(changed)
+        for name in removed:
+            data.pop(name, None)
+        self.save_agent_data(agent_id, data, key)
+
+    def save_agent_code(self, owner, name, game_type, code):
+        agent_id = self.get_agent_id(owner, name, game_type)
+        self.save_agent_data(agent_id, data=code, key="code")
+        return agent_id
+
+    def load_agent_code(self, owner, name, game_type):
+        agent_id = self.get_agent_id(owner, name, game_type)
+        return self.load_agent_data(agent_id, key="code")
+
+    def save_game_results(self, results):
+        """
+        :param results: list of tuples (agent_id, game_id, game_type, score, win)
+        """
+        raise NotImplementedError()
+
+    def load_game_results(self, game_type):
+        """
+        :return: list of tuples (owner, name, win rate), best win rate first
+        """
+        raise NotImplementedError()
+
+    def get_leaderboard(self, game_type, sort_by="win_rate", limit=10):
+        """
+        :return: list of dict, see agent_data.get_leaderboard
+        """
+        raise NotImplementedError()
+
+    def save_agent_usage(self, usage):
+        """
+        :param usage: list of tuples (agent_id, game_id, game_type, dict of the
+                      resources the agent used in the game, see accounting.AgentUsage)
+        """
+        raise NotImplementedError()
+
+    def load_agent_usage(self, agent_id, game_type=None, limit=100):
+        """
+        :return: list of dict, see agent_data.load_agent_usage
+        """
+        raise NotImplementedError()
+
+
+class MongoBackend(StorageBackend):
+    def __init__(self, game_db_handle=None, agent_db_handle=None):
+        """
+        :param game_db_handle: database of games and game states, defaults to "game_states"
+        :param agent_db_handle: database of agents, defaults to "agents"
+        """
+        self._game_db_handle = game_db_handle
+        self._agent_db_handle = agent_db_handle
+
+    @property
+    def game_db_handle(self):
+        # connect lazily, so that a backend can be created before forking
+        if self._game_db_handle is None:
+            return game_data.get_db_handle()
+        return self._game_db_handle
+
+    @property
+    def agent_db_handle(self):
+        if self._agent_db_handle is None:
+            return game_data.get_db_handle("agents")
+        return self._agent_db_handle
+
+    def ensure_indexes(self):
+        return indexes.ensure_indexes(self.game_db_handle, self.agent_db_handle)
+
+    def migrate(self):
+        return init_db.run_migrations(self.game_db_handle, self.agent_db_handle)
+
+    def save_game_history(self, game_type, game_states,
+                          storage=game_data.STORAGE_DOCUMENTS,
+                          chunk_size=game_data.CHUNK_SIZE):
+        return game_data.save_game_history(game_type, game_states,
+                                           db_handle=self.game_db_handle,
+                                           storage=storage,
+                                           chunk_size=chunk_size)
+
+    def save_game_histories(self, games):
+        return game_data.save_game_histories(games, db_handle=self.game_db_handle)
+
+    def iter_game_history(self, game_id, start=0, stop=None, fields=None, batch_size=100):
+        return game_data.iter_game_history(game_id, start=start, stop=stop,
+                                           fields=fields, batch_size=batch_size,
+                                           db_handle=self.game_db_handle)
+
+    def get_games_list(self, game_type=None):
+        return game_data.get_games_list(game_type, db_handle=self.game_db_handle)
+
+    def list_games(self, game_type=None, since=None, until=None, after=None, limit=20):
+        return game_data.list_games(game_type=game_type, since=since, until=until,
+                                    after=after, limit=limit, db_handle=self.game_db_handle)
+
+    def get_agent_id(self, owner, name, game_type):
+        return agent_data.get_agent_id(owner, name, game_type, db_handle=self.agent_db_handle)
+
+    def get_agents(self, owner):
+        return agent_data.get_agents(owner, db_handle=self.agent_db_handle)
+
+    def delete_agent(self, agent_id):
+        return agent_data.delete_agent(agent_id, db_handle=self.agent_db_handle)
+
+    def get_owners(self):
+        return agent_data.get_owners(db_handle=self.agent_db_handle)
+
+    def save_agent_data(self, agent_id, data, key):
+        return agent_data.save_agent_data(agent_id, data, key, db_handle=self.agent_db_handle)
+
+    def load_agent_data(self, agent_id, key):
+        return agent_data.load_agent_data(agent_id, key, db_handle=self.agent_db_handle)
+
+    def patch_agent_data(self, agent_id, key, changed, removed):
+        return agent_data.patch_agent_data(agent_id, key, changed, removed,
+                                           db_handle=self.agent_db_handle)
+
+    def save_game_results(self, results):
+        return agent_data.save_game_results(results, db_handle=self.agent_db_handle)
+
+    def load_game_results(self, game_type):
+        return agent_data.load_game_results(game_type, db_handle=self.agent_db_handle)
+
+    def get_leaderboard(self, game_type, sort_by="win_rate", limit=10):
+        return agent_data.get_leaderboard(game_type, sort_by=sort_by, limit=limit,
+                                          db_handle=self.agent_db_handle)
+
+    def save_agent_usage(self, usage):
+        return agent_data.save_agent_usage(usage, db_handle=self.agent_db_handle)
+
+    def load_agent_usage(self, agent_id, game_type=None, limit=100):
+        return agent_data.load_agent_usage(agent_id, game_type=game_type, limit=limit,
+                                           db_handle=self.agent_db_handle)
+
+
+def create_backend(name=None, **kwargs):
+    """
+    :param name: BACKEND_MONGO or BACKEND_SQLITE, defaults to environment
+                 variable BATTLEGROUND_STORAGE or else BACKEND_MONGO
+    :param kwargs: passed to the backend class
+    """
+    if name is None:
+        name = environ.get("BATTLEGROUND_STORAGE", BACKEND_MONGO)
+
+    if name == BACKEND_MONGO:
+        return MongoBackend(**kwargs)
+    elif name == BACKEND_SQLITE:
+        from .sqlite_backend import SQLiteBackend
+        if "path" not in kwargs:
+            kwargs["path"] = environ.get("BATTLEGROUND_SQLITE_PATH", DEFAULT_SQLITE_PATH)
+        return SQLiteBackend(**kwargs)
+    raise ValueError("unknown storage backend: {}".format(name))
+
+
+def get_backend():
+    """
+    :return: the storage backend of this process
+    """
+    global global_backend
+    if global_backend is None:
+        global_backend = create_backend()
+    return global_backend
+
+
+def set_backend(backend):
+    """
+    use backend for all games and agents of this process, None resets to the default.
+    """
+    global global_backend
+    global_backend = backend
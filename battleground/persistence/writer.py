@@ -0,0 +1,143 @@
+"""
+A write-behind queue for finished games, game results and agent data.
+
+Game runners hand their data to a BackgroundWriter and continue with the
+next game, a thread writes the queued data in batches to the storage backend.
+When the queue is full, producers wait until there is room again.
+"""
+import copy
+import queue
+import threading
+import traceback
+
+from . import storage
+
+_SAVE_GAME = 0
+_SAVE_AGENT_DATA = 1
+_PATCH_AGENT_DATA = 2
+_STOP = 3
+
+
+class BackgroundWriter(object):
+    def __init__(self, backend=None, max_queue_size=100, batch_size=50):
+        """
+        :param backend: storage backend, defaults to storage.get_backend()
+        :param max_queue_size: (int) number of queued items before producers block
+        :param batch_size: (int) maximum number of items written together
+        """
+        if backend is None:
+            backend = storage.get_backend()
+        self.backend = backend
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save_game(self, game_type, game_states, results, storage_format, usage=None):
+        """
+        queue a finished game.
+        :param game_states: list of dict, must not be modified afterwards
+        :param results: list of tuples (agent_id, game_type, score, win)
+        :param storage_format: one of game_data.STORAGE_FORMATS
+        :param usage: list of tuples (agent_id, game_type, dict),
+                      see StorageBackend.save_agent_usage
+        """
+        self._put((_SAVE_GAME, (game_type, game_states, results, storage_format, usage or [])))
+
+    def save_agent_data(self, agent_id, data, key):
+        """
+        queue agent data, a copy of data is saved.
+        """
+        self._put((_SAVE_AGENT_DATA, (agent_id, copy.deepcopy(data), key)))
+
+    def patch_agent_data(self, agent_id, key, changed, removed):
+        """
+        queue an update of some keys of agent data, see StorageBackend.patch_agent_data
+        """
+        self._put((_PATCH_AGENT_DATA, (agent_id, key, copy.deepcopy(changed), list(removed))))
+
+    def flush(self):
+        """
+        wait until everything queued so far is written.
+        """
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        """
+        write everything that is queued and stop the writer thread.
+        """
+        if self.thread.is_alive():
+            self.queue.put((_STOP, None))
+            self.thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def _put(self, item):
+        self._raise_error()
+        if not self.thread.is_alive():
+            raise Exception("background writer is closed")
+        # blocks while the queue is full
+        self.queue.put(item)
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise Exception("background write failed") from error
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(item_type == _STOP for item_type, _ in batch)
+            try:
+                self._write(self.backend, batch)
+            except Exception as error:
+                traceback.print_exc()
+                self.error = error
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, backend, batch):
+        games = []
+        # saves and patches of agent data, in the order they were queued
+        agent_data = []
+        for item_type, data in batch:
+            if item_type == _SAVE_GAME:
+                games.append(data)
+            elif item_type in (_SAVE_AGENT_DATA, _PATCH_AGENT_DATA):
+                agent_data.append((item_type, data))
+
+        if games:
+            game_ids = backend.save_game_histories(
+                [(game_type, game_states, storage_format)
+                 for game_type, game_states, _, storage_format, _ in games])
+            results = []
+            usage = []
+            for game_id, (_, _, game_results, _, game_usage) in zip(game_ids, games):
+                for agent_id, game_type, score, win in game_results:
+                    results.append((agent_id, game_id, game_type, score, win))
+                for agent_id, game_type, agent_usage in game_usage:
+                    usage.append((agent_id, game_id, game_type, agent_usage))
+            backend.save_game_results(results)
+            if usage:
+                backend.save_agent_usage(usage)
+
+        for item_type, data in agent_data:
+            if item_type == _SAVE_AGENT_DATA:
+                backend.save_agent_data(*data)
+            else:
+                backend.patch_agent_data(*data)
@@ -0,0 +1,324 @@
+"""
+Agents hosted by a server outside of battleground.
+
+A player config with remote_path "tcp://host:port/name" plays through the
+agent "name" of the agent server at host:port. Messages are json objects,
+each sent with a 4 byte (big endian) length prefix:
+
+    request: {"id": 1, "agent": "name", "op": "move", "data": state}
+    reply:   {"id": 1, "ok": true, "data": move}
+             {"id": 1, "ok": false, "error": "message"}
+
+op is one of move, observe, get_memory, set_memory and merge_memories.
+observe requests have no id and are not answered, so the runner does not wait
+for them. All agents of a server share one connection per process, which is
+kept open across moves and games.
+
+AgentServer is a reference server, e.g.
+
+    battleground_agent_server --port 9000 --agent my_agent my_package.my_agent MyAgent
+"""
+import argparse
+import importlib
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from urllib.parse import urlsplit
+
+SCHEME = "tcp"
+DEFAULT_TIMEOUT = 10.0
+
+_header = struct.Struct(">I")
+
+# (host, port): RemoteConnection, of the current process
+_connections = {}
+_connections_pid = None
+_connections_lock = threading.Lock()
+
+
+class RemoteAgentError(Exception):
+    pass
+
+
+def is_remote_path(remote_path):
+    return remote_path is not None and urlsplit(remote_path).scheme == SCHEME
+
+
+def parse_remote_path(remote_path):
+    """
+    :param remote_path: "tcp://host:port/name"
+    :return: (host, port, agent name)
+    """
+    parts = urlsplit(remote_path)
+    name = parts.path.lstrip("/")
+    if parts.scheme != SCHEME or parts.hostname is None or parts.port is None or not name:
+        raise ValueError("invalid remote path: {}, expected tcp://host:port/name".format(
+            remote_path))
+    return parts.hostname, parts.port, name
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(_header.pack(len(data)) + data)
+
+
+def _receive_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError("connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def receive_message(sock):
+    size, = _header.unpack(_receive_exactly(sock, _header.size))
+    return json.loads(_receive_exactly(sock, size).decode("utf-8"))
+
+
+class RemoteConnection(object):
+    """
+    a connection to an agent server, shared by all its agents.
+    """
+
+    def __init__(self, host, port, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.request_ids = 0
+        self.num_connects = 0
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            # messages are small, do not wait to fill a packet
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.num_connects += 1
+        return self.sock
+
+    def _disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def request(self, agent_name, op, data=None, timeout=None):
+        """
+        send a request and wait for the reply.
+        :param timeout: (float) seconds to wait for the reply, defaults to the connection's
+        :return: data of the reply
+        """
+        with self.lock:
+            self.request_ids += 1
+            request_id = self.request_ids
+            try:
+                sock = self._connect()
+                sock.settimeout(self.timeout if timeout is None else timeout)
+                send_message(sock, {"id": request_id, "agent": agent_name, "op": op, "data": data})
+                reply = receive_message(sock)
+            except (OSError, EOFError, ValueError) as e:
+                # a half read reply would mix up the next requests
+                self._disconnect()
+                raise RemoteAgentError("{}:{} {} failed: {}".format(self.host, self.port, op, e))
+            if reply.get("id") != request_id:
+                # the replies are out of step with the requests
+                self._disconnect()
+                raise RemoteAgentError("unexpected reply {} to request {}".format(
+                    reply.get("id"), request_id))
+        if not reply.get("ok"):
+            raise RemoteAgentError(reply.get("error"))
+        return reply.get("data")
+
+    def notify(self, agent_name, op, data=None):
+        """
+        send a request without waiting for a reply.
+        """
+        with self.lock:
+            try:
+                send_message(self._connect(), {"agent": agent_name, "op": op, "data": data})
+            except OSError as e:
+                self._disconnect()
+                raise RemoteAgentError("{}:{} {} failed: {}".format(self.host, self.port, op, e))
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+
+def get_connection(host, port):
+    """
+    :return: the RemoteConnection of this process to host:port
+    """
+    global _connections, _connections_pid
+    with _connections_lock:
+        # sockets of a parent process are not shared with forked children
+        if _connections_pid != os.getpid():
+            _connections = {}
+            _connections_pid = os.getpid()
+        if (host, port) not in _connections:
+            _connections[(host, port)] = RemoteConnection(host, port)
+        return _connections[(host, port)]
+
+
+def close_connections():
+    with _connections_lock:
+        if _connections_pid == os.getpid():
+            for connection in _connections.values():
+                connection.close()
+            _connections.clear()
+
+
+class RemoteAgent(object):
+    """
+    the runner's side of an agent hosted by an agent server.
+    """
+
+    def __init__(self, remote_path, timeout=None):
+        """
+        :param timeout: (float) seconds to wait for a reply, defaults to DEFAULT_TIMEOUT
+        """
+        host, port, self.agent_name = parse_remote_path(remote_path)
+        self.connection = get_connection(host, port)
+        self.timeout = timeout
+        # round trip times of the requests with a reply
+        self.num_requests = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def _request(self, op, data=None):
+        start = time.perf_counter()
+        value = self.connection.request(self.agent_name, op, data, timeout=self.timeout)
+        latency = time.perf_counter() - start
+        self.num_requests += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        return value
+
+    def get_latency_stats(self):
+        """
+        :return: dict with the number of requests and the mean and max round trip time (s)
+        """
+        mean_latency = self.total_latency / self.num_requests if self.num_requests else None
+        return {"num_requests": self.num_requests,
+                "mean_latency": mean_latency,
+                "max_latency": self.max_latency}
+
+    def move(self, state):
+        return self._request("move", state)
+
+    def observe(self, state):
+        self.connection.notify(self.agent_name, "observe", state)
+
+    def get_memory(self):
+        return self._request("get_memory")
+
+    def set_memory(self, data):
+        return self._request("set_memory", data)
+
+    def merge_memories(self, memories):
+        return self._request("merge_memories", memories)
+
+
+class _AgentRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            try:
+                message = receive_message(self.request)
+            except (OSError, EOFError):
+                break
+            reply = self.server.dispatch(message)
+            if "id" in message:
+                send_message(self.request, reply)
+
+
+class AgentServer(socketserver.ThreadingTCPServer):
+    """
+    serves agents to remote runners, one thread per connection.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, agents, host="localhost", port=0):
+        """
+        :param agents: dict agent name: agent
+        :param port: (int) 0 picks a free port
+        """
+        super().__init__((host, port), _AgentRequestHandler)
+        self.agents = agents
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.server_address[:2]
+        return "{}://{}:{}".format(SCHEME, host, port)
+
+    def dispatch(self, message):
+        """
+        :return: reply to the message
+        """
+        try:
+            agent = self.agents[message["agent"]]
+            op = message["op"]
+            # agents are not expected to be thread safe
+            with self.lock:
+                if op == "move":
+                    value = agent.move(message.get("data"))
+                elif op == "observe":
+                    value = agent.observe(message.get("data"))
+                elif op == "get_memory":
+                    value = agent.get_memory()
+                elif op == "set_memory":
+                    value = agent.set_memory(message.get("data"))
+                elif op == "merge_memories":
+                    value = agent.merge_memories(message.get("data"))
+                else:
+                    raise ValueError("unknown op: {}".format(op))
+        except Exception as e:
+            if "id" not in message:
+                print("{} failed: {!r}".format(message.get("op"), e))
+            return {"id": message.get("id"), "ok": False, "error": repr(e)}
+        return {"id": message.get("id"), "ok": True, "data": value}
+
+    def start(self):
+        """
+        serve in a background thread.
+        """
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def go():
+    parser = argparse.ArgumentParser(description='serve agents to remote battleground runners')
+    parser.add_argument('--host', type=str, default="localhost")
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--agent', nargs=3, action='append', required=True,
+                        metavar=('NAME', 'MODULE', 'CLASS'),
+                        help='serve an instance of MODULE.CLASS as NAME')
+    args = parser.parse_args()
+
+    agents = {}
+    for name, module_path, class_name in args.agent:
+        agents[name] = getattr(importlib.import_module(module_path), class_name)()
+
+    server = AgentServer(agents, args.host, args.port)
+    print("serving {} at {}".format(", ".join(agents), server.address))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    go()
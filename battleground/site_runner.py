@@ -1,10 +1,17 @@
+import asyncio
 import json
 import importlib
 import inspect
+from .agent import Agent
 from .dynamic_agent import DynamicAgent
-from .game_runner import GameRunner
+from .game_runner import GameRunner, RECORD_FULL
+from .async_game_runner import AsyncGameRunner
+import multiprocessing
 import time
-from .persistence import agent_data
+from .accounting import AgentBudget
+from .persistence import game_data, storage
+from .persistence.writer import BackgroundWriter
+from .persistence.checkpoint import MemoryCheckpointer
 
 
 def parse_config(config):
@@ -26,9 +33,9 @@ def assign_agents(players_config, game_type):
     """
     agents = []  # will contain tuples of (id, object)
     for player in players_config:
-        agent_id = agent_data.get_agent_id(owner=player["owner"],
-                                           name=player["name"],
-                                           game_type=game_type)
+        agent_id = storage.get_backend().get_agent_id(owner=player["owner"],
+                                                      name=player["name"],
+                                                      game_type=game_type)
 
         # print(player)
         # append tuple to agent list
@@ -36,6 +43,26 @@ def assign_agents(players_config, game_type):
     return tuple(agents)  # return immutable version
 
 
+def close_agents(agent_objects):
+    """
+    release the agents of a finished session, see DynamicAgent.close
+    """
+    for _, player in agent_objects:
+        if isinstance(player, DynamicAgent):
+            player.close()
+
+
+def check_pool_players(players_config):
+    """
+    queue_prefix agents start worker processes, which the (daemonic)
+    workers of a multiprocessing.Pool can not do.
+    """
+    for player in players_config:
+        if player.get("queue_prefix") is not None:
+            raise ValueError("player {} has a queue_prefix, queue_prefix agents can not be "
+                             "played by parallel sessions or tournaments".format(player["name"]))
+
+
 def game_engine_factory(num_players, game_config):
     local_path = game_config["local_path"]
     engine_module = importlib.import_module(local_path)
@@ -61,18 +88,28 @@ def game_engine_factory(num_players, game_config):
     return engine_instance
 
 
-def run_session(engine, agent_objects, num_games, save=True, game_delay=None):
+def play_games(engine, agent_objects, num_games, save=True, game_delay=None,
+               delta=False, recording=RECORD_FULL, sample_interval=1, writer=None,
+               checkpointer=None, accounting=False, budget=None):
+    """
+    play num_games games in sequence, resetting the engine after each game.
+    :param writer: (BackgroundWriter) if given, games are saved in the background
+    :param checkpointer: (MemoryCheckpointer) if given, notified after each game
+    :param accounting: (bool) save the resources used by each agent with the results
+    :param budget: (AgentBudget) limits of every agent, see GameRunner
+    :return: list of scores, one entry per game
+    """
     all_scores = []
-
-    for agent_id, player in agent_objects:
-        memory = agent_data.load_agent_data(agent_id=agent_id,
-                                            key="memory")
-        player.set_memory(memory)
-
     for _ in range(num_games):
         game_runner = GameRunner(game_engine=engine,
                                  agent_objects=agent_objects,
-                                 save=save)
+                                 save=save,
+                                 delta=delta,
+                                 recording=recording,
+                                 sample_interval=sample_interval,
+                                 writer=writer,
+                                 accounting=accounting,
+                                 budget=budget)
         scores = game_runner.run_game()
 
         if game_delay is not None:
@@ -82,25 +119,284 @@ def run_session(engine, agent_objects, num_games, save=True, game_delay=None):
         all_scores.append(scores)
         engine.reset()
 
+        if checkpointer is not None:
+            checkpointer.game_finished()
+    return all_scores
+
+
+def load_memories(agent_objects):
+    for agent_id, player in agent_objects:
+        memory = storage.get_backend().load_agent_data(agent_id=agent_id,
+                                                       key="memory")
+        player.set_memory(memory)
+
+
+def save_memories(agent_objects, writer=None):
+    if writer is None:
+        writer = storage.get_backend()
     for agent_id, player in agent_objects:
-        agent_data.save_agent_data(agent_id=agent_id,
-                                   data=player.get_memory(),
-                                   key="memory")
+        writer.save_agent_data(agent_id=agent_id,
+                               data=player.get_memory(),
+                               key="memory")
+
+
+def run_session(engine, agent_objects, num_games, save=True, game_delay=None,
+                delta=False, recording=RECORD_FULL, sample_interval=1,
+                checkpoint_interval=None, max_memory_size=None, accounting=False, budget=None):
+    """
+    play num_games games, games and memories are saved by a BackgroundWriter
+    which is flushed before returning. Without save, memories are written directly.
+    :param checkpoint_interval: (int) save changed memories every checkpoint_interval games,
+                                None saves them at the end of the session only.
+    :param max_memory_size: (int) memories larger than this many bytes are not saved
+    :param accounting: (bool) save the resources used by each agent with the results
+    :param budget: (AgentBudget) limits of every agent, see GameRunner
+    """
+    load_memories(agent_objects)
+
+    writer = BackgroundWriter() if save else None
+    try:
+        checkpointer = MemoryCheckpointer(agent_objects,
+                                          interval=checkpoint_interval,
+                                          max_size=max_memory_size,
+                                          writer=writer)
+        all_scores = play_games(engine,
+                                agent_objects,
+                                num_games,
+                                save=save,
+                                game_delay=game_delay,
+                                delta=delta,
+                                recording=recording,
+                                sample_interval=sample_interval,
+                                writer=writer,
+                                checkpointer=checkpointer,
+                                accounting=accounting,
+                                budget=budget)
+
+        checkpointer.checkpoint()
+    finally:
+        if writer is not None:
+            writer.close()
     return all_scores
 
 
-def start_session(config, save=True, game_delay=None):
-    config_data = parse_config(config)
-    num_games = config_data["num_games"]
-    print(config_data["game"]["type"])
+def init_worker_process(client_options=None):
+    """
+    initializer of worker processes.
+    :param client_options: MongoClient options of the parent process, see game_data.configure_client
+    """
+    # a MongoClient must not be shared with a forked process,
+    # make sure every worker connects on its own.
+    if client_options:
+        game_data.configure_client(**client_options)
+    else:
+        game_data.reset_client()
+
+
+def _run_session_shard(config_data, agent_ids, memories, num_games, options):
+    """
+    play a part of a session in a worker process.
+    engine and agents are built from config_data, agents start with the given memories.
+    :return: (list of scores, list of agent memories)
+    """
+    agent_objects = []
+    for agent_id, player, memory in zip(agent_ids, config_data["players"], memories):
+        agent = DynamicAgent(agent_id=agent_id, **player)
+        agent.set_memory(memory)
+        agent_objects.append((agent_id, agent))
+    agent_objects = tuple(agent_objects)
 
-    agent_objects = assign_agents(players_config=config_data["players"],
-                                  game_type=config_data["game"]["type"])
     engine = game_engine_factory(num_players=len(agent_objects),
                                  game_config=config_data["game"])
-    all_scores = run_session(engine,
-                             agent_objects,
-                             num_games,
-                             save=save,
-                             game_delay=game_delay)
+    with BackgroundWriter() as writer:
+        all_scores = play_games(engine, agent_objects, num_games, writer=writer, **options)
+    return all_scores, [player.get_memory() for _, player in agent_objects]
+
+
+def overrides_merge_memories(player):
+    """
+    :return: (bool) False if the agent uses the default Agent.merge_memories,
+             True if it has its own (or it can not be told, e.g. for remote agents)
+    """
+    instance = getattr(player, "agent_instance", player)
+    if not isinstance(instance, Agent):
+        return True
+    return type(instance).merge_memories is not Agent.merge_memories
+
+
+def run_parallel_session(config_data, agent_objects, num_games, num_workers, **options):
+    """
+    like run_session, but games are split into num_workers shards which are
+    played in a pool of worker processes.
+    each worker builds its own engine and agents from config_data.
+    when all games are played, the memories of all copies of an agent are
+    combined with the agent's merge_memories method.
+    :param options: keyword arguments of play_games
+    :return: list of scores, one entry per game, in shard order
+    """
+    if num_games <= 0:
+        return []
+    check_pool_players(config_data["players"])
+    load_memories(agent_objects)
+    for agent_id, player in agent_objects:
+        if not overrides_merge_memories(player):
+            print("agent {} does not override merge_memories, "
+                  "only the memory of its last shard is kept".format(agent_id))
+    agent_ids = [agent_id for agent_id, _ in agent_objects]
+    memories = [player.get_memory() for _, player in agent_objects]
+
+    num_workers = min(num_workers, num_games)
+    shard_sizes = [num_games // num_workers + (1 if i < num_games % num_workers else 0)
+                   for i in range(num_workers)]
+    shards = [(config_data, agent_ids, memories, size, options) for size in shard_sizes]
+
+    with multiprocessing.Pool(processes=num_workers,
+                              initializer=init_worker_process,
+                              initargs=(game_data.client_options,)) as pool:
+        results = pool.starmap(_run_session_shard, shards)
+
+    all_scores = []
+    for shard_scores, _ in results:
+        all_scores.extend(shard_scores)
+
+    for index, (_, player) in enumerate(agent_objects):
+        shard_memories = [shard_memories[index] for _, shard_memories in results]
+        player.set_memory(player.merge_memories(shard_memories))
+
+    save_memories(agent_objects)
+    return all_scores
+
+
+async def run_async_session(engine, agent_objects, num_games, save=True, game_delay=None,
+                            **options):
+    """
+    like run_session, but games are played by an AsyncGameRunner,
+    so that many sessions can run concurrently in one event loop.
+    :param options: keyword arguments of AsyncGameRunner
+    """
+    load_memories(agent_objects)
+
+    all_scores = []
+    for _ in range(num_games):
+        game_runner = AsyncGameRunner(game_engine=engine,
+                                      agent_objects=agent_objects,
+                                      save=save,
+                                      **options)
+        scores = await game_runner.run_game()
+
+        if game_delay is not None:
+            await asyncio.sleep(game_delay)
+
+        print(scores)
+        all_scores.append(scores)
+        engine.reset()
+
+    save_memories(agent_objects)
     return all_scores
+
+
+def start_async_sessions(configs, save=True, game_delay=None, move_timeout=None, **options):
+    """
+    run several sessions concurrently in one event loop.
+    max_turns and move_delay are taken from each session config.
+    :param configs: list of session configs
+    :return: list of all_scores, one entry per session
+    """
+    sessions = []
+    all_agent_objects = []
+    for config in configs:
+        config_data = parse_config(config)
+        agent_objects = assign_agents(players_config=config_data["players"],
+                                      game_type=config_data["game"]["type"])
+        all_agent_objects.append(agent_objects)
+        engine = game_engine_factory(num_players=len(agent_objects),
+                                     game_config=config_data["game"])
+        sessions.append(run_async_session(engine,
+                                          agent_objects,
+                                          config_data["num_games"],
+                                          save=save,
+                                          game_delay=game_delay,
+                                          move_timeout=move_timeout,
+                                          max_turns=config_data.get("max_turns"),
+                                          move_delay=config_data.get("move_delay"),
+                                          **options))
+
+    async def run_all():
+        return await asyncio.gather(*sessions)
+
+    try:
+        return asyncio.run(run_all())
+    finally:
+        for agent_objects in all_agent_objects:
+            close_agents(agent_objects)
+
+
+def start_session(config, save=True, game_delay=None, delta=False,
+                  recording=RECORD_FULL, sample_interval=1, pool=None):
+    """
+    :param pool: (WarmPool) if given, agents and the engine are taken from the pool
+                 and returned to it after the session
+    """
+    config_data = parse_config(config)
+    num_games = config_data["num_games"]
+    num_workers = config_data.get("num_workers", 1)
+    # "budget": keyword arguments of AgentBudget
+    budget = None
+    if config_data.get("budget") is not None:
+        budget = AgentBudget(**config_data["budget"])
+    accounting = config_data.get("accounting", False)
+    print(config_data["game"]["type"])
+
+    if pool is not None:
+        agent_objects = pool.get_agents(players_config=config_data["players"],
+                                        game_type=config_data["game"]["type"])
+    else:
+        agent_objects = assign_agents(players_config=config_data["players"],
+                                      game_type=config_data["game"]["type"])
+    engine = None
+    try:
+        if num_workers > 1:
+            all_scores = run_parallel_session(config_data,
+                                              agent_objects,
+                                              num_games,
+                                              num_workers,
+                                              save=save,
+                                              game_delay=game_delay,
+                                              delta=delta,
+                                              recording=recording,
+                                              sample_interval=sample_interval,
+                                              accounting=accounting,
+                                              budget=budget)
+            if pool is not None:
+                pool.release(agent_objects)
+            return all_scores
+
+        if pool is not None:
+            engine = pool.get_engine(num_players=len(agent_objects),
+                                     game_config=config_data["game"],
+                                     factory=game_engine_factory)
+        else:
+            engine = game_engine_factory(num_players=len(agent_objects),
+                                         game_config=config_data["game"])
+        all_scores = run_session(engine,
+                                 agent_objects,
+                                 num_games,
+                                 save=save,
+                                 game_delay=game_delay,
+                                 delta=delta,
+                                 recording=recording,
+                                 sample_interval=sample_interval,
+                                 checkpoint_interval=config_data.get("checkpoint_interval"),
+                                 max_memory_size=config_data.get("max_memory_size"),
+                                 accounting=accounting,
+                                 budget=budget)
+        if pool is not None:
+            pool.release(agent_objects, engine)
+        return all_scores
+    finally:
+        # agents of the pool are closed when they are evicted,
+        # agents and engines of failed sessions are not reused
+        if pool is None:
+            close_agents(agent_objects)
+        else:
+            pool.discard(agent_objects, engine)
@@ -0,0 +1,176 @@
+"""
+Delta-encoded recording of game states.
+
+Instead of storing a deep copy of every state, the DeltaRecorder stores a full
+copy (keyframe) every keyframe_interval states and a list of structural
+changes for all states in between.
+"""
+import copy
+
+# change operations, stored as tuples (operation, path, ...)
+SET = 0      # (SET, path, value)
+DELETE = 1   # (DELETE, path)
+SPLICE = 2   # (SPLICE, path, start, stop, values)
+
+
+def diff(old, new):
+    """
+    compute the changes that turn old into new.
+    :param old: dict, list or value
+    :param new: dict, list or value
+    :return: list of change operations
+    """
+    changes = []
+    _diff(old, new, (), changes)
+    return changes
+
+
+def _diff(old, new, path, changes):
+    if type(old) is not type(new):
+        changes.append((SET, path, copy.deepcopy(new)))
+
+    elif isinstance(new, dict):
+        for key, value in new.items():
+            if key in old:
+                _diff(old[key], value, path + (key,), changes)
+            else:
+                changes.append((SET, path + (key,), copy.deepcopy(value)))
+        for key in old:
+            if key not in new:
+                changes.append((DELETE, path + (key,)))
+
+    elif isinstance(new, list):
+        if len(old) == len(new):
+            for index, (old_value, new_value) in enumerate(zip(old, new)):
+                _diff(old_value, new_value, path + (index,), changes)
+        else:
+            # replace only the part between common prefix and common suffix
+            start = 0
+            max_start = min(len(old), len(new))
+            while start < max_start and old[start] == new[start]:
+                start += 1
+            end = 0
+            max_end = max_start - start
+            while end < max_end and old[-end - 1] == new[-end - 1]:
+                end += 1
+            changes.append((SPLICE,
+                            path,
+                            start,
+                            len(old) - end,
+                            copy.deepcopy(new[start:len(new) - end])))
+
+    elif old != new:
+        changes.append((SET, path, copy.deepcopy(new)))
+
+
+def patch(state, changes):
+    """
+    apply changes (as returned by diff) to state.
+    state is modified in place, values are copied so that
+    the list of changes can be applied again later.
+    :return: the patched state
+    """
+    for change in changes:
+        operation, path = change[0], change[1]
+        if operation == SET and not path:
+            # the root object itself was replaced
+            state = copy.deepcopy(change[2])
+            continue
+
+        if operation == SPLICE:
+            _, _, start, stop, values = change
+            target = state
+            for key in path:
+                target = target[key]
+            target[start:stop] = copy.deepcopy(values)
+            continue
+
+        parent = state
+        for key in path[:-1]:
+            parent = parent[key]
+        if operation == SET:
+            parent[path[-1]] = copy.deepcopy(change[2])
+        elif operation == DELETE:
+            del parent[path[-1]]
+    return state
+
+
+class DeltaRecorder(object):
+    """
+    A sequence of game records (dicts with a "game_state" key).
+    Behaves like a read-only list of full records, but stores only
+    keyframes and the differences between consecutive game states.
+    """
+
+    def __init__(self, keyframe_interval=50):
+        """
+        :param keyframe_interval: (int) store a full copy of the game state every
+                                  keyframe_interval records
+        """
+        self.keyframe_interval = keyframe_interval
+        self.keyframes = {}  # index: full game state
+        self.deltas = []     # per record: list of changes, or None for keyframes
+        self.records = []    # per record: all other keys of the record
+        self._previous = None
+
+    def append(self, record):
+        """
+        record the game state and all other entries of record.
+        :param record: dict with key "game_state"
+        """
+        index = len(self.records)
+        state = record["game_state"]
+
+        if index % self.keyframe_interval == 0:
+            self.keyframes[index] = copy.deepcopy(state)
+            self.deltas.append(None)
+            self._previous = copy.deepcopy(state)
+        else:
+            changes = diff(self._previous, state)
+            self.deltas.append(changes)
+            self._previous = patch(self._previous, changes)
+
+        self.records.append({key: copy.deepcopy(value)
+                             for key, value in record.items()
+                             if key != "game_state"})
+
+    @property
+    def last_state(self):
+        """
+        the game state of the last record, the recorder's own copy: must not be modified.
+        """
+        return self._previous
+
+    def get_state(self, index):
+        """
+        rebuild the full game state with the given index.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+
+        keyframe_index = index - index % self.keyframe_interval
+        state = copy.deepcopy(self.keyframes[keyframe_index])
+        for changes in self.deltas[keyframe_index + 1:index + 1]:
+            state = patch(state, changes)
+        return state
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        record = copy.deepcopy(self.records[index])
+        record["game_state"] = self.get_state(index)
+        return record
+
+    def __iter__(self):
+        state = None
+        for index, changes in enumerate(self.deltas):
+            if changes is None:
+                state = copy.deepcopy(self.keyframes[index])
+            else:
+                state = patch(state, changes)
+            record = copy.deepcopy(self.records[index])
+            record["game_state"] = copy.deepcopy(state)
+            yield record
@@ -0,0 +1,235 @@
+"""
+Tournaments between many players of one game type.
+
+Matches are generated as round-robin or Swiss pairings and played as
+sessions in a pool of worker processes. Games and player results are
+saved by the game runners in the workers, the standings are updated
+as soon as a match is finished.
+"""
+import itertools
+import multiprocessing
+import queue
+import random
+
+from . import site_runner
+from .persistence import game_data
+from .game_runner import RECORD_FULL
+
+# matches tried by swiss_pairings before it gives up avoiding rematches
+MAX_PAIRING_STEPS = 10000
+
+
+def player_key(player):
+    """
+    :param player: player config (dict)
+    :return: (owner, name) which identifies a player
+    """
+    return player["owner"], player["name"]
+
+
+def round_robin_pairings(players, players_per_game=2):
+    """
+    every group of players_per_game players meets exactly once.
+    :param players: list of player configs
+    :return: list of matches (lists of player configs)
+    """
+    return [list(match) for match in itertools.combinations(players, players_per_game)]
+
+
+def swiss_pairings(players, points, played, players_per_game=2, had_bye=()):
+    """
+    group players with similar points.
+    Players are ranked by points (in random order among equal points) and the best
+    ranked player is matched with the next best ranked players they have not met yet,
+    as long as the remaining players can be matched without rematches as well.
+    If the players can not be split evenly, the lowest ranked players that did not
+    have a bye yet get one.
+    :param players: list of player configs
+    :param points: dict player_key: points
+    :param played: set of frozensets of two player keys that already met
+    :param had_bye: set of player keys that had a bye before
+    :return: (list of matches, list of players without a match (byes))
+    """
+    ranked = list(players)
+    random.shuffle(ranked)
+    ranked.sort(key=lambda p: points.get(player_key(p), 0), reverse=True)
+
+    byes = []
+    num_byes = len(ranked) % players_per_game
+    for player in reversed(list(ranked)):
+        if len(byes) == num_byes:
+            break
+        if player_key(player) not in had_bye:
+            byes.append(player)
+            ranked.remove(player)
+    # if everybody had a bye already, the lowest ranked players get another one
+    while len(byes) < num_byes:
+        byes.append(ranked.pop())
+
+    matches = _find_new_matches(ranked, played, players_per_game, [MAX_PAIRING_STEPS])
+    if matches is None:
+        # if everybody has met already, play rematches
+        matches = [ranked[i:i + players_per_game]
+                   for i in range(0, len(ranked), players_per_game)]
+    return matches, byes
+
+
+def _find_new_matches(ranked, played, players_per_game, steps):
+    """
+    split ranked players into matches of players who have not met yet.
+    The best ranked player is matched with the next best ranked players that
+    still allow a split of the remaining players (backtracking).
+    :param steps: list of one int, the number of matches that may still be tried
+    :return: list of matches, None if there is no such split
+    """
+    if not ranked:
+        return []
+    first, rest = ranked[0], ranked[1:]
+    for indices in itertools.combinations(range(len(rest)), players_per_game - 1):
+        if steps[0] <= 0:
+            return None
+        steps[0] -= 1
+        match = [first] + [rest[i] for i in indices]
+        if any(frozenset((player_key(a), player_key(b))) in played
+               for a, b in itertools.combinations(match, 2)):
+            continue
+        remaining = [p for i, p in enumerate(rest) if i not in indices]
+        matches = _find_new_matches(remaining, played, players_per_game, steps)
+        if matches is not None:
+            return [match] + matches
+    return None
+
+
+def _play_match(task):
+    """
+    play one match in a worker process.
+    :param task: (match_index, session config, keyword arguments of start_session)
+    :return: (match_index, list of scores)
+    """
+    match_index, config, session_options = task
+    all_scores = site_runner.start_session(config, **session_options)
+    return match_index, all_scores
+
+
+class Tournament(object):
+    def __init__(self, game_spec, players, players_per_game=2, games_per_match=1,
+                 num_workers=None, save=True, recording=RECORD_FULL):
+        """
+        :param game_spec: game config (as in registered_games.json)
+        :param players: list of player configs (as in registered_players.json)
+        :param players_per_game: (int)
+        :param games_per_match: (int) number of games in each match
+        :param num_workers: (int) number of worker processes, defaults to the number of cores
+        :param save: (bool) save games and results to the database
+        :param recording: recording level of the game runners
+        """
+        # matches are played in the workers of a multiprocessing.Pool
+        site_runner.check_pool_players(players)
+        self.game_spec = game_spec
+        self.players = list(players)
+        self.players_per_game = players_per_game
+        self.games_per_match = games_per_match
+        self.num_workers = num_workers
+        self.session_options = {"save": save, "recording": recording}
+
+        self.points = {player_key(p): 0 for p in self.players}
+        self.num_games = {player_key(p): 0 for p in self.players}
+        self.played = set()
+        self.had_bye = set()
+
+    def get_match_config(self, match):
+        return {"game": self.game_spec,
+                "players": match,
+                "num_games": self.games_per_match}
+
+    def record_match(self, match, all_scores):
+        """
+        update the standings with the results of a match.
+        In every game, the player(s) with the highest score get one point.
+        """
+        keys = [player_key(p) for p in match]
+        for scores in all_scores:
+            scores = [scores[i] for i in range(len(keys))]
+            best = max(scores)
+            for key, score in zip(keys, scores):
+                self.num_games[key] += 1
+                if score == best:
+                    self.points[key] += 1
+        for key_a, key_b in itertools.combinations(keys, 2):
+            self.played.add(frozenset((key_a, key_b)))
+
+    def play_round(self, matches, pool):
+        """
+        play all matches in the worker pool, recording results as they come in.
+        Every match loads and saves the memories of its players, so matches that
+        share a player are not played at the same time.
+        """
+        finished = queue.Queue()
+        waiting = list(enumerate(matches))
+        busy = set()
+        num_running = 0
+        while waiting or num_running:
+            still_waiting = []
+            for index, match in waiting:
+                keys = set(player_key(p) for p in match)
+                if keys & busy:
+                    still_waiting.append((index, match))
+                    continue
+                busy |= keys
+                task = (index, self.get_match_config(match), self.session_options)
+                pool.apply_async(_play_match, (task,),
+                                 callback=finished.put, error_callback=finished.put)
+                num_running += 1
+            waiting = still_waiting
+
+            result = finished.get()
+            num_running -= 1
+            if isinstance(result, BaseException):
+                raise result
+            index, all_scores = result
+            busy -= set(player_key(p) for p in matches[index])
+            self.record_match(matches[index], all_scores)
+
+    def run_round_robin(self):
+        """
+        :return: standings after every group of players met once
+        """
+        matches = round_robin_pairings(self.players, self.players_per_game)
+        with self._get_pool() as pool:
+            self.play_round(matches, pool)
+        return self.get_standings()
+
+    def run_swiss(self, num_rounds):
+        """
+        :param num_rounds: (int)
+        :return: standings after num_rounds rounds of Swiss pairings
+        """
+        with self._get_pool() as pool:
+            for _ in range(num_rounds):
+                matches, byes = swiss_pairings(self.players,
+                                               self.points,
+                                               self.played,
+                                               self.players_per_game,
+                                               self.had_bye)
+                # a bye counts as a won match
+                for player in byes:
+                    key = player_key(player)
+                    self.points[key] += self.games_per_match
+                    self.num_games[key] += self.games_per_match
+                    self.had_bye.add(key)
+                self.play_round(matches, pool)
+        return self.get_standings()
+
+    def get_standings(self):
+        """
+        :return: list of (owner, name, points, number of games), best player first
+        """
+        standings = [(key[0], key[1], self.points[key], self.num_games[key])
+                     for key in self.points]
+        standings.sort(key=lambda s: s[2], reverse=True)
+        return standings
+
+    def _get_pool(self):
+        return multiprocessing.Pool(processes=self.num_workers,
+                                    initializer=site_runner.init_worker_process,
+                                    initargs=(game_data.client_options,))
@@ -1,7 +1,7 @@
 import argparse
 import os.path
 
-from battleground.persistence import agent_data
+from battleground.persistence import storage
 
 
 def go():
@@ -22,10 +22,10 @@ def go():
     with open(args.path, 'r') as file:
         code = file.read()
 
-    agent_id = agent_data.save_agent_code(owner=args.owner,
-                                          name=args.name,
-                                          game_type=args.type,
-                                          code=code)
+    agent_id = storage.get_backend().save_agent_code(owner=args.owner,
+                                                     name=args.name,
+                                                     game_type=args.type,
+                                                     code=code)
 
     print("data saved as: {}.".format(agent_id))
 
@@ -3,14 +3,16 @@ import json
 import random
 import os.path
 from battleground import site_runner
+from battleground.tournament import Tournament
+from battleground.warm_pool import WarmPool
+from battleground.persistence import storage
 
 DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "../config/")
 
 
-def get_dynamic_players(game_type, number_of_players):
+def get_qualifying_players(game_type):
     """
-    this is a light-weight local version to pick players for a game.
-    in deployment this should be replaced with a database query.
+    :return: list of all registered players for game_type
     """
     file_path = os.path.join(DEFAULT_CONFIG_PATH, "registered_players.json")
     with open(file_path, 'r') as conf:
@@ -22,6 +24,15 @@ def get_dynamic_players(game_type, number_of_players):
 
     if not qualifying_players:
         raise IndexError("No qualifying players found.")
+    return qualifying_players
+
+
+def get_dynamic_players(game_type, number_of_players):
+    """
+    this is a light-weight local version to pick players for a game.
+    in deployment this should be replaced with a database query.
+    """
+    qualifying_players = get_qualifying_players(game_type)
 
     players = []
     for _ in range(number_of_players):
@@ -29,16 +40,22 @@ def get_dynamic_players(game_type, number_of_players):
     return players
 
 
-def generate_dynamic_config(game_delay, game_name=None, players=None):
+def get_game_spec(game_name=None):
+    """
+    :return: the registered game called game_name, or a random one if game_name is None
+    """
     file_path = os.path.join(DEFAULT_CONFIG_PATH, "registered_games.json")
     with open(file_path, 'r') as conf:
         registered_games = json.load(conf)
 
     if game_name is None:
-        game_spec = random.choice(registered_games)
-    else:
-        registered_games = {x["name"]: x for x in registered_games}
-        game_spec = registered_games[game_name]
+        return random.choice(registered_games)
+    registered_games = {x["name"]: x for x in registered_games}
+    return registered_games[game_name]
+
+
+def generate_dynamic_config(game_delay, game_name=None, players=None):
+    game_spec = get_game_spec(game_name)
 
     if players is None:
         players = get_dynamic_players(game_spec["type"], 3)
@@ -65,8 +82,34 @@ def go():
     parser.add_argument('--dynamic', action='store_true')
     parser.add_argument('-d', action='store_true')
     parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--tournament', choices=["round_robin", "swiss"],
+                        help='run a tournament between all registered players of a game')
+    parser.add_argument('--game', type=str, default=None,
+                        help='name of the registered game for --tournament')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='number of rounds of a swiss tournament')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes of a tournament')
     args = parser.parse_args()
     print("starting battleground ...")
+    backend = storage.get_backend()
+    backend.ensure_indexes()
+    # sessions write results in the current format only
+    backend.migrate()
+
+    if args.tournament is not None:
+        game_spec = get_game_spec(args.game)
+        players = get_qualifying_players(game_spec["type"])
+        tournament = Tournament(game_spec, players, num_workers=args.workers)
+        if args.tournament == "swiss":
+            standings = tournament.run_swiss(args.rounds)
+        else:
+            standings = tournament.run_round_robin()
+        for standing in standings:
+            print(standing)
+        return
+    # agents and engines are reused by the following sessions
+    pool = WarmPool()
     i = 0
     while i < args.count or args.d:
         i += 1
@@ -74,9 +117,9 @@ def go():
             print("running new dynamic config ...")
             delay = 60 if args.d else 0
             config = generate_dynamic_config(delay)
-            site_runner.start_session(config)
+            site_runner.start_session(config, pool=pool)
         else:
-            site_runner.start_session(args.config)
+            site_runner.start_session(args.config, pool=pool)
 
 
 if __name__ == "__main__":
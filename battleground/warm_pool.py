@@ -0,0 +1,199 @@
+"""
+Keep agents and engines alive between sessions.
+
+Building a session resolves agent ids, imports and instantiates every agent
+and builds (and mods) the engine. A WarmPool keeps the agents and engines of
+finished sessions and hands them to the next session that needs them:
+
+- agents are keyed by (agent id, hash of their code, player config), an agent
+  whose code changed in the database is built again. Code hashes are loaded
+  at most every code_check_interval seconds, a change is noticed within that time.
+  run_session loads the memories of reused agents from storage, like it does
+  for new ones.
+- engines are keyed by (game config, number of players), they are reset after
+  every game by play_games.
+
+Objects that are not used for max_idle_time seconds are evicted.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+
+from . import module_cache
+from .dynamic_agent import DynamicAgent
+from .persistence import storage
+
+DEFAULT_MAX_IDLE_TIME = 600
+DEFAULT_CODE_CHECK_INTERVAL = 60
+
+
+class WarmPool(object):
+    def __init__(self, max_idle_time=DEFAULT_MAX_IDLE_TIME, backend=None,
+                 code_check_interval=DEFAULT_CODE_CHECK_INTERVAL):
+        """
+        :param max_idle_time: (float) seconds after which unused agents and engines are evicted
+        :param backend: storage backend, defaults to storage.get_backend()
+        :param code_check_interval: (float) seconds a loaded code hash is used
+        """
+        self.max_idle_time = max_idle_time
+        self.backend = backend
+        self.code_check_interval = code_check_interval
+        # key: list of (last used, object), most recently used last
+        self.idle_agents = defaultdict(list)
+        self.idle_engines = defaultdict(list)
+        # (owner, name, game_type): agent id
+        self.agent_ids = {}
+        # agent id: (time loaded, hash of the agent's code in the database)
+        self.code_hashes = {}
+        # id of each agent and engine handed out: its key
+        self.keys = {}
+        self.num_created = 0
+        self.num_reused = 0
+        self.lock = threading.Lock()
+
+    def _get_backend(self):
+        if self.backend is None:
+            return storage.get_backend()
+        return self.backend
+
+    def get_agent_id(self, owner, name, game_type):
+        key = (owner, name, game_type)
+        if key not in self.agent_ids:
+            self.agent_ids[key] = str(self._get_backend().get_agent_id(owner=owner,
+                                                                       name=name,
+                                                                       game_type=game_type))
+        return self.agent_ids[key]
+
+    def get_agent_key(self, agent_id, player):
+        """
+        :return: (agent id, code hash, player config) of an agent
+        """
+        code_hash = None
+        if player.get("from_db"):
+            code_hash = self.get_code_hash(agent_id)
+        return agent_id, code_hash, json.dumps(player, sort_keys=True, default=str)
+
+    def get_code_hash(self, agent_id):
+        """
+        :return: hash of the agent's code in the database, None if it has no code
+        """
+        now = time.monotonic()
+        loaded, code_hash = self.code_hashes.get(agent_id, (None, None))
+        if loaded is None or now - loaded >= self.code_check_interval:
+            code = self._get_backend().load_agent_data(agent_id, "code")
+            code_hash = None
+            if code is not None:
+                code_hash = module_cache.get_code_hash(code)
+            self.code_hashes[agent_id] = (now, code_hash)
+        return code_hash
+
+    def get_agents(self, players_config, game_type):
+        """
+        like site_runner.assign_agents, but agents of earlier sessions are reused.
+        :return: tuple of (agent id, agent)
+        """
+        self.evict()
+        agents = []
+        for player in players_config:
+            agent_id = self.get_agent_id(player["owner"], player["name"], game_type)
+            key = self.get_agent_key(agent_id, player)
+            with self.lock:
+                idle = self.idle_agents[key]
+                agent = idle.pop()[1] if idle else None
+            reused = agent is not None
+            if not reused:
+                agent = DynamicAgent(agent_id=agent_id, **player)
+            with self.lock:
+                if reused:
+                    self.num_reused += 1
+                else:
+                    self.num_created += 1
+                self.keys[id(agent)] = key
+            agents.append((agent_id, agent))
+        return tuple(agents)
+
+    def get_engine(self, num_players, game_config, factory):
+        """
+        :param factory: function(num_players, game_config) building a new engine
+        :return: an idle engine for game_config, or a new one
+        """
+        self.evict()
+        key = (json.dumps(game_config, sort_keys=True), num_players)
+        with self.lock:
+            idle = self.idle_engines[key]
+            engine = idle.pop()[1] if idle else None
+        reused = engine is not None
+        if not reused:
+            engine = factory(num_players=num_players, game_config=game_config)
+        with self.lock:
+            if reused:
+                self.num_reused += 1
+            else:
+                self.num_created += 1
+            self.keys[id(engine)] = key
+        return engine
+
+    def release(self, agent_objects=(), engine=None):
+        """
+        return agents and an engine of a finished session to the pool.
+        """
+        now = time.monotonic()
+        with self.lock:
+            for _, agent in agent_objects:
+                key = self.keys.pop(id(agent), None)
+                if key is not None:
+                    self.idle_agents[key].append((now, agent))
+            if engine is not None:
+                key = self.keys.pop(id(engine), None)
+                if key is not None:
+                    self.idle_engines[key].append((now, engine))
+
+    def discard(self, agent_objects=(), engine=None):
+        """
+        forget agents and an engine that are not returned to the pool,
+        e.g. those of a failed session. Released objects are not affected.
+        """
+        with self.lock:
+            agents = [agent for _, agent in agent_objects
+                      if self.keys.pop(id(agent), None) is not None]
+            if engine is not None:
+                self.keys.pop(id(engine), None)
+        for agent in agents:
+            if isinstance(agent, DynamicAgent):
+                agent.close()
+
+    def evict(self, now=None):
+        """
+        remove agents and engines that were not used for max_idle_time seconds,
+        evicted agents are closed.
+        :return: number of evicted objects
+        """
+        if now is None:
+            now = time.monotonic()
+        cutoff = now - self.max_idle_time
+        evicted = []
+        with self.lock:
+            for idle_objects in (self.idle_agents, self.idle_engines):
+                for key in list(idle_objects):
+                    kept = [item for item in idle_objects[key] if item[0] >= cutoff]
+                    evicted.extend(item[1] for item in idle_objects[key] if item[0] < cutoff)
+                    if kept:
+                        idle_objects[key] = kept
+                    else:
+                        del idle_objects[key]
+        for obj in evicted:
+            if isinstance(obj, DynamicAgent):
+                obj.close()
+        return len(evicted)
+
+    def clear(self):
+        with self.lock:
+            agents = [agent for idle in self.idle_agents.values() for _, agent in idle]
+            self.idle_agents.clear()
+            self.idle_engines.clear()
+            self.agent_ids.clear()
+            self.code_hashes.clear()
+        for agent in agents:
+            if isinstance(agent, DynamicAgent):
+                agent.close()
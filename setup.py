@@ -82,9 +82,9 @@ setup(
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
     ],
 
     # This field adds keywords for your project which will appear on the
@@ -110,7 +110,10 @@ setup(
     #
     # For an analysis of "install_requires" vs pip's requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
-    install_requires=['pymongo'],  # Optional
+    install_requires=['pymongo>=3.9'],  # Optional
+
+    # asyncio.run and time.thread_time need python 3.7
+    python_requires='>=3.7',
 
     # List additional groups of dependencies here (e.g. development
     # dependencies). Users will be able to install these using the "extras"
@@ -123,6 +126,7 @@ setup(
     extras_require={  # Optional
         'dev': ['check-manifest'],
         'test': ['coverage', 'pytest'],
+        'batch': ['numpy'],
     },
 
     # If there are data files included in your packages that need to be
@@ -152,6 +156,9 @@ setup(
         'console_scripts': [
             'battleground_start=battleground.utils.start:go',
             'battleground_save=battleground.utils.save_agent:go',
+            'battleground_init_db=battleground.persistence.init_db:go',
+            'battleground_archive=battleground.persistence.retention:go',
+            'battleground_agent_server=battleground.remote_agent:go',
         ],
 
     },
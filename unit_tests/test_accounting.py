@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from battleground import accounting
+from battleground.game_runner import GameRunner
+from battleground.games.basic_game import basic_agent
+from battleground.games.basic_game.basic_game_engine import BasicGameEngine
+from battleground.persistence import storage
+from battleground.persistence.sqlite_backend import SQLiteBackend
+from battleground.persistence.writer import BackgroundWriter
+
+
+class SlowAgent(basic_agent.BasicAgent):
+    def move(self, state):
+        time.sleep(0.01)
+        return {"value": 12}
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """temporary database for testing"""
+    backend = SQLiteBackend(str(tmp_path / "test.db"))
+    storage.set_backend(backend)
+    yield backend
+    storage.set_backend(None)
+    backend.close()
+
+
+def get_players(backend):
+    return [(str(backend.get_agent_id("test_owner", "basic", "bg")), basic_agent.BasicAgent()),
+            (str(backend.get_agent_id("test_owner", "slow", "bg")), SlowAgent())]
+
+
+def test_measure():
+    result, wall_time, cpu_time, memory = accounting.measure(lambda n: [0] * n, 100000,
+                                                             track_memory=True)
+    assert len(result) == 100000
+    assert wall_time >= cpu_time >= 0
+    assert memory >= 100000 * 8
+
+
+def test_measure_without_reset_peak(monkeypatch):
+    # python before 3.9
+    monkeypatch.delattr(accounting.tracemalloc, "reset_peak", raising=False)
+    _, _, _, memory = accounting.measure(lambda n: [0] * n, 100000, track_memory=True)
+    assert memory >= 100000 * 8
+
+    with pytest.raises(ValueError):
+        accounting.AgentBudget(action="nothing")
+
+
+def test_accounting(backend):
+    players = get_players(backend)
+    runner = GameRunner(BasicGameEngine(num_players=2, type="bg"),
+                        players, accounting=True)
+    runner.run_game()
+
+    slow_usage = backend.load_agent_usage(players[1][0])
+    assert len(slow_usage) == 1
+    assert slow_usage[0]["num_moves"] == runner.usage[1].num_moves > 0
+    assert slow_usage[0]["wall_time"] >= 0.01 * slow_usage[0]["num_moves"]
+    assert slow_usage[0]["max_move_memory"] is None
+    assert slow_usage[0]["game_type"] == "bg"
+
+
+def test_budget_default_move(backend):
+    players = get_players(backend)
+    budget = accounting.AgentBudget(max_move_time=0.005)
+    runner = GameRunner(BasicGameEngine(num_players=2, type="bg"),
+                        players, budget=budget)
+    runner.run_game()
+
+    # the slow agent always plays the default move
+    usage = runner.usage[1]
+    assert usage.num_over_budget == usage.num_moves > 0
+    assert not usage.forfeited
+    assert runner.usage[0].num_over_budget == 0
+
+
+def test_budget_forfeit(backend):
+    players = get_players(backend)
+    budget = accounting.AgentBudget(max_game_time=0.005, action=accounting.ACTION_FORFEIT)
+    with BackgroundWriter() as writer:
+        runner = GameRunner(BasicGameEngine(num_players=2, type="bg"),
+                            players, budget=budget, writer=writer)
+        runner.run_game()
+
+    usage = runner.usage[1]
+    assert usage.forfeited
+    # the agent is not asked for moves after exceeding its budget
+    assert usage.num_moves == 1
+    assert usage.num_over_budget == 1
+
+    saved = backend.load_agent_usage(players[1][0], game_type="bg")
+    assert saved[0]["forfeited"]
+    leaderboard = {entry["name"]: entry for entry in backend.get_leaderboard("bg")}
+    assert leaderboard["slow"]["num_wins"] == 0
+    # the other agent wins, whatever the score of the forfeiting agent
+    assert leaderboard["basic"]["num_wins"] == 1
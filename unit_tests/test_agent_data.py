@@ -12,6 +12,7 @@ def db_handle():
     db_handle = game_data.get_db_handle("test_db_handle")
     yield db_handle
     client.drop_database("test_db_handle")
+    agent_data.clear_agent_id_cache()
 
 
 def test_get_agent_id(db_handle):
@@ -40,6 +41,31 @@ def test_no_duplicate_ids(db_handle):
     assert len(result) == 1
 
 
+def test_agent_id_cache(db_handle):
+    agent_id = agent_data.get_agent_id(owner, name, game_type, db_handle)
+
+    # a cached id does not touch the database
+    agent_data.clear_agent_id_cache()
+    agent_id = agent_data.get_agent_id(owner, name, game_type, db_handle)
+    db_handle.agents.update_one({"_id": agent_id}, {"$set": {"name": "renamed"}})
+    assert agent_data.get_agent_id(owner, name, game_type, db_handle) == agent_id
+    db_handle.agents.update_one({"_id": agent_id}, {"$set": {"name": name}})
+
+    index_info = db_handle.agents.index_information()
+    assert index_info["owner_name_game_type"]["unique"]
+
+
+def test_delete_agent(db_handle):
+    agent_id = agent_data.get_agent_id(owner, "deleted_name", game_type, db_handle)
+    agent_data.save_game_result(agent_id, "game_1", game_type, 10, True, db_handle=db_handle)
+
+    agent_data.delete_agent(agent_id, db_handle)
+    assert db_handle.agents.find_one(agent_id) is None
+    assert db_handle.leaderboard.find_one({"agent_id": agent_id}) is None
+    # the cached id of a deleted agent is not reused
+    assert agent_data.get_agent_id(owner, "deleted_name", game_type, db_handle) != agent_id
+
+
 def test_get_agents(db_handle):
     global owner, name, game_type
 
@@ -85,6 +111,74 @@ def test_save_game_result(db_handle):
                                 db_handle=db_handle)
 
 
+def test_save_game_results(db_handle):
+    agent_id = agent_data.get_agent_id(owner, "bulk_name", game_type, db_handle)
+    other_id = agent_data.get_agent_id(owner, "bulk_name_2", game_type, db_handle)
+    results = [(agent_id, "game_1", game_type, 10, True),
+               (other_id, "game_1", game_type, 4, False),
+               (agent_id, "game_2", game_type, 20, False),
+               (other_id, "game_2", game_type, 30, True)]
+    agent_data.save_game_results(results, db_handle=db_handle)
+
+    agent = db_handle.agents.find_one(agent_id)
+    assert agent["results"]["num_games"] == 2
+    assert agent["results"]["num_wins"] == 1
+    assert agent["results"]["total_score"] == 30
+    assert agent["results"]["avg_score"] == 15
+
+    other = db_handle.agents.find_one(other_id)
+    assert other["results"]["num_games"] == 2
+    assert other["results"]["total_score"] == 34
+    assert other["results"]["avg_score"] == 17
+
+    agents = {agent["_id"]: agent for agent in agent_data.get_agents(owner, db_handle)}
+    assert agents[agent_id]["results"]["avg_score"] == 15
+    assert agents[other_id]["results"]["avg_score"] == 17
+
+
+def test_old_results(db_handle):
+    agent_id = agent_data.get_agent_id(owner, "old_name", game_type, db_handle)
+    # results saved before total_score was counted
+    db_handle.agents.update_one({"_id": agent_id}, {"$set": {"results": {
+        "num_games": 2, "avg_score": 10, "num_wins": 1}}})
+    agent_data.save_game_result(agent_id, "game_1", game_type, 40, True, db_handle=db_handle)
+
+    results = db_handle.agents.find_one(agent_id)["results"]
+    assert results["num_games"] == 3
+    assert results["avg_score"] == 20
+    assert results["total_score"] == 60
+
+
+def test_average_score():
+    # counters only
+    assert agent_data.get_average_score({"num_games": 2, "total_score": 30, "num_scored": 2}) == 15
+    # one game counted on top of an old average, before the refresh
+    assert agent_data.get_average_score({"num_games": 3, "avg_score": 10,
+                                         "total_score": 40, "num_scored": 1}) == 20
+
+
+def test_leaderboard(db_handle):
+    agent_id = agent_data.get_agent_id(owner, "leader_name", "leader_type", db_handle)
+    other_id = agent_data.get_agent_id(owner, "leader_name_2", "leader_type", db_handle)
+    results = [(agent_id, "game_1", "leader_type", 10, True),
+               (other_id, "game_1", "leader_type", 4, False),
+               (agent_id, "game_2", "leader_type", 20, True),
+               (other_id, "game_2", "leader_type", 30, False)]
+    agent_data.save_game_results(results, db_handle=db_handle)
+
+    leaderboard = agent_data.get_leaderboard("leader_type", db_handle=db_handle)
+    assert [entry["name"] for entry in leaderboard] == ["leader_name", "leader_name_2"]
+    assert leaderboard[0]["win_rate"] == 1
+
+    leaderboard = agent_data.get_leaderboard("leader_type", sort_by="avg_score",
+                                             limit=1, db_handle=db_handle)
+    assert len(leaderboard) == 1
+    assert leaderboard[0]["agent_id"] == other_id
+    assert leaderboard[0]["avg_score"] == 17
+
+    assert owner in agent_data.get_owners(db_handle)
+
+
 def test_get_game_stats(db_handle):
     game_stats = agent_data.load_game_results(game_type, db_handle=db_handle)
 
@@ -7,6 +7,9 @@ from battleground.games.arena.dungeon import Dungeon
 from battleground.games.arena.gladiator import Gladiator
 from battleground.games.arena.arena_agent import ArenaAgent
 
+from battleground.games.arena.mods.mod_builder import modded_class_factory
+
+import copy
 import random
 
 
@@ -108,9 +111,80 @@ def test_game():
     assert True
 
 
+def play(engine, num_moves):
+    agent = ArenaAgent()
+    for _ in range(num_moves):
+        if engine.game_over():
+            break
+        engine.move(agent.move(engine.get_state()))
+
+
+def test_clone():
+    mod_paths = ["battleground.games.arena.mods.position",
+                 "battleground.games.arena.mods.boosts",
+                 "battleground.games.arena.mods.perception"]
+    engines = [ArenaGameEngine(num_players=3),
+               modded_class_factory(ArenaGameEngine, mod_paths)(num_players=3)]
+    for engine in engines:
+        play(engine, 5)
+        state = copy.deepcopy(engine.get_state())
+
+        clone = engine.clone()
+        assert clone.get_state() == state
+        snapshot = clone.snapshot()
+        play(clone, 20)
+        assert engine.get_state() == state
+
+        clone.restore(snapshot)
+        assert clone.get_state() == state
+        play(clone, 20)
+        clone.restore(snapshot)
+        assert clone.get_state() == state
+
+        for glad, cloned_glad in zip(engine.gladiators, clone.gladiators):
+            assert glad is not cloned_glad
+
+
+def test_event_queue():
+    engine = ArenaGameEngine(num_players=6)
+    play(engine, 10)
+
+    queue = engine.get_state()["queue"]
+    times = [t for t, _ in queue]
+    assert times == sorted(times)
+    assert [(t, e.get_init()) for t, e in engine.get_queue()] == queue
+
+    # the sorted queue is reused until the queue changes
+    assert engine.get_queue() is engine.get_queue()
+    sorted_queue = engine.get_queue()
+
+    # events at the same time are handled in the order they were queued
+    first = engine.event_class(owner=0, type="stay")
+    second = engine.event_class(owner=1, type="stay")
+    engine.push_event(-1, first)
+    engine.push_event(-1, second)
+    assert engine.get_queue()[:2] == [(-1, first), (-1, second)]
+    assert engine.get_queue() is not sorted_queue
+    assert engine.pop_event() == (-1, first)
+    assert engine.pop_event() == (-1, second)
+
+    # an engine created from the state has the same queue
+    state = engine.get_state()
+    copied = ArenaGameEngine(num_players=6, state={"gladiators": state["gladiators"],
+                                                   "queue": state["queue"]})
+    assert copied.get_state()["queue"] == state["queue"]
+
+    alive_events = [(t, e) for t, e in engine.get_queue() if e.owner != 0]
+    engine.gladiators[0].cur_hp = 0
+    engine.remove_dead()
+    assert engine.get_queue() == alive_events
+    assert engine.peek_event() == alive_events[0]
+
+
 if __name__ == "__main__":
     test_engine()
     test_dungeon()
     test_gladiator()
     test_player()
     test_game()
+    test_clone()
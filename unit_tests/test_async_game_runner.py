@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+from battleground import accounting
+from battleground.agent import Agent
+from battleground.async_game_runner import AsyncGameRunner, run_games
+from battleground.games.basic_game.basic_game_engine import BasicGameEngine
+from battleground.games.basic_game import basic_agent
+
+
+class AsyncAgent(Agent):
+    def __init__(self, delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.num_observed = 0
+
+    async def move(self, state):
+        await asyncio.sleep(self.delay)
+        return {"value": 10}
+
+    async def observe(self, state):
+        self.num_observed += 1
+
+
+class SlowAgent(Agent):
+    def move(self, state):
+        time.sleep(0.05)
+        return {"value": 10}
+
+
+def test_game():
+    players = [(i, AsyncAgent()) for i in range(3)]
+    engine = BasicGameEngine(num_players=3, type="bg")
+    runner = AsyncGameRunner(engine, players, save=False)
+    scores = asyncio.run(runner.run_game())
+    assert len(scores) == 3
+    assert engine.game_over()
+    assert players[0][1].num_observed == engine.turn
+    assert len(runner.game_states) == engine.turn + 1
+
+
+def test_concurrent_games():
+    runners = []
+    for _ in range(100):
+        players = [(i, AsyncAgent(delay=0.001)) for i in range(2)]
+        engine = BasicGameEngine(num_players=2, type="bg")
+        runners.append(AsyncGameRunner(engine, players, save=False, max_turns=20))
+    all_scores = asyncio.run(run_games(runners))
+    assert len(all_scores) == 100
+    for runner in runners:
+        assert runner.game_engine.turn <= 20
+
+
+def test_move_timeout():
+    players = [(0, AsyncAgent(delay=1)), (1, SlowAgent()), (2, basic_agent.BasicAgent())]
+    engine = BasicGameEngine(num_players=3, type="bg")
+    runner = AsyncGameRunner(engine, players, save=False,
+                             move_timeout=0.01, max_turns=10)
+    asyncio.run(runner.run_game())
+    assert engine.turn == 10
+    assert runner.num_timeouts[0] > 0
+    assert runner.num_timeouts[1] > 0
+    assert runner.num_timeouts[2] == 0
+    for state in runner.game_states[1:]:
+        assert "value" in state["last_move"]
+
+
+def test_max_turns_recording():
+    for recording in ["final", "sampled"]:
+        players = [(i, AsyncAgent()) for i in range(2)]
+        engine = BasicGameEngine(num_players=2, type="bg")
+        runner = AsyncGameRunner(engine, players, save=False, max_turns=7,
+                                 recording=recording, sample_interval=5)
+        asyncio.run(runner.run_game())
+
+        assert engine.turn == 7
+        assert runner.game_states[-1]["game_over"] == "True"
+        assert runner.game_states[-1]["game_state"]["turn"] == 7
+
+
+def test_budget():
+    players = [(0, AsyncAgent(delay=0.02)), (1, SlowAgent()), (2, basic_agent.BasicAgent())]
+    engine = BasicGameEngine(num_players=3, type="bg")
+    budget = accounting.AgentBudget(max_move_time=0.01)
+    # the default move ends the player's turn
+    runner = AsyncGameRunner(engine, players, save=False, max_turns=10,
+                             move_timeout=1, budget=budget, default_move={"value": 1000})
+    asyncio.run(runner.run_game())
+
+    # the slow agents always play the default move
+    for usage in runner.usage[:2]:
+        assert usage.num_over_budget == usage.num_moves > 0
+        assert usage.wall_time >= 0.02 * usage.num_moves
+    # sleeping does not use CPU time
+    assert runner.usage[1].cpu_time < 0.01 * runner.usage[1].num_moves
+    assert runner.usage[2].num_over_budget == 0
+    assert runner.game_states[1]["last_move"] == {"value": 1000}
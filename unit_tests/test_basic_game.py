@@ -1,4 +1,6 @@
 
+import pytest
+
 from battleground.games.basic_game.basic_game_engine import BasicGameEngine
 from battleground.games.basic_game import basic_agent
 
@@ -15,6 +17,22 @@ def test_engine():
     assert bge.get_game_name() == "bg"
 
 
+def test_clone():
+    bge = BasicGameEngine(num_players=2, type="bg")
+    bge.move({"value": 1})
+    state = bge.get_state()
+
+    clone = bge.clone()
+    snapshot = clone.snapshot()
+    for _ in range(10):
+        clone.move({"value": 5})
+    assert bge.get_state() == state
+    assert clone.turn == bge.turn + 10
+
+    clone.restore(snapshot)
+    assert clone.get_state() == state
+
+
 def test_player():
     bge = BasicGameEngine(num_players=2, type="bg")
     player = basic_agent.BasicAgent()
@@ -45,3 +63,35 @@ def test_game():
             assert state["last_move"] is None
         else:
             assert isinstance(state["last_move"], dict)
+
+
+def test_recording_levels():
+    for recording, sample_interval in [("none", 1), ("final", 1), ("sampled", 5)]:
+        players = []
+        for i in range(3):
+            players.append((i, basic_agent.BasicAgent()))
+        engine = BasicGameEngine(num_players=3, type="bg")
+        runner = GameRunner(engine, players, save=False,
+                            recording=recording, sample_interval=sample_interval)
+        scores = runner.run_game()
+        assert len(scores) == 3
+
+        if recording == "none":
+            assert len(runner.game_states) == 0
+        elif recording == "final":
+            assert len(runner.game_states) == 1
+            assert runner.game_states[0]["game_over"] == "True"
+        else:
+            assert len(runner.game_states) == engine.turn // sample_interval + 1 \
+                or len(runner.game_states) == engine.turn // sample_interval + 2
+            assert runner.game_states[0]["last_move"] is None
+            assert runner.game_states[-1]["game_over"] == "True"
+            assert runner.game_states[-1]["game_state"]["scores"] == scores
+
+
+def test_sample_interval():
+    players = [(i, basic_agent.BasicAgent()) for i in range(2)]
+    for sample_interval in [0, -1]:
+        with pytest.raises(ValueError):
+            GameRunner(BasicGameEngine(num_players=2, type="bg"), players,
+                       recording="sampled", sample_interval=sample_interval)
@@ -0,0 +1,57 @@
+import pytest
+import random
+
+from battleground.games.basic_game import basic_game_engine
+from battleground.games.basic_game.basic_game_engine import BasicGameEngine
+
+np = pytest.importorskip("numpy")
+from battleground.games.basic_game.batch_game_engine import BatchBasicGameEngine
+
+
+def test_engine():
+    engine = BatchBasicGameEngine(num_games=10, num_players=3, seed=1)
+    assert engine.scores.shape == (10, 3)
+    assert not engine.game_over().any()
+
+    # a value above the maximum roll always passes to the next player
+    engine.move(np.full(10, 200))
+    assert (engine.current_player == 1).all()
+    assert (engine.scores == 0).all()
+    assert (engine.turn == 1).all()
+
+    scores = engine.play([10, 12, 15])
+    assert engine.game_over().all()
+    assert (scores.max(axis=1) >= 100).all()
+    assert engine.get_winners().any(axis=1).all()
+
+
+def test_equivalence(monkeypatch):
+    """
+    play the same games with the same rolls on the batch engine
+    and on the scalar engine and compare the results.
+    """
+    num_games, num_players, max_range = 200, 3, 25
+    thresholds = np.array([[random.randint(1, 20) for _ in range(num_players)]
+                           for _ in range(num_games)])
+    game_index = np.arange(num_games)
+    rng = np.random.default_rng(0)
+
+    batch = BatchBasicGameEngine(num_games, num_players, max_range=max_range)
+    all_rolls = []
+    while not batch.game_over().all():
+        rolls = rng.integers(1, max_range + 1, size=num_games)
+        all_rolls.append(rolls)
+        batch.move(thresholds[game_index, batch.current_player], rolls=rolls)
+
+    for i in range(num_games):
+        game_rolls = iter([int(rolls[i]) for rolls in all_rolls])
+        monkeypatch.setattr(basic_game_engine.random, "randint",
+                            lambda low, high: next(game_rolls))
+
+        engine = BasicGameEngine(num_players=num_players, type="bg", max_range=max_range)
+        while not engine.game_over():
+            engine.move({"value": int(thresholds[i][engine.get_current_player()])})
+
+        assert engine.scores == batch.scores[i].tolist()
+        assert engine.turn == batch.turn[i]
+        assert engine.get_current_player() == batch.current_player[i]
@@ -303,6 +303,20 @@ def test_last_round():
     assert engine.game_over()
 
 
+def test_clone():
+    engine = dice_game.DiceGame(num_players=2, type="Bunnies")
+    state = copy.deepcopy(engine.get_state())
+
+    clone = engine.clone()
+    snapshot = clone.snapshot()
+    for _ in range(10):
+        clone.move(clone.get_default_move())
+    assert engine.get_state() == state
+
+    clone.restore(snapshot)
+    assert clone.get_state() == state
+
+
 if __name__ == "__main__":
     test_reset()
     test_score()
@@ -312,4 +326,5 @@ if __name__ == "__main__":
     test_move_bunnies()
     test_move_hutches()
     test_last_round()
+    test_clone()
     # test_game_over()
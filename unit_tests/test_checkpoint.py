@@ -0,0 +1,62 @@
+import pytest
+
+from battleground.persistence import storage
+from battleground.persistence.checkpoint import MemoryCheckpointer, get_memory_patch
+from battleground.persistence.sqlite_backend import SQLiteBackend
+from battleground.games.basic_game.basic_game_engine import BasicGameEngine
+from battleground.games.basic_game.basic_persistent_agent import PersistentAgent
+from battleground import site_runner
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """temporary database for testing"""
+    backend = SQLiteBackend(str(tmp_path / "test.db"))
+    storage.set_backend(backend)
+    yield backend
+    storage.set_backend(None)
+    backend.close()
+
+
+def test_memory_patch():
+    assert get_memory_patch({"a": 1, "b": [1]},
+                            {"a": 2, "b": [1], "c": 3}) == ({"a": 2, "c": 3}, [])
+    assert get_memory_patch({"a": 1, "b": 2}, {"a": 1}) == ({}, ["b"])
+    assert get_memory_patch({}, {"a.b": 1}) is None
+
+
+def test_checkpoint(backend):
+    agent_id = str(backend.get_agent_id("test_owner", "test_name", "bg"))
+    backend.save_agent_data(agent_id, {"guess": 5, "notes": "x" * 100}, "memory")
+    agent = PersistentAgent()
+    site_runner.load_memories([(agent_id, agent)])
+    checkpointer = MemoryCheckpointer([(agent_id, agent)], interval=2, max_size=1000)
+
+    # unchanged memories are not written
+    assert checkpointer.checkpoint() == 0
+
+    agent.get_memory()["guess"] = 6
+    checkpointer.game_finished()
+    assert checkpointer.num_writes == 0
+    checkpointer.game_finished()
+    assert checkpointer.num_writes == 1
+    assert backend.load_agent_data(agent_id, "memory") == {"guess": 6, "notes": "x" * 100}
+
+    del agent.get_memory()["notes"]
+    assert checkpointer.checkpoint() == 1
+    assert backend.load_agent_data(agent_id, "memory") == {"guess": 6}
+
+    # too large
+    agent.get_memory()["notes"] = "x" * 2000
+    assert checkpointer.checkpoint() == 0
+    assert backend.load_agent_data(agent_id, "memory") == {"guess": 6}
+
+
+def test_session_checkpoints(backend):
+    agent_objects = [(str(backend.get_agent_id("test_owner", str(i), "bg")), PersistentAgent())
+                     for i in range(2)]
+    engine = BasicGameEngine(num_players=2, type="bg")
+    site_runner.run_session(engine, agent_objects, 4, checkpoint_interval=2)
+
+    for agent_id, agent in agent_objects:
+        assert backend.load_agent_data(agent_id, "memory") == agent.get_memory()
@@ -1,6 +1,15 @@
+import inspect
+import sys
+
+import pytest
+
+from battleground import agent_worker, module_cache
 from battleground.dynamic_agent import DynamicAgent
+from battleground.game_runner import GameRunner
+from battleground.games.basic_game.basic_game_engine import BasicGameEngine
 from battleground.games.basic_game.basic_agent import BasicAgent
-from battleground.persistence import agent_data
+from battleground.persistence import agent_data, storage
+from battleground.persistence.sqlite_backend import SQLiteBackend
 from battleground.agent import Agent
 
 
@@ -50,3 +59,111 @@ def test_dynamic_agent_database():
 
     assert isinstance(dynamic_agent.agent_instance, Agent)
     assert isinstance(dynamic_agent.move(None), dict)
+
+
+def test_dynamic_agent_module_cache(tmp_path, monkeypatch):
+    backend = SQLiteBackend(str(tmp_path / "test.db"))
+    storage.set_backend(backend)
+    monkeypatch.setattr(module_cache, "MODULE_CACHE_SIZE", 2)
+    try:
+        with open("battleground/games/basic_game/basic_agent.py", 'r') as file:
+            code_string = file.read()
+        backend.save_agent_code("test_owner", "test_agent", "test_game", code_string)
+
+        agents = [DynamicAgent(owner="test_owner",
+                               name="test_agent",
+                               game_type="test_game",
+                               class_name="BasicAgent",
+                               from_db=True) for _ in range(2)]
+        # compiled once, not imported from a file
+        assert type(agents[0].agent_instance) is type(agents[1].agent_instance)
+        assert isinstance(agents[0].move(None), dict)
+        module = inspect.getmodule(agents[0].agent_instance)
+        assert module is module_cache.load_module(code_string)
+        assert module.__name__ in sys.modules
+
+        for i in range(2):
+            module_cache.load_module("x = {}".format(i))
+        assert module.__name__ not in sys.modules
+        assert module_cache.load_module(code_string) is not module
+        assert isinstance(agents[0].move(None), dict)
+    finally:
+        storage.set_backend(None)
+        backend.close()
+        module_cache.clear()
+
+
+def test_dynamic_agent_worker_pool():
+    config = {
+        "owner": "test_owner",
+        "name": "test_agent",
+        "class_name": "BasicAgent",
+        "local_path": "battleground.games.basic_game.basic_agent",
+        "agent_id": "test_agent_id"
+    }
+    pool = agent_worker.get_pool("test_pool", num_workers=2)
+    try:
+        agents = [DynamicAgent(queue_prefix="test_pool", **config) for _ in range(3)]
+        assert isinstance(agents[0].agent_instance, agent_worker.AgentProxy)
+        assert len(pool.workers) == 2
+
+        state = {"move_options": {"values": [1, 2]}}
+        for dynamic_agent in agents:
+            dynamic_agent.observe(state)
+            assert dynamic_agent.move(state)["value"] in [1, 2]
+
+        agents[0].set_memory({"games": 1})
+        assert agents[0].get_memory() == {"games": 1}
+        assert agents[1].get_memory() is None
+
+        # an error in the agent is raised in the runner
+        with pytest.raises(agent_worker.AgentWorkerError):
+            agents[0].move({"move_options": None})
+        assert isinstance(agents[0].move(state), dict)
+
+        # a crashed worker only affects its own agents
+        worker = agents[0].agent_instance.worker
+        worker.process.kill()
+        worker.process.join()
+        with pytest.raises(agent_worker.AgentWorkerError):
+            agents[0].move(state)
+        other = [a for a in agents if a.agent_instance.worker is not worker][0]
+        assert isinstance(other.move(state), dict)
+
+        # the crashed worker is replaced by the next agent
+        replacement = DynamicAgent(queue_prefix="test_pool", **config)
+        assert worker not in pool.workers
+        assert isinstance(replacement.move(state), dict)
+
+        # closed agents are removed from their worker
+        num_agents = other.agent_instance.worker.num_agents
+        other.close()
+        other.close()
+        assert other.agent_instance.worker.num_agents == num_agents - 1
+        with pytest.raises(agent_worker.AgentWorkerError):
+            other.move(state)
+    finally:
+        agent_worker.close_pools()
+
+
+def test_worker_agent_default_move():
+    config = {
+        "owner": "test_owner",
+        "name": "test_agent",
+        "class_name": "BasicAgent",
+        "local_path": "battleground.games.basic_game.basic_agent",
+        "agent_id": "test_agent_id"
+    }
+    try:
+        crashed = DynamicAgent(queue_prefix="test_default_pool", **config)
+        worker = crashed.agent_instance.worker
+        worker.process.kill()
+        worker.process.join()
+
+        players = [("crashed_id", crashed), ("basic_id", BasicAgent())]
+        engine = BasicGameEngine(num_players=2, type="bg")
+        scores = GameRunner(engine, players, save=False).run_game()
+        # the agent of the crashed worker passes on every move
+        assert scores[0] == 0
+    finally:
+        agent_worker.close_pools()
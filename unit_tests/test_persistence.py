@@ -1,5 +1,6 @@
 import pytest
-from battleground.persistence import game_data
+from battleground.persistence import game_data, init_db, retention
+import datetime
 import random
 
 
@@ -19,6 +20,25 @@ def test_connection():
     assert isinstance(connection_info, dict)
 
 
+def test_client_per_process(monkeypatch):
+    """a client is re-created after fork and with new options"""
+
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "7")
+    game_data.configure_client(serverSelectionTimeoutMS=500)
+    client = game_data.get_client()
+    assert game_data.get_client() is client
+    assert client.options.pool_options.max_pool_size == 7
+    assert client.options.server_selection_timeout == 0.5
+
+    # as seen from a forked child process
+    monkeypatch.setattr(game_data, "_client_pid", -1)
+    assert game_data.get_client() is not client
+
+    game_data.configure_client()
+    assert game_data.get_client().options.server_selection_timeout != 0.5
+    game_data.reset_client()
+
+
 def test_game_id(db_handle):
     """generate a unique ID"""
 
@@ -75,6 +95,118 @@ def test_save_game_history(db_handle):
         assert state["last_move"] == loaded_states[i]["last_move"]
 
 
+def test_save_game_chunks(db_handle):
+    """save a sequence of game states as compressed chunks"""
+
+    test_states = []
+    for i in range(25):
+        test_states.append({"game_state": {"k_a": random.randint(0, 1000)},
+                            "last_move": {"k_move": random.randint(0, 1000)}})
+
+    game_id = game_data.save_game_history(
+        "test_game", test_states, db_handle=db_handle,
+        storage=game_data.STORAGE_CHUNKS, chunk_size=10)
+
+    num_chunks = db_handle.game_state_chunks.count_documents({"game_id": game_id})
+    assert num_chunks == 3
+
+    loaded_states = game_data.load_game_history(game_id, db_handle=db_handle)
+    assert len(loaded_states) == 25
+    for i, state in enumerate(test_states):
+        assert loaded_states[i]["sequence"] == i
+        assert state["game_state"] == loaded_states[i]["game_state"]
+        assert state["last_move"] == loaded_states[i]["last_move"]
+
+
+def test_iter_game_history(db_handle):
+    """read a range of states"""
+
+    test_states = [{"game_state": {"k_a": i}, "last_move": {"k_move": i}}
+                   for i in range(30)]
+    for storage in game_data.STORAGE_FORMATS:
+        game_id = game_data.save_game_history(
+            "test_game", test_states, db_handle=db_handle,
+            storage=storage, chunk_size=8)
+
+        states = list(game_data.iter_game_history(game_id, start=10, stop=20,
+                                                  fields=["game_state"],
+                                                  batch_size=3,
+                                                  db_handle=db_handle))
+        assert [state["sequence"] for state in states] == list(range(10, 20))
+        assert [state["game_state"]["k_a"] for state in states] == list(range(10, 20))
+        assert "last_move" not in states[0]
+
+
+def test_history_format(db_handle):
+    """every storage format loads the same states"""
+
+    test_states = [{"game_state": {"k_a": i}, "last_move": {"k_move": i},
+                    "player_ids": ["a", "b"], "game_over": str(i == 9)}
+                   for i in range(10)]
+    for storage in game_data.STORAGE_FORMATS:
+        game_id = game_data.save_game_history(
+            "test_game", test_states, db_handle=db_handle, storage=storage)
+
+        loaded_states = game_data.load_game_history(game_id, db_handle=db_handle)
+        for i, state in enumerate(test_states):
+            assert loaded_states[i] == dict(state, sequence=i, game_id=game_id,
+                                            game_type="test_game")
+
+
+def test_init_db(db_handle):
+    """indexes and migrations can be applied repeatedly"""
+
+    assert init_db.init_db(db_handle, db_handle) == []
+    assert init_db.run_migrations(db_handle, db_handle) == []
+    assert init_db.init_db(db_handle, db_handle) == []
+
+    index_info = db_handle.game_states.index_information()
+    assert index_info["game_id_1_sequence_1"]["unique"]
+
+
+def test_plan_stages():
+    classic_plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+    assert init_db.get_plan_stages(classic_plan) == ["FETCH", "IXSCAN"]
+    sbe_plan = {"queryPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}},
+                "slotBasedPlan": {}}
+    assert init_db.get_plan_stages(sbe_plan) == ["SORT", "COLLSCAN"]
+
+
+def test_downsample():
+    states = [{"sequence": i} for i in range(12)]
+    kept = retention.downsample(states, 5)
+    assert [state["sequence"] for state in kept] == [0, 5, 10, 11]
+
+    docs = retention.get_archive_docs("game_id", "test_game", kept, chunk_size=3)
+    assert [(doc["start"], doc["stop"]) for doc in docs] == [(0, 11), (11, 12)]
+
+
+def test_archive_games(db_handle):
+    """archived games are read from the archive"""
+
+    test_states = [{"game_state": {"k_a": i}, "last_move": {"k_move": i}}
+                   for i in range(30)]
+    game_ids = [game_data.save_game_history("test_archive", test_states, db_handle=db_handle,
+                                            storage=storage, chunk_size=8)
+                for storage in game_data.STORAGE_FORMATS]
+    old = datetime.datetime.utcnow() - datetime.timedelta(days=100)
+    db_handle.games.update_many({"_id": {"$in": game_ids}}, {"$set": {"created_at": old}})
+
+    assert retention.archive_games(max_age_days=50, db_handle=db_handle) == 2
+    assert retention.archive_games(max_age_days=50, db_handle=db_handle) == 0
+    for game_id in game_ids:
+        assert db_handle.game_states.count_documents({"game_id": game_id}) == 0
+        loaded_states = game_data.load_game_history(game_id, db_handle=db_handle)
+        assert [state["game_state"] for state in loaded_states] == \
+            [state["game_state"] for state in test_states]
+
+    game = db_handle.games.find_one(game_ids[0])
+    assert retention.archive_game(game, keyframe_interval=10, db_handle=db_handle) == 4
+    loaded_states = list(game_data.iter_game_history(game_ids[0], start=5, stop=25,
+                                                     db_handle=db_handle))
+    assert [state["sequence"] for state in loaded_states] == [10, 20]
+
+
 def test_game_list(db_handle):
     """get list of games"""
 
@@ -87,6 +219,25 @@ def test_game_list(db_handle):
         assert "utc_time" in doc
 
 
+def test_list_games(db_handle):
+    """list games one page at a time"""
+
+    game_ids = [game_data.save_game_history("test_list_games", [], db_handle=db_handle)
+                for _ in range(25)]
+
+    listed = []
+    after = None
+    while True:
+        games, after = game_data.list_games(game_type="test_list_games", after=after,
+                                            limit=10, db_handle=db_handle)
+        listed.extend(games)
+        if after is None:
+            break
+    assert [game["_id"] for game in listed] == game_ids[::-1]
+    assert "chunk_offsets" not in listed[0]
+    assert "created_at" in listed[0]
+
+
 def test_game_list_selector(db_handle):
     """get list of games"""
 
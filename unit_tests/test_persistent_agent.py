@@ -14,6 +14,7 @@ def db_handle():
     db_handle = game_data.get_db_handle("test_db_handle")
     yield db_handle
     client.drop_database("test_db_handle")
+    agent_data.clear_agent_id_cache()
 
 
 def test_memory_set():
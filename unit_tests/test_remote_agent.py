@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from battleground import remote_agent
+from battleground.agent import Agent
+from battleground.dynamic_agent import DynamicAgent
+from battleground.game_runner import GameRunner
+from battleground.games.basic_game.basic_game_engine import BasicGameEngine
+from battleground.games.basic_game.basic_agent import BasicAgent
+
+
+class BrokenAgent(Agent):
+    def move(self, state):
+        raise Exception("broken")
+
+
+class SlowAgent(Agent):
+    def move(self, state):
+        time.sleep(0.2)
+        return {"value": 1}
+
+
+class ObservingAgent(Agent):
+    def __init__(self):
+        super().__init__()
+        self.observed = []
+
+    def move(self, state):
+        return {"observed": self.observed}
+
+    def observe(self, state):
+        self.observed.append(state)
+
+
+@pytest.fixture
+def server():
+    agent_server = remote_agent.AgentServer({"basic": BasicAgent(),
+                                              "observer": ObservingAgent(),
+                                              "broken": BrokenAgent(),
+                                              "slow": SlowAgent()})
+    agent_server.start()
+    yield agent_server
+    remote_agent.close_connections()
+    agent_server.stop()
+
+
+def get_agent(server, name, **kwargs):
+    return DynamicAgent(owner="test_owner",
+                        name=name,
+                        agent_id="test_agent_id",
+                        remote_path="{}/{}".format(server.address, name),
+                        **kwargs)
+
+
+def test_remote_agent(server):
+    basic = get_agent(server, "basic")
+    observer = get_agent(server, "observer")
+    assert isinstance(basic.agent_instance, remote_agent.RemoteAgent)
+
+    state = {"move_options": {"values": [1, 2]}}
+    for _ in range(3):
+        assert basic.move(state)["value"] in [1, 2]
+
+    # observe does not wait for a reply but arrives before the next move
+    for i in range(5):
+        observer.observe({"turn": i})
+    assert observer.move(None) == {"observed": [{"turn": i} for i in range(5)]}
+
+    basic.set_memory({"games": 1})
+    assert basic.get_memory() == {"games": 1}
+
+    stats = basic.agent_instance.get_latency_stats()
+    assert stats["num_requests"] == 6
+    assert 0 < stats["mean_latency"] <= stats["max_latency"]
+
+    # both agents share one connection
+    assert basic.agent_instance.connection is observer.agent_instance.connection
+    assert basic.agent_instance.connection.num_connects == 1
+
+
+def test_remote_agent_errors(server):
+    basic = get_agent(server, "basic")
+    with pytest.raises(remote_agent.RemoteAgentError):
+        basic.move({"move_options": None})
+    assert isinstance(basic.move(None), dict)
+
+    with pytest.raises(remote_agent.RemoteAgentError):
+        get_agent(server, "missing")
+
+    # a broken connection is opened again on the next request
+    basic.agent_instance.connection.sock.close()
+    with pytest.raises(remote_agent.RemoteAgentError):
+        basic.move(None)
+    assert isinstance(basic.move(None), dict)
+    assert basic.agent_instance.connection.num_connects == 2
+
+
+def test_remote_agent_timeout(server):
+    slow = get_agent(server, "slow", remote_timeout=0.05)
+    with pytest.raises(remote_agent.RemoteAgentError):
+        slow.move(None)
+    # the late reply is not mistaken for the reply of the next request
+    assert slow.agent_instance.connection.sock is None
+    assert get_agent(server, "slow").move(None) == {"value": 1}
+
+
+def test_remote_agent_default_move(server):
+    players = [("broken_id", get_agent(server, "broken")), ("basic_id", BasicAgent())]
+    engine = BasicGameEngine(num_players=2, type="bg")
+    scores = GameRunner(engine, players, save=False).run_game()
+    # the broken agent passes on every move
+    assert scores[0] == 0
+
+
+def test_parse_remote_path():
+    assert remote_agent.parse_remote_path("tcp://localhost:9000/agent") == \
+        ("localhost", 9000, "agent")
+    assert not remote_agent.is_remote_path("battleground/games/basic_game/basic_agent.py")
+    with pytest.raises(ValueError):
+        remote_agent.parse_remote_path("tcp://localhost/agent")
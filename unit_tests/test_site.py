@@ -1,7 +1,9 @@
 import battleground.site_runner as site_runner
 from battleground.dynamic_agent import DynamicAgent
 from battleground.games.basic_game.basic_game_engine import BasicGameEngine
+from battleground.games.basic_game.basic_agent import BasicAgent
 import json
+import pytest
 import os.path
 
 DEFAULT_CONFIG_PATH = "battleground/config/"
@@ -65,5 +67,41 @@ def test_run_session():
             assert value >= 0
 
 
+def test_run_parallel_session():
+    config = site_runner.parse_config(CONFIG_DATA_FILE)
+    config["num_games"] = 5
+    config["num_workers"] = 2
+    scores = site_runner.start_session(config, save=False, game_delay=0)
+    assert len(scores) == 5
+
+    for score in scores:
+        assert len(score) == len(config["players"])
+
+
+def test_parallel_session_without_games():
+    config = site_runner.parse_config(CONFIG_DATA_FILE)
+    assert site_runner.run_parallel_session(config, (), num_games=0, num_workers=2) == []
+
+
+def test_parallel_session_queue_prefix():
+    config = site_runner.parse_config(CONFIG_DATA_FILE)
+    config["players"][0]["queue_prefix"] = "test_pool"
+    with pytest.raises(ValueError):
+        site_runner.run_parallel_session(config, (), num_games=2, num_workers=2)
+
+
+def test_overrides_merge_memories():
+    class MergingAgent(BasicAgent):
+        def merge_memories(self, memories):
+            return memories
+
+    assert not site_runner.overrides_merge_memories(BasicAgent())
+    assert site_runner.overrides_merge_memories(MergingAgent())
+    dynamic_agent = DynamicAgent(owner="test_owner", name="test_agent", agent_id="test_id",
+                                 class_name="BasicAgent",
+                                 local_path="battleground.games.basic_game.basic_agent")
+    assert not site_runner.overrides_merge_memories(dynamic_agent)
+
+
 if __name__ == "__main__":
     test_json()
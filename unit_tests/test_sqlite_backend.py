@@ -0,0 +1,149 @@
+import pytest
+import sqlite3
+import threading
+
+from battleground.persistence import storage
+from battleground.persistence.sqlite_backend import SQLiteBackend
+from battleground.games.basic_game.basic_game_engine import BasicGameEngine
+from battleground.games.basic_game import basic_agent
+from battleground.game_runner import GameRunner
+
+owner, name, game_type = "test_owner", "test_name", "test_game_type"
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """temporary database for testing"""
+    backend = SQLiteBackend(str(tmp_path / "test.db"))
+    storage.set_backend(backend)
+    yield backend
+    storage.set_backend(None)
+    backend.close()
+
+
+def test_list_games(backend):
+    game_ids = [backend.save_game_history("test_game" if i % 2 else "other_game", [{}])
+                for i in range(25)]
+
+    listed = []
+    games, after = backend.list_games(limit=10)
+    while after is not None:
+        assert len(games) == 10
+        listed.extend(games)
+        games, after = backend.list_games(after=after, limit=10)
+    listed.extend(games)
+    assert [game["_id"] for game in listed] == game_ids[::-1]
+
+    games, after = backend.list_games(game_type="test_game", limit=100)
+    assert after is None
+    assert len(games) == 12
+    assert set(games[0].keys()) == {"_id", "game_type", "created_at", "utc_time", "num_states"}
+
+    games, _ = backend.list_games(since=listed[5]["created_at"], until=listed[2]["created_at"])
+    assert [game["_id"] for game in games] == [game["_id"] for game in listed[3:6]]
+
+
+def test_agent_id(backend):
+    agent_id = backend.get_agent_id(owner, name, game_type)
+    assert len(str(agent_id)) == 24
+    assert backend.get_agent_id(owner, name, game_type) == agent_id
+    assert backend.get_agent_id(owner, "other_name", game_type) != agent_id
+    assert backend.get_owners() == {owner}
+
+
+def test_agent_data(backend):
+    agent_id = backend.get_agent_id(owner, name, game_type)
+    assert backend.load_agent_data(agent_id, "memory") is None
+
+    backend.save_agent_data(agent_id, {"guess": [1, 2]}, "memory")
+    backend.save_agent_data(str(agent_id), {"guess": 3}, "memory")
+    assert backend.load_agent_data(agent_id, "memory") == {"guess": 3}
+
+    agents = backend.get_agents(owner)
+    assert len(agents) == 1
+    assert agents[0]["memory"] == {"guess": 3}
+
+    # nothing stored yet
+    backend.patch_agent_data(agent_id, "notes", {"a": 1}, ["b"])
+    assert backend.load_agent_data(agent_id, "notes") == {"a": 1}
+    backend.patch_agent_data(agent_id, "notes", {"b": 2}, ["a"])
+    assert backend.load_agent_data(agent_id, "notes") == {"b": 2}
+
+
+def test_game_history(backend):
+    test_states = [{"game_state": {"k_a": i}, "last_move": {"k_move": i}}
+                   for i in range(30)]
+    game_id = backend.save_game_history("test_game", test_states)
+
+    loaded_states = backend.load_game_history(game_id)
+    assert len(loaded_states) == 30
+    for i, state in enumerate(test_states):
+        assert loaded_states[i]["sequence"] == i
+        assert loaded_states[i]["game_state"] == state["game_state"]
+
+    states = list(backend.iter_game_history(str(game_id), start=10, stop=20,
+                                            fields=["game_state"], batch_size=3))
+    assert [state["game_state"]["k_a"] for state in states] == list(range(10, 20))
+    assert "last_move" not in states[0]
+
+    games = backend.get_games_list("test_game")
+    assert len(games) == 1
+    assert games[0]["_id"] == game_id
+    assert games[0]["num_states"] == 30
+
+
+def test_game_results(backend):
+    agent_id = backend.get_agent_id(owner, name, game_type)
+    other_id = backend.get_agent_id(owner, "other_name", [game_type, "other_type"])
+    backend.save_game_results([(agent_id, "game_1", game_type, 10, True),
+                               (other_id, "game_1", game_type, 4, False),
+                               (agent_id, "game_2", game_type, 20, False)])
+
+    agent = [a for a in backend.get_agents(owner) if a["_id"] == agent_id][0]
+    assert agent["results"] == {"num_games": 2, "avg_score": 15, "num_wins": 1}
+
+    stats = backend.load_game_results(game_type)
+    assert stats == [(owner, name, 0.5), (owner, "other_name", 0.0)]
+
+    leaderboard = backend.get_leaderboard(game_type, sort_by="avg_score", limit=1)
+    assert len(leaderboard) == 1
+    assert leaderboard[0]["agent_id"] == agent_id
+    assert leaderboard[0]["avg_score"] == 15
+    assert leaderboard[0]["num_games"] == 2
+
+    with pytest.raises(Exception):
+        backend.save_game_results([("5a0000000000000000000000", "game_3", game_type, 1, True)])
+
+    backend.delete_agent(agent_id)
+    assert [agent["_id"] for agent in backend.get_agents(owner)] == [other_id]
+    assert backend.load_game_results(game_type) == [(owner, "other_name", 0.0)]
+
+
+def test_game_runner(backend):
+    players = [(str(backend.get_agent_id(owner, str(i), "bg")), basic_agent.BasicAgent())
+               for i in range(3)]
+    engine = BasicGameEngine(num_players=3, type="bg")
+    runner = GameRunner(engine, players, save=True)
+    runner.run_game()
+
+    games = backend.get_games_list()
+    assert len(games) == 1
+    assert len(backend.load_game_history(games[0]["_id"])) == engine.turn + 1
+    assert len(backend.load_game_results("bg")) == 3
+
+
+def test_close_all_threads(backend):
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(backend.get_connection()))
+    thread.start()
+    thread.join()
+    connections.append(backend.get_connection())
+
+    backend.close()
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1")
+
+    # the backend opens a new connection after close
+    assert backend.get_connection() is not connections[-1]
+    assert backend.list_games() == ([], None)
@@ -0,0 +1,104 @@
+from battleground import state_recorder
+from battleground.state_recorder import DeltaRecorder
+from battleground.game_runner import GameRunner
+from battleground.games.arena.arena_game import ArenaGameEngine
+from battleground.games.arena.arena_agent import ArenaAgent
+from battleground.games.basic_game.basic_game_engine import BasicGameEngine
+from battleground.games.basic_game import basic_agent
+from battleground.games.bunnies import dice_game, simple_agent
+import copy
+
+
+def test_diff_patch():
+    old = {"a": 1, "b": [1, 2, 3], "c": {"d": (1, 2)}, "e": "x"}
+    new = {"a": 2, "b": [0, 1, 2, 3, 4], "c": {"d": (1, 3), "f": None}}
+    changes = state_recorder.diff(old, new)
+    patched = state_recorder.patch(copy.deepcopy(old), changes)
+    assert patched == new
+
+    # applying changes must not modify them
+    assert state_recorder.patch(copy.deepcopy(old), changes) == new
+    assert state_recorder.diff(new, new) == []
+
+
+def record_game(engine, agent_class, keyframe_interval):
+    recorder = DeltaRecorder(keyframe_interval=keyframe_interval)
+    expected = []
+    agent = agent_class()
+    turn = 0
+    while not engine.game_over() and turn < 500:
+        state = engine.get_state()
+        recorder.append({"game_state": state, "last_move": None})
+        expected.append(copy.deepcopy(state))
+        engine.move(agent.move(engine.get_state(engine.get_current_player())))
+        turn += 1
+    return recorder, expected
+
+
+def test_delta_recorder():
+    engines = [(BasicGameEngine(num_players=3, type="bg"), basic_agent.BasicAgent),
+               (dice_game.DiceGame(num_players=2, type="Bunnies"), simple_agent.SimpleAgent),
+               (ArenaGameEngine(num_players=4), ArenaAgent)]
+    for engine, agent_class in engines:
+        recorder, expected = record_game(engine, agent_class, keyframe_interval=7)
+        assert len(recorder) == len(expected)
+        for i, state in enumerate(expected):
+            assert recorder.get_state(i) == state
+        for record, state in zip(recorder, expected):
+            assert record["game_state"] == state
+            assert record["last_move"] is None
+        assert recorder[-1]["game_state"] == expected[-1]
+
+
+def test_game_delta():
+    players = []
+    for i in range(3):
+        players.append((i, basic_agent.BasicAgent()))
+    engine = BasicGameEngine(num_players=3, type="bg")
+    runner = GameRunner(engine, players, save=False, delta=True, keyframe_interval=10)
+    scores = runner.run_game()
+    assert len(scores) == 3
+    assert runner.game_states[-1]["game_state"]["scores"] == scores
+
+    for i, state in enumerate(runner.game_states):
+        for key in ["game_state", "player_ids", "last_move"]:
+            assert key in state
+        if i == 0:
+            assert state["last_move"] is None
+        else:
+            assert isinstance(state["last_move"], dict)
+
+
+class KeepingAgent(basic_agent.BasicAgent):
+    def observe(self, state):
+        self.observed = state
+
+
+def test_observers_share_delta_copy():
+    players = [(i, KeepingAgent()) for i in range(3)]
+    runner = GameRunner(BasicGameEngine(num_players=3, type="bg"), players,
+                        save=False, delta=True)
+    runner.run_game()
+    # observers get the copy the recorder holds, no extra copy per move
+    assert players[0][1].observed is runner.game_states.last_state
+    assert runner.game_states.last_state == runner.game_states[-1]["game_state"]
+
+
+class VandalAgent(basic_agent.BasicAgent):
+    def move(self, state):
+        state["scores"][:] = [1000] * len(state["scores"])
+        return super().move(state)
+
+    def observe(self, state):
+        # must not change the engine's state
+        state["scores"][:] = [1000] * len(state["scores"])
+
+
+def test_isolated_agents():
+    for options in [{"delta": True}, {"recording": "final"}, {"recording": "none"}]:
+        players = [(i, VandalAgent()) for i in range(3)]
+        engine = BasicGameEngine(num_players=3, type="bg")
+        runner = GameRunner(engine, players, save=False, isolate_agents=True, **options)
+        scores = runner.run_game()
+        assert 100 <= max(scores) < 1000
+        assert scores == engine.scores
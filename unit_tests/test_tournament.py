@@ -0,0 +1,85 @@
+import time
+from multiprocessing.pool import ThreadPool
+
+from battleground import tournament
+
+
+def get_players(number):
+    return [{"owner": "test_owner", "name": "player_{}".format(i)} for i in range(number)]
+
+
+def test_round_robin():
+    players = get_players(5)
+    matches = tournament.round_robin_pairings(players)
+    assert len(matches) == 10
+    pairs = set(frozenset(tournament.player_key(p) for p in match) for match in matches)
+    assert len(pairs) == 10
+
+    matches = tournament.round_robin_pairings(players, players_per_game=3)
+    assert len(matches) == 10
+    assert all(len(match) == 3 for match in matches)
+
+
+def test_swiss():
+    players = get_players(7)
+    t = tournament.Tournament(game_spec={}, players=players)
+
+    for _ in range(3):
+        matches, byes = tournament.swiss_pairings(players, t.points, t.played)
+        assert len(matches) == 3
+        assert len(byes) == 1
+        keys = [tournament.player_key(p) for match in matches for p in match]
+        assert len(set(keys)) == 6
+        for match in matches:
+            # nobody meets the same player twice in the first rounds
+            assert frozenset(tournament.player_key(p) for p in match) not in t.played
+        for match in matches:
+            t.record_match(match, [[10, 5]])
+
+    standings = t.get_standings()
+    assert len(standings) == 7
+    points = [s[2] for s in standings]
+    assert points == sorted(points, reverse=True)
+    assert sum(points) == 9
+
+
+def test_swiss_byes():
+    players = get_players(5)
+    t = tournament.Tournament(game_spec={}, players=players)
+    bye_keys = []
+    for _ in range(5):
+        matches, byes = tournament.swiss_pairings(players, t.points, t.played,
+                                                  had_bye=t.had_bye)
+        assert len(byes) == 1
+        bye_keys.append(tournament.player_key(byes[0]))
+        t.had_bye.add(bye_keys[-1])
+        for match in matches:
+            t.record_match(match, [[10, 5]])
+    # everybody gets a bye before anybody gets a second one
+    assert len(set(bye_keys)) == 5
+
+
+def test_play_round(monkeypatch):
+    active = set()
+    overlaps = []
+
+    def play_match(task):
+        match_index, config, _ = task
+        keys = [tournament.player_key(p) for p in config["players"]]
+        if active & set(keys):
+            overlaps.append(keys)
+        active.update(keys)
+        time.sleep(0.01)
+        active.difference_update(keys)
+        return match_index, [[2, 1]]
+
+    monkeypatch.setattr(tournament, "_play_match", play_match)
+    players = get_players(6)
+    t = tournament.Tournament(game_spec={}, players=players)
+    matches = tournament.round_robin_pairings(players)
+    with ThreadPool(4) as pool:
+        t.play_round(matches, pool)
+
+    # matches that share a player are not played at the same time
+    assert not overlaps
+    assert sum(num_games for num_games in t.num_games.values()) == 2 * len(matches)
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+from battleground import site_runner
+from battleground.persistence import storage
+from battleground.persistence.sqlite_backend import SQLiteBackend
+from battleground.utils import start
+from battleground.warm_pool import WarmPool
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """temporary database for testing"""
+    backend = SQLiteBackend(str(tmp_path / "test.db"))
+    storage.set_backend(backend)
+    yield backend
+    storage.set_backend(None)
+    backend.close()
+
+
+def test_warm_pool_sessions(backend):
+    config = start.generate_dynamic_config(game_delay=None, game_name="Basic Game 50",
+                                           players=site_runner.parse_config(
+                                               "battleground/config/basic_config.json")["players"])
+    config["num_games"] = 1
+    pool = WarmPool()
+
+    site_runner.start_session(config, pool=pool)
+    assert pool.num_created == 4 and pool.num_reused == 0
+    agents = pool.get_agents(config["players"], config["game"]["type"])
+    pool.release(agents)
+
+    site_runner.start_session(config, pool=pool)
+    assert pool.num_created == 4 and pool.num_reused == 7
+    # the same agent objects are handed out again
+    assert pool.get_agents(config["players"], config["game"]["type"])[0][1] is agents[0][1]
+
+
+def test_warm_pool_code_change(backend):
+    with open("battleground/games/basic_game/basic_agent.py", 'r') as file:
+        code = file.read()
+    backend.save_agent_code("test_owner", "test_agent", "test_game", code)
+    player = {"owner": "test_owner", "name": "test_agent", "class_name": "BasicAgent",
+              "from_db": True}
+    pool = WarmPool(max_idle_time=10, code_check_interval=0)
+
+    agents = pool.get_agents([player], "test_game")
+    pool.release(agents)
+    assert pool.get_agents([player], "test_game")[0][1] is agents[0][1]
+    pool.release(agents)
+
+    # changed code builds a new agent, the old one is evicted once idle
+    backend.save_agent_code("test_owner", "test_agent", "test_game", code + "\n")
+    new_agents = pool.get_agents([player], "test_game")
+    assert new_agents[0][1] is not agents[0][1]
+    pool.release(new_agents)
+    assert pool.evict() == 0
+    assert pool.evict(now=time.monotonic() + 11) == 2
+    assert not pool.idle_agents
+
+
+def test_warm_pool_code_hash_cache(backend, monkeypatch):
+    backend.save_agent_code("test_owner", "test_agent", "test_game", "code")
+    player = {"owner": "test_owner", "name": "test_agent", "from_db": True}
+    pool = WarmPool()
+    agent_id = pool.get_agent_id("test_owner", "test_agent", "test_game")
+    key = pool.get_agent_key(agent_id, player)
+
+    loaded = []
+    load_agent_data = backend.load_agent_data
+    monkeypatch.setattr(backend, "load_agent_data",
+                        lambda *args: loaded.append(args) or load_agent_data(*args))
+    assert pool.get_agent_key(agent_id, player) == key
+    assert not loaded
+
+    pool.code_check_interval = 0
+    assert pool.get_agent_key(agent_id, player) == key
+    assert len(loaded) == 1
+
+
+def test_warm_pool_evict_closes_agents(backend):
+    player = {"owner": "test_owner", "name": "test_agent", "class_name": "BasicAgent",
+              "local_path": "battleground.games.basic_game.basic_agent"}
+    pool = WarmPool(max_idle_time=10)
+    agents = pool.get_agents([player], "test_game")
+    closed = []
+    agents[0][1].close = lambda: closed.append(agents[0][1])
+    pool.release(agents)
+
+    assert pool.evict(now=time.monotonic() + 11) == 1
+    assert closed == [agents[0][1]]
+
+
+def test_warm_pool_failed_session(backend, monkeypatch):
+    config = start.generate_dynamic_config(game_delay=None, game_name="Basic Game 50",
+                                           players=site_runner.parse_config(
+                                               "battleground/config/basic_config.json")["players"])
+    config["num_games"] = 1
+    pool = WarmPool()
+
+    def run_session(*args, **kwargs):
+        raise Exception("session failed")
+
+    monkeypatch.setattr(site_runner, "run_session", run_session)
+    with pytest.raises(Exception):
+        site_runner.start_session(config, pool=pool)
+    # nothing of the failed session is kept or reused
+    assert not pool.keys
+    assert not any(pool.idle_agents.values()) and not any(pool.idle_engines.values())
@@ -0,0 +1,53 @@
+import pytest
+
+from battleground.persistence import storage
+from battleground.persistence.sqlite_backend import SQLiteBackend
+from battleground.persistence.writer import BackgroundWriter
+from battleground.games.basic_game.basic_game_engine import BasicGameEngine
+from battleground.games.basic_game import basic_agent
+from battleground.game_runner import GameRunner
+from battleground import site_runner
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """temporary database for testing"""
+    backend = SQLiteBackend(str(tmp_path / "test.db"))
+    yield backend
+    backend.close()
+
+
+def test_background_writer(backend):
+    agent_ids = [str(backend.get_agent_id("test_owner", str(i), "bg")) for i in range(2)]
+    players = [(agent_id, basic_agent.BasicAgent()) for agent_id in agent_ids]
+    engine = BasicGameEngine(num_players=2, type="bg")
+
+    with BackgroundWriter(backend, max_queue_size=2, batch_size=3) as writer:
+        site_runner.play_games(engine, players, 10, writer=writer)
+        memory = {"guess": 1}
+        writer.save_agent_data(agent_ids[0], memory, "memory")
+        memory["guess"] = 2
+
+    assert len(backend.get_games_list()) == 10
+    assert backend.load_agent_data(agent_ids[0], "memory") == {"guess": 1}
+    agents = backend.get_agents("test_owner")
+    assert sum(agent["results"]["num_games"] for agent in agents) == 20
+
+
+def test_writer_error(backend):
+    players = [("5a0000000000000000000000", basic_agent.BasicAgent())]
+    writer = BackgroundWriter(backend)
+    runner = GameRunner(BasicGameEngine(num_players=1, type="bg"), players, writer=writer)
+    assert runner.run_game() is not None
+    with pytest.raises(Exception):
+        writer.flush()
+    writer.close()
+
+
+def test_writer_without_backend(monkeypatch):
+    def get_backend():
+        raise Exception("no database")
+
+    monkeypatch.setattr(storage, "get_backend", get_backend)
+    with pytest.raises(Exception):
+        BackgroundWriter()